@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark de generación de tickets ESC/POS (EscPosTicketGenerator.generar_ticket)
+Mide microsegundos por ticket para ventas de 1, 10 y 50 productos en cada ancho de papel.
+La configuración del negocio es fija: no usa la base de datos.
+
+Uso: python benchmarks/bench_escpos.py [--segundos 1] [--lineas 1,10,50] [--barras]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_tickets import venta_de_prueba  # noqa: E402
+from utils.escpos_generator import COLUMNAS_SOPORTADAS, EscPosTicketGenerator  # noqa: E402
+
+CONFIGURACION = {
+    'nombre_negocio': 'Mi Chas-K',
+    'direccion': 'Aguascalientes, Ags.',
+    'telefono': '449 123 4567',
+    'mensaje_ticket': '¡Gracias por tu compra!'
+}
+
+
+class GeneradorSinBD(EscPosTicketGenerator):
+    def get_configuracion(self, clave: str, default: str = "") -> str:
+        return CONFIGURACION.get(clave, default)
+
+
+def medir(generator: EscPosTicketGenerator, lineas: int, segundos: float, barras: bool) -> float:
+    """Microsegundos por ticket generando la misma venta durante `segundos`"""
+    venta_data, detalle_rows = venta_de_prueba(lineas)
+    generator.generar_ticket(venta_data, detalle_rows, codigo_barras=barras)  # calentamiento
+    generados = 0
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < segundos:
+        generator.generar_ticket(venta_data, detalle_rows, codigo_barras=barras)
+        generados += 1
+    return (time.perf_counter() - inicio) / generados * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de tickets ESC/POS')
+    parser.add_argument('--segundos', type=float, default=1.0, help='duración de cada medición')
+    parser.add_argument('--lineas', default='1,10,50', help='productos por venta, separados por coma')
+    parser.add_argument('--barras', action='store_true', help='incluir código de barras')
+    args = parser.parse_args()
+
+    print(f"🧾 Tickets ESC/POS ({args.segundos:g}s por caso, pid {os.getpid()})")
+    for columnas in COLUMNAS_SOPORTADAS:
+        generator = GeneradorSinBD(columnas=columnas)
+        for lineas in (int(n) for n in args.lineas.split(',')):
+            us = medir(generator, lineas, args.segundos, args.barras)
+            print(f"   {columnas} col, {lineas:>3} líneas: {us:8.1f} µs/ticket  ({1_000_000 / us:8.0f} tickets/s)")
+
+
+if __name__ == '__main__':
+    main()
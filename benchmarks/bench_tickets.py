@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark de generación de tickets PDF (TicketGenerator.generar_ticket_memoria)
+Mide tickets/segundo para ventas de 1, 10 y 50 productos, sin pasar por la cache de tickets.
+Compara contra la línea base previa a cachear estilos y partes fijas: estilos, TableStyle y
+encabezado/pie reconstruidos en cada ticket, como hacía TicketGenerator antes.
+
+Uso: python benchmarks/bench_tickets.py [--segundos 3] [--lineas 1,10,50] [--sin-base]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportlab.platypus import TableStyle  # noqa: E402
+
+from utils import pdf_generator  # noqa: E402
+from utils.pdf_generator import TicketGenerator  # noqa: E402
+
+
+def venta_de_prueba(lineas: int):
+    """venta_data y detalle_rows sintéticos con `lineas` productos"""
+    detalle_rows = [
+        {
+            'producto_nombre': f'Chasca especial #{i} con queso añejo',
+            'cantidad': (i % 3) + 1,
+            'precio_unitario': 45.0 + i,
+            'subtotal': ((i % 3) + 1) * (45.0 + i)
+        }
+        for i in range(lineas)
+    ]
+    venta_data = {
+        'id': 1000 + lineas,
+        'fecha': '2026-01-15 13:45:00',
+        'metodo_pago': 'Efectivo',
+        'notas': 'Vendedor: María | Para llevar',
+        'total': sum(d['subtotal'] for d in detalle_rows)
+    }
+    return venta_data, detalle_rows
+
+
+TABLA_TICKET_STYLE = pdf_generator.TABLA_TICKET_STYLE
+
+
+def sin_cache_de_estilos():
+    """Línea base: tira los estilos y partes fijas cacheados, como si cada ticket los creara de nuevo"""
+    pdf_generator._estilos_ticket.cache_clear()
+    pdf_generator._flowables_fijos.cache_clear()
+    pdf_generator.TABLA_TICKET_STYLE = TableStyle(TABLA_TICKET_STYLE.getCommands())
+
+
+def medir(generator: TicketGenerator, lineas: int, segundos: float, base: bool = False) -> float:
+    """Tickets por segundo generando la misma venta durante `segundos`"""
+    venta_data, detalle_rows = venta_de_prueba(lineas)
+    generator.generar_ticket_memoria(venta_data, detalle_rows)  # calentamiento
+    generados = 0
+    inicio = time.perf_counter()
+    try:
+        while time.perf_counter() - inicio < segundos:
+            if base:
+                sin_cache_de_estilos()
+            generator.generar_ticket_memoria(venta_data, detalle_rows)
+            generados += 1
+    finally:
+        pdf_generator.TABLA_TICKET_STYLE = TABLA_TICKET_STYLE
+    return generados / (time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de tickets PDF')
+    parser.add_argument('--segundos', type=float, default=3.0, help='duración de cada medición')
+    parser.add_argument('--lineas', default='1,10,50', help='productos por venta, separados por coma')
+    parser.add_argument('--sin-base', action='store_true', help='medir solo el código actual')
+    args = parser.parse_args()
+
+    generator = TicketGenerator()
+    print(f"🧾 Tickets PDF por segundo ({args.segundos:.0f}s por caso, pid {os.getpid()})")
+    for lineas in (int(n) for n in args.lineas.split(',')):
+        tps = medir(generator, lineas, args.segundos)
+        linea = f"   {lineas:>3} líneas: {tps:8.1f} tickets/s  ({1000 / tps:6.2f} ms/ticket)"
+        if not args.sin_base:
+            tps_base = medir(generator, lineas, args.segundos, base=True)
+            linea += f", base {tps_base:8.1f} tickets/s (x{tps / tps_base:.2f})"
+        print(linea)
+
+
+if __name__ == '__main__':
+    main()
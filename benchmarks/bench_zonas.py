@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark de búsqueda de zonas de entrega (database.zonas_entrega)
+Compara el índice (R-tree STR + punto-en-polígono) contra recorrer todas las zonas,
+con polígonos irregulares sintéticos alrededor del negocio. No usa la base de datos.
+
+Uso: python benchmarks/bench_zonas.py [--zonas 100,1000,5000] [--puntos 5000] [--vertices 16]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.zonas_entrega import ZonaEntrega, _IndiceZonas  # noqa: E402
+from utils.geo import punto_en_poligono  # noqa: E402
+
+CENTRO = (21.8853, -102.2916)
+RADIO_GRADOS = 0.1  # ~11 km
+
+
+def zonas_de_prueba(n: int, vertices: int, rng: random.Random):
+    """Polígonos estrellados (irregulares, no convexos) repartidos en una cuadrícula"""
+    lado = math.ceil(math.sqrt(n))
+    celda = 2 * RADIO_GRADOS / lado
+    zonas = []
+    for i in range(n):
+        centro_lat = CENTRO[0] - RADIO_GRADOS + (i // lado + 0.5) * celda
+        centro_lng = CENTRO[1] - RADIO_GRADOS + (i % lado + 0.5) * celda
+        poligono = []
+        for k in range(vertices):
+            angulo = 2 * math.pi * k / vertices
+            radio = celda * rng.uniform(0.3, 0.75)  # se enciman un poco con las vecinas
+            poligono.append((centro_lat + radio * math.sin(angulo), centro_lng + radio * math.cos(angulo)))
+        zonas.append(ZonaEntrega(id=i + 1, nombre=f'Zona {i + 1}', poligono=poligono,
+                                 tarifa=float(20 + i % 5 * 10), prioridad=i % 3))
+    return zonas
+
+
+def puntos_de_prueba(n: int, rng: random.Random):
+    return [(CENTRO[0] + rng.uniform(-RADIO_GRADOS, RADIO_GRADOS),
+             CENTRO[1] + rng.uniform(-RADIO_GRADOS, RADIO_GRADOS)) for _ in range(n)]
+
+
+def lineal(zonas, lat, lng):
+    """Referencia: probar el punto contra todas las zonas"""
+    encontradas = [zona for zona in zonas if punto_en_poligono(lat, lng, zona.poligono)]
+    encontradas.sort(key=lambda zona: (-zona.prioridad, not zona.excluida, zona.id))
+    return encontradas
+
+
+def medir(funcion, puntos) -> float:
+    """Microsegundos por punto"""
+    inicio = time.perf_counter()
+    for lat, lng in puntos:
+        funcion(lat, lng)
+    return (time.perf_counter() - inicio) / len(puntos) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de zonas de entrega')
+    parser.add_argument('--zonas', default='100,1000,5000', help='número de zonas, separados por coma')
+    parser.add_argument('--puntos', type=int, default=5000, help='puntos a ubicar por caso')
+    parser.add_argument('--vertices', type=int, default=16, help='vértices por polígono')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    puntos = puntos_de_prueba(args.puntos, rng)
+    print(f"🗺️ Zonas de entrega: {args.puntos} puntos, polígonos de {args.vertices} vértices")
+    for n in (int(x) for x in args.zonas.split(',')):
+        zonas = zonas_de_prueba(n, args.vertices, rng)
+        inicio = time.perf_counter()
+        indice = _IndiceZonas(zonas)
+        construccion = (time.perf_counter() - inicio) * 1000
+
+        # Mismo resultado que la búsqueda lineal
+        for lat, lng in puntos[:200]:
+            assert [z.id for z in indice.zonas_en(lat, lng)] == [z.id for z in lineal(zonas, lat, lng)]
+
+        cubiertos = sum(1 for lat, lng in puntos if indice.zonas_en(lat, lng))
+        us_indice = medir(indice.zonas_en, puntos)
+        us_lineal = medir(lambda lat, lng: lineal(zonas, lat, lng), puntos[:max(50, args.puntos // max(1, n // 100))])
+        print(f"   {n:>6} zonas: índice {us_indice:7.1f} µs/punto, lineal {us_lineal:9.1f} µs/punto "
+              f"(x{us_lineal / us_indice:,.0f}); R-tree de altura {indice.rtree.altura}, "
+              f"construido en {construccion:.0f} ms; {cubiertos / len(puntos):.0%} de puntos cubiertos")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Contadores de versión para invalidar caches en memoria entre workers de gunicorn
+Cada cache guarda la versión con la que se cargó; si la fila cambió, se recarga
+"""
+from typing import Dict, Optional
+import logging
+from database.connection_dual import execute_query, execute_update, en_transaccion, Transaction
+
+logger = logging.getLogger(__name__)
+
+# Claves conocidas
+CATALOGO = 'catalogo'
+CONFIGURACION = 'configuracion'
+ZONAS_ENTREGA = 'zonas_entrega'
+
+CREAR_TABLA = """
+    CREATE TABLE IF NOT EXISTS cache_versiones (
+        clave VARCHAR(50) PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+_schema_state = {'ready': False}
+
+
+def _asegurar_tabla():
+    """Crea la tabla de versiones si no existe (una vez por proceso)"""
+    if _schema_state['ready']:
+        return
+    execute_update(CREAR_TABLA)
+    # Dentro de una transacción el CREATE puede revertirse: volver a verificar la próxima vez
+    _schema_state['ready'] = not en_transaccion()
+
+
+def get_version(clave: str) -> int:
+    """Versión actual de una clave (0 si nunca se ha invalidado)"""
+    _asegurar_tabla()
+    rows = execute_query("SELECT version FROM cache_versiones WHERE clave = %s", (clave,))
+    return int(rows[0]['version']) if rows else 0
+
+
+def get_versiones() -> Dict[str, int]:
+    """Todas las versiones en una sola consulta"""
+    _asegurar_tabla()
+    rows = execute_query("SELECT clave, version FROM cache_versiones")
+    return {row['clave']: int(row['version']) for row in rows}
+
+
+def incrementar_version(clave: str, tx: Optional[Transaction] = None):
+    """
+    Invalida una clave en todos los workers incrementando su versión.
+    Con `tx` todo (incluida la creación de la tabla) va por la conexión de la
+    transacción, que puede no ser la de connection_dual (p. ej. el adaptador directo).
+    """
+    query = """
+        INSERT INTO cache_versiones (clave, version) VALUES (%s, 1)
+        ON CONFLICT (clave) DO UPDATE SET version = cache_versiones.version + 1
+    """
+    if tx is not None:
+        if not _schema_state['ready']:
+            tx.execute_update(CREAR_TABLA)
+        tx.execute_update(query, (clave,))
+    else:
+        _asegurar_tabla()
+        execute_update(query, (clave,))
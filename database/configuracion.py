@@ -0,0 +1,99 @@
+"""
+Servicio de configuración del negocio (tabla configuracion)
+Carga la tabla completa en un dict por proceso y la recarga cuando:
+- vence el TTL (CONFIGURACION_CACHE_TTL), o
+- otro proceso la invalidó (fila 'configuracion' de cache_versiones)
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional
+import logging
+from database.connection_dual import execute_query, Transaction
+from database import cache_versiones
+
+logger = logging.getLogger(__name__)
+
+CONFIGURACION_CACHE_TTL = float(os.getenv('CONFIGURACION_CACHE_TTL', '300'))  # segundos
+CONFIGURACION_VERIFICAR_CADA = float(os.getenv('CONFIGURACION_VERIFICAR_CADA', '5'))  # segundos
+
+_cache = {
+    'valores': None,        # clave -> valor
+    'version': None,        # versión de cache_versiones con la que se cargó
+    'cargado_en': 0.0,
+    'verificado_en': 0.0,
+    'hits': 0,
+    'misses': 0,
+    'lock': threading.Lock()
+}
+
+
+def _cargar() -> Dict[str, Optional[str]]:
+    try:
+        rows = execute_query("SELECT clave, valor FROM configuracion")
+    except Exception as e:
+        # Sin tabla (p. ej. SQLite de desarrollo): se usan los valores por defecto
+        logger.warning(f"⚠️ No se pudo leer la tabla configuracion: {e}")
+        return {}
+    return {row['clave']: row['valor'] for row in rows}
+
+
+def _version() -> Optional[int]:
+    try:
+        return cache_versiones.get_version(cache_versiones.CONFIGURACION)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer la versión de configuración: {e}")
+        return None
+
+
+def get_todas() -> Dict[str, Optional[str]]:
+    """Toda la configuración (copia), desde la cache si está vigente"""
+    ahora = time.monotonic()
+    valores = _cache['valores']
+
+    if valores is not None and ahora - _cache['cargado_en'] < CONFIGURACION_CACHE_TTL:
+        if ahora - _cache['verificado_en'] < CONFIGURACION_VERIFICAR_CADA:
+            _cache['hits'] += 1
+            return dict(valores)
+        version = _version()
+        if version is not None and version == _cache['version']:
+            _cache['verificado_en'] = ahora
+            _cache['hits'] += 1
+            return dict(valores)
+    else:
+        version = _version()
+
+    with _cache['lock']:
+        _cache['misses'] += 1
+        valores = _cargar()
+        _cache['valores'] = valores
+        _cache['version'] = version
+        _cache['cargado_en'] = _cache['verificado_en'] = time.monotonic()
+    return dict(valores)
+
+
+def get(clave: str, default: Optional[str] = "") -> Optional[str]:
+    """Valor de una clave de configuración"""
+    return get_todas().get(clave, default)
+
+
+def invalidar(tx: Optional[Transaction] = None):
+    """Descarta la configuración en este proceso y, vía cache_versiones, en los demás"""
+    with _cache['lock']:
+        _cache['valores'] = None
+        _cache['version'] = None
+    try:
+        cache_versiones.incrementar_version(cache_versiones.CONFIGURACION, tx)
+    except Exception as e:
+        if tx is not None:
+            raise
+        logger.warning(f"⚠️ No se pudo propagar la invalidación de configuración: {e}")
+
+
+def get_cache_stats() -> Dict[str, int]:
+    """Aciertos y fallos de la cache de configuración en este proceso"""
+    return {
+        'hits': _cache['hits'],
+        'misses': _cache['misses'],
+        'version': _cache['version'] or 0
+    }
@@ -4,16 +4,44 @@ Sistema de punto de venta MiChaska - Versión Simplificada
 """
 import os
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import logging
 from datetime import datetime
 from decimal import Decimal
 from typing import Dict, Any, List, Optional, Union
 from dotenv import load_dotenv
+from database import cache_versiones, resumen_ventas
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Tablas cuyo cambio invalida el catálogo en memoria de los workers de Flask (models._catalogo_cache)
+TABLAS_CATALOGO = ('productos',)
+
+class _TransaccionDirecta:
+    """
+    Interfaz mínima de connection_dual.Transaction sobre un cursor de este adaptador,
+    para escribir el resumen diario y la versión del catálogo en la misma transacción
+    que la venta
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute_update(self, query: str, params: tuple = ()) -> int:
+        self.cursor.execute(query, params)
+        return self.cursor.rowcount
+
+    def execute_values(self, query: str, rows: List[tuple], template: Optional[str] = None,
+                       page_size: Optional[int] = None, returning: bool = False):
+        rows = list(rows)
+        if not rows:
+            return [] if returning else 0
+        result = execute_values(self.cursor, query, rows, template=template,
+                                page_size=page_size or 100, fetch=returning)
+        return [row['id'] for row in result] if returning else len(rows)
+
+
 class DirectPostgreSQLAdapter:
     """Adaptador directo a PostgreSQL sin lógica híbrida"""
     
@@ -132,6 +160,11 @@ class DirectPostgreSQLAdapter:
             logger.error(f"   Params: {params}")
             return []
     
+    def _invalidar_catalogo(self, cursor, table_name: str):
+        """Incrementa la versión del catálogo en la misma transacción si se escribió en productos"""
+        if table_name in TABLAS_CATALOGO:
+            cache_versiones.incrementar_version(cache_versiones.CATALOGO, _TransaccionDirecta(cursor))
+    
     def execute_insert(self, table_name: str, data: Dict[str, Any]) -> Optional[int]:
         """Ejecutar INSERT directo"""
         try:
@@ -150,9 +183,10 @@ class DirectPostgreSQLAdapter:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(query, values)
+                result = cursor.fetchone()
+                self._invalidar_catalogo(cursor, table_name)
                 conn.commit()
                 
-                result = cursor.fetchone()
                 inserted_id = result['id'] if result else None
                 logger.info(f"✅ INSERT en {table_name}: ID {inserted_id}")
                 return inserted_id
@@ -180,9 +214,10 @@ class DirectPostgreSQLAdapter:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(query, values)
+                updated_rows = cursor.rowcount
+                self._invalidar_catalogo(cursor, table_name)
                 conn.commit()
                 
-                updated_rows = cursor.rowcount
                 logger.info(f"✅ UPDATE en {table_name}: {updated_rows} filas")
                 return updated_rows
                 
@@ -199,9 +234,10 @@ class DirectPostgreSQLAdapter:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(query, where_params)
+                deleted_rows = cursor.rowcount
+                self._invalidar_catalogo(cursor, table_name)
                 conn.commit()
                 
-                deleted_rows = cursor.rowcount
                 logger.info(f"✅ DELETE en {table_name}: {deleted_rows} filas")
                 return deleted_rows
                 
@@ -235,9 +271,10 @@ class DirectPostgreSQLAdapter:
                 venta_placeholders = ['%s'] * len(venta_columns)
                 venta_values = [venta_cleaned[col] for col in venta_columns]
                 
-                venta_query = f"INSERT INTO ventas ({', '.join(venta_columns)}) VALUES ({', '.join(venta_placeholders)}) RETURNING id"
+                venta_query = f"INSERT INTO ventas ({', '.join(venta_columns)}) VALUES ({', '.join(venta_placeholders)}) RETURNING id, fecha"
                 cursor.execute(venta_query, venta_values)
-                venta_id = cursor.fetchone()['id']
+                venta_row = cursor.fetchone()
+                venta_id = venta_row['id']
                 
                 # Insertar detalles
                 for detalle in detalles:
@@ -258,6 +295,16 @@ class DirectPostgreSQLAdapter:
                         (detalle['cantidad'], detalle['producto_id'])
                     )
                 
+                # Resumen diario para estadísticas (misma transacción que la venta)
+                resumen_ventas.registrar_venta(
+                    _TransaccionDirecta(cursor), venta_row['fecha'], venta_cleaned.get('metodo_pago'),
+                    venta_cleaned.get('total', 0),
+                    [(d['producto_id'], d['cantidad'], d.get('subtotal', 0)) for d in detalles]
+                )
+                
+                # El stock cambió: el catálogo en memoria de los workers de Flask se recarga
+                cache_versiones.incrementar_version(cache_versiones.CATALOGO, _TransaccionDirecta(cursor))
+                
                 conn.commit()
                 logger.info(f"✅ Venta creada: ID {venta_id} con {len(detalles)} detalles")
                 return venta_id
@@ -266,51 +313,36 @@ class DirectPostgreSQLAdapter:
             logger.error(f"❌ Error creando venta: {e}")
             return None
     
+    def get_ventas_por_dia(self, fecha_desde: str = None, fecha_hasta: str = None) -> List[Dict[str, Any]]:
+        """Ventas por día y método de pago (días cerrados desde el resumen diario, hoy desde ventas)"""
+        return resumen_ventas.ventas_por_dia(fecha_desde, fecha_hasta, ejecutar=self.execute_query)
+    
     def get_dashboard_data(self, fecha_desde: str = None, fecha_hasta: str = None) -> Dict[str, Any]:
         """Obtener datos para dashboard"""
         try:
-            fecha_filtro = ""
-            params = []
+            # Cada límite se aplica aunque falte el otro
+            filas = self.get_ventas_por_dia(fecha_desde, fecha_hasta)
             
-            if fecha_desde and fecha_hasta:
-                fecha_filtro = "WHERE fecha BETWEEN %s AND %s"
-                params = [fecha_desde, fecha_hasta]
-            elif fecha_desde:
-                fecha_filtro = "WHERE fecha >= %s"
-                params = [fecha_desde]
-            
-            # Ventas totales
-            ventas_query = f"SELECT COUNT(*) as total_ventas, COALESCE(SUM(total), 0) as total_ingresos FROM ventas {fecha_filtro}"
-            ventas_data = self.execute_query(ventas_query, params)
+            # Ventas por día (las filas vienen por día y método de pago)
+            por_dia: Dict[str, Dict[str, Any]] = {}
+            for fila in filas:
+                dia = por_dia.setdefault(fila['dia'], {'dia': fila['dia'], 'ventas': 0, 'ingresos': 0.0})
+                dia['ventas'] += fila['num_ventas']
+                dia['ingresos'] += fila['total']
             
             # Productos más vendidos
-            productos_query = f"""
-                SELECT p.nombre, SUM(dv.cantidad) as cantidad_vendida
-                FROM detalle_ventas dv
-                JOIN productos p ON dv.producto_id = p.id
-                JOIN ventas v ON dv.venta_id = v.id
-                {fecha_filtro}
-                GROUP BY p.id, p.nombre
-                ORDER BY cantidad_vendida DESC
-                LIMIT 10
-            """
-            productos_data = self.execute_query(productos_query, params)
-            
-            # Ventas por día
-            ventas_dia_query = f"""
-                SELECT fecha::date as dia, COUNT(*) as ventas, SUM(total) as ingresos
-                FROM ventas
-                {fecha_filtro}
-                GROUP BY fecha::date
-                ORDER BY dia DESC
-                LIMIT 30
-            """
-            ventas_dia_data = self.execute_query(ventas_dia_query, params)
+            productos_data = resumen_ventas.productos_top(fecha_desde, fecha_hasta, limite=10,
+                                                          ejecutar=self.execute_query)
             
             return {
-                'resumen': ventas_data[0] if ventas_data else {'total_ventas': 0, 'total_ingresos': 0},
-                'productos_top': productos_data,
-                'ventas_por_dia': ventas_dia_data
+                'resumen': {
+                    'total_ventas': sum(fila['num_ventas'] for fila in filas),
+                    'total_ingresos': sum(fila['total'] for fila in filas)
+                },
+                'productos_top': [
+                    {'nombre': p['nombre'], 'cantidad_vendida': p['cantidad_vendida']} for p in productos_data
+                ],
+                'ventas_por_dia': sorted(por_dia.values(), key=lambda d: d['dia'], reverse=True)[:30]
             }
             
         except Exception as e:
@@ -4,12 +4,25 @@ Detecta automáticamente qué base de datos usar según el entorno
 """
 import os
 import sqlite3
+import threading
+import time
+import uuid
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from contextlib import contextmanager
-from typing import Generator, Dict, Any, List, Optional, Union
+from psycopg2.extras import RealDictCursor, execute_batch, execute_values as pg_execute_values
+from psycopg2.pool import PoolError
+from contextlib import contextmanager, nullcontext
+from typing import Generator, Dict, Any, Iterable, List, Optional, Sequence, Union
 import logging
 from dotenv import load_dotenv
+from database import query_stats
+
+try:
+    from flask import g, has_request_context
+except ImportError:  # Streamlit sin Flask instalado
+    g = None
+
+    def has_request_context() -> bool:
+        return False
 
 # Cargar variables de entorno
 load_dotenv()
@@ -32,6 +45,16 @@ DB_CONFIG = {
     'port': int(os.getenv('DB_PORT', '5432'))
 }
 
+# Configuración del pool de conexiones (un pool por worker de gunicorn)
+POOL_CONFIG = {
+    'min_size': int(os.getenv('DB_POOL_MIN', '1')),
+    'max_size': int(os.getenv('DB_POOL_MAX', '5')),
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),  # segundos esperando conexión libre
+    'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),  # segundos sin uso antes de reciclar
+    'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),  # segundos de vida máxima
+    'check_after': float(os.getenv('DB_POOL_CHECK_AFTER', '30'))  # verificar con SELECT 1 si estuvo inactiva más de esto
+}
+
 # Configuración SQLite
 SQLITE_DB_PATH = os.path.join(
     os.path.dirname(__file__), 
@@ -49,38 +72,479 @@ if USE_SQLITE:
     logger.info(f"📂 SQLite: {SQLITE_DB_PATH}")
 
 
+def _new_postgres_connection() -> psycopg2.extensions.connection:
+    """Abre una conexión PostgreSQL nueva (handshake TCP + TLS completo)"""
+    if DATABASE_URL:
+        conn = psycopg2.connect(DATABASE_URL, sslmode='require')
+    else:
+        conn = psycopg2.connect(**DB_CONFIG)
+    conn.autocommit = False
+    return conn
+
+
+class PostgresConnectionPool:
+    """
+    Pool acotado de conexiones PostgreSQL para un proceso.
+    - Bloquea hasta `timeout` segundos cuando todas las conexiones están en uso
+    - Verifica con SELECT 1 las conexiones que llevan tiempo inactivas antes de entregarlas
+    - Recicla conexiones por inactividad (max_idle) y por antigüedad (max_lifetime)
+    """
+
+    def __init__(self, connect_fn, min_size: int = 1, max_size: int = 5, timeout: float = 10,
+                 max_idle: float = 300, max_lifetime: float = 1800, check_after: float = 30):
+        self._connect = connect_fn
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+
+        self._cond = threading.Condition()
+        self._idle = []  # [(conn, ultimo_uso)] - se usa como pila para reutilizar la más reciente
+        self._created_at = {}  # conn -> momento de creación
+        self._pending = 0  # conexiones en proceso de apertura
+        self._in_use = 0
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'health_check_failures': 0
+        }
+
+    @property
+    def size(self) -> int:
+        """Conexiones abiertas (libres + en uso)"""
+        return len(self._created_at) + self._pending
+
+    def _open(self) -> psycopg2.extensions.connection:
+        conn = self._connect()
+        with self._cond:
+            self._created_at[conn] = time.monotonic()
+            self._stats['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        """Cierra una conexión y la saca del pool (llamar sin el lock)"""
+        with self._cond:
+            self._created_at.pop(conn, None)
+            self._cond.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_expired(self, conn, last_used: float, now: float) -> bool:
+        created = self._created_at.get(conn, now)
+        return (now - last_used) > self.max_idle or (now - created) > self.max_lifetime
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self) -> psycopg2.extensions.connection:
+        """Obtiene una conexión del pool (health-checked)"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        while True:
+            candidate = None
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise PoolError("El pool de conexiones está cerrado")
+
+                while not self._idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolError(
+                            f"Tiempo de espera agotado ({self.timeout}s) esperando conexión del pool "
+                            f"({self._in_use}/{self.max_size} en uso)"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    candidate, last_used = self._idle.pop()
+                else:
+                    create = True
+                    # Reservar el lugar antes de conectar fuera del lock
+                    self._pending += 1
+                self._in_use += 1
+
+            now = time.monotonic()
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._pending -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._pending -= 1
+                    self._created_at[conn] = time.monotonic()
+                    self._stats['created'] += 1
+                candidate = conn
+            else:
+                expired = candidate.closed or self._is_expired(candidate, last_used, now)
+                unhealthy = False
+                if not expired and (now - last_used) > self.check_after:
+                    unhealthy = not self._is_healthy(candidate)
+                if expired or unhealthy:
+                    with self._cond:
+                        self._in_use -= 1
+                        if expired:
+                            self._stats['recycled'] += 1
+                        else:
+                            self._stats['health_check_failures'] += 1
+                    self._discard(candidate)
+                    continue
+
+            wait = time.monotonic() - start
+            with self._cond:
+                self._stats['checkouts'] += 1
+                if waited:
+                    self._stats['waits'] += 1
+                self._stats['wait_time_total'] += wait
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait)
+            return candidate
+
+    def putconn(self, conn, discard: bool = False):
+        """Devuelve una conexión al pool"""
+        now = time.monotonic()
+        with self._cond:
+            self._in_use = max(0, self._in_use - 1)
+            created = self._created_at.get(conn, now)
+            expired = (now - created) > self.max_lifetime
+            keep = not (discard or self._closed or conn.closed or expired)
+            if keep and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                keep = False
+            if keep:
+                self._idle.append((conn, now))
+                self._cond.notify()
+                return
+            if expired:
+                self._stats['recycled'] += 1
+        self._discard(conn)
+
+    def warm_up(self):
+        """Abre las conexiones mínimas configuradas"""
+        while True:
+            with self._cond:
+                if self.size >= self.min_size:
+                    return
+            conn = self._open()
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+
+    def closeall(self):
+        """Cierra todas las conexiones libres y marca el pool como cerrado"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle = []
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas del pool"""
+        with self._cond:
+            checkouts = self._stats['checkouts']
+            return {
+                'size': self.size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': checkouts,
+                'waits': self._stats['waits'],
+                'timeouts': self._stats['timeouts'],
+                'created': self._stats['created'],
+                'recycled': self._stats['recycled'],
+                'health_check_failures': self._stats['health_check_failures'],
+                'wait_time_avg_ms': round(self._stats['wait_time_total'] / checkouts * 1000, 3) if checkouts else 0.0,
+                'wait_time_max_ms': round(self._stats['wait_time_max'] * 1000, 3)
+            }
+
+
+# Pool por proceso: tras el fork de gunicorn cada worker crea el suyo
+_pool_state = {
+    'pid': None,
+    'pool': None,
+    'lock': threading.Lock()
+}
+
+# SQLite: una conexión de larga vida por hilo
+_sqlite_local = threading.local()
+_sqlite_state = {
+    'pid': None,
+    'connections': 0,
+    'checkouts': 0,
+    'lock': threading.Lock()
+}
+
+
+def get_pool() -> PostgresConnectionPool:
+    """Retorna el pool del proceso actual, creándolo si es necesario"""
+    pid = os.getpid()
+    if _pool_state['pool'] is not None and _pool_state['pid'] == pid:
+        return _pool_state['pool']
+
+    with _pool_state['lock']:
+        if _pool_state['pool'] is None or _pool_state['pid'] != pid:
+            # No cerrar conexiones heredadas del proceso padre: comparten socket
+            pool = PostgresConnectionPool(_new_postgres_connection, **POOL_CONFIG)
+            try:
+                pool.warm_up()
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo precalentar el pool de conexiones: {e}")
+            _pool_state['pool'] = pool
+            _pool_state['pid'] = pid
+            logger.info(f"🏊 Pool PostgreSQL creado (pid {pid}, máx {pool.max_size} conexiones)")
+    return _pool_state['pool']
+
+
+def _abrir_sqlite() -> sqlite3.Connection:
+    conn = sqlite3.connect(SQLITE_DB_PATH)
+    conn.row_factory = sqlite3.Row  # Retornar filas como diccionarios
+    return conn
+
+
+def _get_sqlite_connection() -> sqlite3.Connection:
+    """
+    Conexión SQLite de larga vida para el hilo actual.
+    Si ya está prestada (p. ej. a un cursor de stream_query), abre una conexión
+    aparte de un solo uso, que _release_connection cierra.
+    """
+    pid = os.getpid()
+    conn = getattr(_sqlite_local, 'conn', None)
+    nueva = conn is None or getattr(_sqlite_local, 'pid', None) != pid
+    if nueva:
+        conn = _abrir_sqlite()
+        _sqlite_local.conn = conn
+        _sqlite_local.pid = pid
+        _sqlite_local.prestada = False
+    with _sqlite_state['lock']:
+        if _sqlite_state['pid'] != pid:
+            _sqlite_state['pid'] = pid
+            _sqlite_state['connections'] = 0
+            _sqlite_state['checkouts'] = 0
+        if nueva:
+            _sqlite_state['connections'] += 1
+        _sqlite_state['checkouts'] += 1
+    if _sqlite_local.prestada:
+        return _abrir_sqlite()
+    _sqlite_local.prestada = True
+    return conn
+
+
+def _acquire_connection() -> Union[psycopg2.extensions.connection, sqlite3.Connection]:
+    """Obtiene una conexión del pool (PostgreSQL) o la conexión del hilo (SQLite)"""
+    if USE_POSTGRES:
+        return get_pool().getconn()
+    return _get_sqlite_connection()
+
+
+def _release_connection(conn, discard: bool = False):
+    """Devuelve la conexión al pool; en SQLite la conexión del hilo se conserva"""
+    if USE_POSTGRES:
+        get_pool().putconn(conn, discard=discard)
+    elif conn is getattr(_sqlite_local, 'conn', None):
+        _sqlite_local.prestada = False
+    else:
+        conn.close()  # conexión aparte de _get_sqlite_connection
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Estadísticas del pool de conexiones del proceso actual"""
+    if USE_POSTGRES:
+        stats = get_pool().stats()
+    else:
+        stats = {
+            'size': _sqlite_state['connections'],
+            'in_use': 0,
+            'checkouts': _sqlite_state['checkouts']
+        }
+    stats['backend'] = get_db_type()
+    stats['pid'] = os.getpid()
+    return stats
+
+
+def close_pool():
+    """Cierra las conexiones del proceso actual (al terminar un worker)"""
+    pool = _pool_state['pool']
+    if pool is not None and _pool_state['pid'] == os.getpid():
+        pool.closeall()
+        _pool_state['pool'] = None
+    conn = getattr(_sqlite_local, 'conn', None)
+    if conn is not None and getattr(_sqlite_local, 'pid', None) == os.getpid():
+        conn.close()
+        _sqlite_local.conn = None
+        _sqlite_local.prestada = False
+
+
+# Conexión ligada al request de Flask (activada con init_app)
+_request_state = {'habilitado': False}
+
+
+def _conexion_de_request():
+    """
+    Conexión del request actual (se obtiene del pool en el primer uso).
+    None fuera de un request, sin init_app, o si la ocupa un cursor de streaming
+    (stream_query): en ese caso se usa otra conexión.
+    """
+    if not _request_state['habilitado'] or not has_request_context():
+        return None
+    if g.get('_db_conn_en_uso'):
+        return None
+    conn = g.get('_db_conn')
+    if conn is None:
+        conn = _acquire_connection()
+        g._db_conn = conn
+    return conn
+
+
+def _liberar_conexion_de_request(error: Optional[BaseException] = None):
+    """Commit (o rollback si hubo error) y devolución al pool al terminar el request"""
+    conn = g.pop('_db_conn', None)
+    g.pop('_db_conn_en_uso', None)
+    if conn is None:
+        return
+    discard = False
+    try:
+        if error is None:
+            conn.commit()
+        else:
+            conn.rollback()
+    except Exception as e:
+        logger.error(f"Error cerrando la conexión del request: {e}")
+        discard = True
+    finally:
+        _release_connection(conn, discard=discard)
+
+
+def init_app(app):
+    """
+    Reutiliza una sola conexión por request de Flask: se toma en la primera
+    consulta y se confirma/revierte y libera en teardown_request.
+    Fuera de un request (scripts, Streamlit) cada bloque usa su propia conexión.
+    """
+    _request_state['habilitado'] = True
+
+    @app.teardown_request
+    def _db_teardown(error):
+        _liberar_conexion_de_request(error)
+
+
+# Conexión del bloque más externo abierto en este hilo; los bloques anidados la
+# reutilizan sin commit/rollback propio (la unidad de trabajo es la del externo)
+_bloque_activo = threading.local()
+
+
+@contextmanager
+def _bloque_externo(conn):
+    """Registra `conn` como la conexión a la que se unen los bloques anidados del hilo"""
+    _bloque_activo.conn = conn
+    _bloque_activo.pid = os.getpid()
+    try:
+        yield
+    finally:
+        _bloque_activo.conn = None
+
+
+def _conexion_anidada():
+    """Conexión del bloque externo en curso en este hilo, o None"""
+    conn = getattr(_bloque_activo, 'conn', None)
+    if conn is not None and getattr(_bloque_activo, 'pid', None) == os.getpid():
+        return conn
+    return None
+
+
+def en_transaccion() -> bool:
+    """
+    True si este hilo está dentro de un bloque de conexión (p. ej. transaction()).
+    Lo hecho ahora puede revertirse después: no marcar como hecho por proceso
+    (p. ej. un CREATE TABLE) hasta ejecutarlo fuera de una transacción.
+    """
+    return _conexion_anidada() is not None
+
+
 @contextmanager
-def get_db_connection() -> Generator[Union[psycopg2.extensions.connection, sqlite3.Connection], None, None]:
-    """Context manager para conexiones - soporte dual PostgreSQL/SQLite"""
+def get_db_connection(solo_lectura: bool = False, _anidable: bool = True) -> Generator[Union[psycopg2.extensions.connection, sqlite3.Connection], None, None]:
+    """
+    Context manager para conexiones - soporte dual PostgreSQL/SQLite (con pool).
+    Dentro de un request usa la conexión del request; con `solo_lectura` no hace
+    commit al salir (lo hace teardown_request).
+    Un bloque abierto dentro de otro (p. ej. execute_update llamado dentro de
+    transaction()) reutiliza la conexión del externo y no confirma ni revierte:
+    el error se propaga y el bloque externo revierte toda la unidad de trabajo.
+    Con `_anidable=False` (cursores de streaming) los bloques internos no se unen
+    a esta conexión.
+    """
+    conn = _conexion_anidada()
+    if conn is not None:
+        yield conn
+        return
+    
+    conn = _conexion_de_request()
+    if conn is not None:
+        g._db_conn_en_uso = True
+        try:
+            with _bloque_externo(conn) if _anidable else nullcontext():
+                yield conn
+            if not solo_lectura:
+                conn.commit()
+        except Exception as e:
+            try:
+                conn.rollback()
+            except Exception:
+                # Conexión rota: descartarla; el siguiente uso toma otra del pool
+                g.pop('_db_conn', None)
+                _release_connection(conn, discard=True)
+            logger.error(f"Error de conexión a la base de datos: {e}")
+            raise
+        finally:
+            g._db_conn_en_uso = False
+        return
+    
     conn = None
+    discard = False
     try:
-        if USE_POSTGRES:
-            # Conexión PostgreSQL (producción)
-            if DATABASE_URL:
-                conn = psycopg2.connect(DATABASE_URL, sslmode='require')
-            else:
-                conn = psycopg2.connect(**DB_CONFIG)
-            conn.autocommit = False
-        else:
-            # Conexión SQLite (desarrollo local)
-            conn = sqlite3.connect(SQLITE_DB_PATH)
-            conn.row_factory = sqlite3.Row  # Retornar filas como diccionarios
+        conn = _acquire_connection()
         
-        yield conn
+        with _bloque_externo(conn) if _anidable else nullcontext():
+            yield conn
         
-        if USE_POSTGRES:
-            conn.commit()
-        else:
-            conn.commit()
+        conn.commit()
             
     except Exception as e:
         if conn:
-            conn.rollback()
+            try:
+                conn.rollback()
+            except Exception:
+                # Conexión rota: no regresarla al pool
+                discard = True
         logger.error(f"Error de conexión a la base de datos: {e}")
         raise
     finally:
         if conn:
-            conn.close()
+            _release_connection(conn, discard=discard)
 
 
 def execute_query(query: str, params: tuple = ()) -> List[Dict[str, Any]]:
@@ -90,16 +554,20 @@ def execute_query(query: str, params: tuple = ()) -> List[Dict[str, Any]]:
         if USE_SQLITE and '%s' in query:
             query = query.replace('%s', '?')
         
-        with get_db_connection() as conn:
+        with get_db_connection(solo_lectura=True) as conn:
             if USE_POSTGRES:
                 with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    cursor.execute(query, params)
-                    result = cursor.fetchall()
+                    with query_stats.medir(query) as medicion:
+                        cursor.execute(query, params)
+                        result = cursor.fetchall()
+                        medicion['filas'] = len(result)
                     return [dict(row) for row in result]
             else:
                 cursor = conn.cursor()
-                cursor.execute(query, params)
-                result = cursor.fetchall()
+                with query_stats.medir(query) as medicion:
+                    cursor.execute(query, params)
+                    result = cursor.fetchall()
+                    medicion['filas'] = len(result)
                 return [dict(row) for row in result]
                 
     except Exception as e:
@@ -118,14 +586,15 @@ def execute_update(query: str, params: tuple = ()) -> int:
         
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(query, params)
+            with query_stats.medir(query) as medicion:
+                cursor.execute(query, params)
+                medicion['filas'] = cursor.rowcount
             
             if USE_POSTGRES:
                 rowcount = cursor.rowcount
             else:
                 rowcount = cursor.rowcount
             
-            conn.commit()
             cursor.close()
             return rowcount
             
@@ -149,7 +618,9 @@ def execute_insert(query: str, params: tuple = ()) -> Optional[int]:
         
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(query, params)
+            with query_stats.medir(query) as medicion:
+                cursor.execute(query, params)
+                medicion['filas'] = cursor.rowcount
             
             if USE_POSTGRES:
                 # PostgreSQL con RETURNING
@@ -162,7 +633,6 @@ def execute_insert(query: str, params: tuple = ()) -> Optional[int]:
                 # SQLite usa lastrowid
                 inserted_id = cursor.lastrowid
             
-            conn.commit()
             cursor.close()
             return inserted_id
             
@@ -173,6 +643,288 @@ def execute_insert(query: str, params: tuple = ()) -> Optional[int]:
         raise
 
 
+
+STREAM_LOTE = int(os.getenv('DB_STREAM_LOTE', '2000'))  # filas por fetchmany en stream_query
+
+
+def stream_query(query: str, params: tuple = (), lote: int = STREAM_LOTE) -> Generator[Dict[str, Any], None, None]:
+    """
+    Consulta de lectura que entrega las filas una a una, pidiéndolas por lotes:
+    cursor con nombre (del lado del servidor) en PostgreSQL, fetchmany en SQLite.
+    La memoria no depende del total de filas. La conexión queda ocupada hasta
+    que el generador termina o se cierra.
+    """
+    if USE_SQLITE and '%s' in query:
+        query = query.replace('%s', '?')
+    
+    with get_db_connection(solo_lectura=True, _anidable=False) as conn:
+        if USE_POSTGRES:
+            cursor = conn.cursor(name=f'stream_{uuid.uuid4().hex[:16]}', cursor_factory=RealDictCursor)
+            cursor.itersize = lote
+        else:
+            cursor = conn.cursor()
+        
+        # Solo cuenta el tiempo en la BD, no el que tarda el consumidor entre lotes
+        tiempo_bd = 0.0
+        filas = 0
+        error = False
+        try:
+            inicio = time.perf_counter()
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(lote)
+                tiempo_bd += time.perf_counter() - inicio
+                if not rows:
+                    break
+                filas += len(rows)
+                for row in rows:
+                    yield dict(row)
+                inicio = time.perf_counter()
+        except GeneratorExit:
+            # El consumidor dejó de leer (p. ej. cliente desconectado): cerrar el cursor
+            # y dejar la conexión sin transacción abierta para que vuelva al pool
+            cursor.close()
+            conn.rollback()
+            raise
+        except Exception as e:
+            error = True
+            logger.error(f"Error en stream_query: {e}")
+            logger.error(f"Query: {query}")
+            raise
+        finally:
+            cursor.close()
+            query_stats.registrar(query, tiempo_bd, filas, error)
+
+def _chunks(rows: Sequence, size: Optional[int]) -> Iterable[Sequence]:
+    """Divide una secuencia en bloques de `size` elementos (todo junto si size es None)"""
+    if not size or size <= 0:
+        yield rows
+        return
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _execute_many_cursor(cursor, query: str, params_list: Sequence[tuple], page_size: Optional[int] = None) -> int:
+    """executemany sobre un cursor: execute_batch en PostgreSQL, executemany en SQLite"""
+    params_list = list(params_list)
+    if not params_list:
+        return 0
+    with query_stats.medir(query) as medicion:
+        medicion['filas'] = len(params_list)
+        if USE_POSTGRES:
+            execute_batch(cursor, query, params_list, page_size=page_size or 100)
+            return len(params_list)
+        
+        query = query.replace('%s', '?')
+        total = 0
+        for chunk in _chunks(params_list, page_size):
+            cursor.executemany(query, chunk)
+            total += cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+        return total
+
+
+def _execute_values_cursor(cursor, query: str, rows: Sequence[tuple], template: Optional[str] = None,
+                           page_size: Optional[int] = None, returning: bool = False) -> Union[int, List[Any]]:
+    """
+    INSERT multi-fila sobre un cursor. `query` lleva un único `VALUES %s`.
+    PostgreSQL: psycopg2.extras.execute_values (con RETURNING opcional).
+    SQLite: executemany en la transacción actual; con RETURNING fila por fila usando lastrowid.
+    """
+    rows = list(rows)
+    if not rows:
+        return [] if returning else 0
+    
+    with query_stats.medir(query) as medicion:
+        medicion['filas'] = len(rows)
+        return _execute_values_rows(cursor, query, rows, template, page_size, returning)
+
+
+def _execute_values_rows(cursor, query: str, rows: List[tuple], template: Optional[str],
+                         page_size: Optional[int], returning: bool) -> Union[int, List[Any]]:
+    if USE_POSTGRES:
+        result = pg_execute_values(
+            cursor, query, rows, template=template,
+            page_size=page_size or 100, fetch=returning
+        )
+        if returning:
+            return [row[0] for row in result]
+        return len(rows)
+    
+    # SQLite: expandir VALUES %s a (?, ?, ...)
+    if template is None:
+        template = "(" + ", ".join(["%s"] * len(rows[0])) + ")"
+    if 'RETURNING' in query.upper():
+        query = query[:query.upper().index('RETURNING')].strip()
+    query = query.replace('%s', template, 1).replace('%s', '?')
+    
+    if returning:
+        ids = []
+        for row in rows:
+            cursor.execute(query, row)
+            ids.append(cursor.lastrowid)
+        return ids
+    
+    total = 0
+    for chunk in _chunks(rows, page_size):
+        cursor.executemany(query, chunk)
+        total += len(chunk)
+    return total
+
+
+def execute_many(query: str, params_list: Sequence[tuple], page_size: Optional[int] = None) -> int:
+    """Ejecutar la misma sentencia para muchas filas en una sola transacción"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            total = _execute_many_cursor(cursor, query, params_list, page_size)
+            cursor.close()
+            return total
+    except Exception as e:
+        logger.error(f"Error ejecutando execute_many: {e}")
+        logger.error(f"Query: {query}")
+        raise
+
+
+def execute_values(query: str, rows: Sequence[tuple], template: Optional[str] = None,
+                   page_size: Optional[int] = None, returning: bool = False) -> Union[int, List[Any]]:
+    """
+    INSERT multi-fila en una sola transacción.
+    
+    Uso:
+        ids = execute_values(
+            "INSERT INTO categorias (nombre, descripcion) VALUES %s RETURNING id",
+            [('Chascas', '...'), ('Elotes', '...')],
+            returning=True
+        )
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            result = _execute_values_cursor(cursor, query, rows, template, page_size, returning)
+            cursor.close()
+            return result
+    except Exception as e:
+        logger.error(f"Error ejecutando execute_values: {e}")
+        logger.error(f"Query: {query}")
+        raise
+
+
+class Transaction:
+    """
+    Unidad de trabajo: una conexión y un cursor compartidos por varias sentencias.
+    Todo se confirma (commit) al salir de `transaction()` o se revierte si hay error.
+    """
+
+    def __init__(self, conn: Union[psycopg2.extensions.connection, sqlite3.Connection]):
+        self.conn = conn
+        self.cursor = conn.cursor()
+
+    @staticmethod
+    def _adapt(query: str) -> str:
+        """Convierte placeholders y RETURNING para SQLite"""
+        if USE_SQLITE and '%s' in query:
+            query = query.replace('%s', '?')
+        return query
+
+    def execute(self, query: str, params: tuple = ()):
+        """Ejecuta una sentencia en la transacción y retorna el cursor"""
+        self._run(query, params)
+        return self.cursor
+
+    def _run(self, query: str, params: tuple = (), fetch: bool = False):
+        """Ejecuta (y opcionalmente lee) una sentencia midiendo su duración"""
+        query = self._adapt(query)
+        try:
+            with query_stats.medir(query) as medicion:
+                self.cursor.execute(query, params)
+                if fetch:
+                    rows = self.cursor.fetchall()
+                    medicion['filas'] = len(rows)
+                    return rows
+                medicion['filas'] = self.cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error en transacción: {e}")
+            logger.error(f"Query: {query}")
+            logger.error(f"Params: {params}")
+            raise
+
+    def execute_query(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        """Lectura dentro de la transacción"""
+        rows = self._run(query, params, fetch=True)
+        columns = [col[0] for col in self.cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def execute_update(self, query: str, params: tuple = ()) -> int:
+        """Escritura (INSERT, UPDATE, DELETE) dentro de la transacción"""
+        return self.execute(query, params).rowcount
+
+    def execute_insert(self, query: str, params: tuple = ()) -> Optional[int]:
+        """INSERT dentro de la transacción, retorna el ID generado"""
+        returning = 'RETURNING' in query.upper()
+        if USE_SQLITE and returning:
+            # SQLite usa lastrowid
+            query = query.split('RETURNING')[0].strip()
+            returning = False
+        cursor = self.execute(query, params)
+        if returning:
+            result = cursor.fetchone()
+            return result[0] if result else None
+        return cursor.lastrowid
+
+    def execute_many(self, query: str, params_list: Sequence[tuple], page_size: Optional[int] = None) -> int:
+        """executemany dentro de la transacción"""
+        return _execute_many_cursor(self.cursor, query, params_list, page_size)
+
+    def execute_values(self, query: str, rows: Sequence[tuple], template: Optional[str] = None,
+                       page_size: Optional[int] = None, returning: bool = False) -> Union[int, List[Any]]:
+        """INSERT multi-fila dentro de la transacción (ver `execute_values`)"""
+        return _execute_values_cursor(self.cursor, query, rows, template, page_size, returning)
+
+    def close(self):
+        try:
+            self.cursor.close()
+        except Exception:
+            pass
+
+
+@contextmanager
+def transaction() -> Generator[Transaction, None, None]:
+    """
+    Context manager de unidad de trabajo - una conexión, un cursor, un commit
+    
+    Uso:
+        with transaction() as tx:
+            venta_id = tx.execute_insert("INSERT ... RETURNING id", params)
+            tx.execute_update("UPDATE ...", params)
+    """
+    with get_db_connection() as conn:
+        tx = Transaction(conn)
+        try:
+            yield tx
+        finally:
+            tx.close()
+
+
+def explain_query(query: str, params: tuple = (), forzar_indices: bool = False) -> List[str]:
+    """
+    Plan de ejecución de una consulta, una línea por nodo.
+    PostgreSQL: EXPLAIN; con `forzar_indices` desactiva el seq scan para comprobar
+    que un índice es utilizable aunque la tabla sea pequeña.
+    SQLite: EXPLAIN QUERY PLAN.
+    """
+    with transaction() as tx:
+        if USE_POSTGRES:
+            if forzar_indices:
+                tx.execute("SET LOCAL enable_seqscan = off")
+            rows = tx.execute(f"EXPLAIN {query}", params).fetchall()
+            if forzar_indices:
+                # Sin rollback: si está anidada, revertiría la transacción externa
+                tx.execute("SET LOCAL enable_seqscan = on")
+            return [row[0] for row in rows]
+        rows = tx.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+        return [row[-1] for row in rows]
+
+
 def test_connection() -> bool:
     """Probar la conexión a la base de datos"""
     try:
@@ -32,3 +32,16 @@ CREATE TRIGGER trg_actualizar_fecha_entregas
 BEFORE UPDATE ON entregas
 FOR EACH ROW
 EXECUTE FUNCTION actualizar_fecha_entregas();
+
+-- Zonas de entrega: polígono [[lat, lng], ...] en JSON y tarifa de envío
+-- (una zona excluida deja fuera los puntos que cubre, p. ej. un fraccionamiento cerrado)
+CREATE TABLE IF NOT EXISTS zonas_entrega (
+    id SERIAL PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    poligono TEXT NOT NULL,
+    tarifa DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    prioridad INTEGER NOT NULL DEFAULT 0,
+    excluida BOOLEAN NOT NULL DEFAULT FALSE,
+    activa BOOLEAN NOT NULL DEFAULT TRUE,
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Exportación incremental a Parquet para análisis fuera de línea
+
+Escribe ventas, detalle_ventas, gastos_diarios y cortes_caja como archivos Parquet
+particionados por mes (estilo Hive, se leen con pandas.read_parquet(<destino>/<tabla>)):
+
+    <destino>/ventas/mes=2024-01/part-000000001234.parquet
+    <destino>/_marcas.json          último id exportado por tabla
+    <destino>/_huecos.json          ids no vistos por debajo de la marca, por tabla
+
+Cada corrida exporta solo las filas con id mayor a la marca de agua de la tabla,
+más las que aparezcan en los huecos pendientes. En PostgreSQL el id se asigna en
+el INSERT y no en el COMMIT: una venta con id menor puede confirmarse después que
+otra con id mayor ya exportada. Por eso los ids que faltan entre filas exportadas
+se guardan como huecos y se vuelven a buscar en cada corrida durante
+PARQUET_HUECOS_MINUTOS (60 por defecto). Garantía: toda fila cuya transacción
+confirme dentro de ese plazo desde la corrida que vio su hueco se exporta
+exactamente una vez; después el hueco se da por definitivo (p. ej. un id
+consumido por un rollback) y ya no se busca.
+Las columnas van tipadas: dinero como decimal(12,2), fechas con hora como timestamp
+y fechas de calendario como date. Las ediciones de filas ya exportadas (p. ej. un
+corte de caja corregido) no se vuelven a exportar: usar --completo para rehacer todo.
+
+    python -m database.exportar_parquet --destino exports/parquet
+    python -m database.exportar_parquet --destino exports/parquet --tablas ventas,detalle_ventas
+    python -m database.exportar_parquet --destino exports/parquet --completo
+
+Requiere pyarrow (opcional: pip install pyarrow).
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from database.connection_dual import stream_query, get_db_type
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # dependencia opcional, solo para este proceso
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+FILAS_POR_ARCHIVO = int(os.getenv('PARQUET_FILAS_POR_ARCHIVO', '50000'))
+ARCHIVO_MARCAS = '_marcas.json'
+ARCHIVO_HUECOS = '_huecos.json'
+HUECOS_MINUTOS = float(os.getenv('PARQUET_HUECOS_MINUTOS', '60'))
+CENTAVOS = Decimal('0.01')
+
+# Consulta, columna id (para el filtro de ids) y columna de fecha (para la partición
+# mensual) de cada tabla. detalle_ventas no tiene fecha: se toma la de su venta.
+TABLAS: Dict[str, Dict[str, str]] = {
+    'ventas': {
+        'query': "SELECT * FROM ventas WHERE {filtro} ORDER BY id",
+        'id': 'id',
+        'fecha': 'fecha'
+    },
+    'detalle_ventas': {
+        'query': """
+            SELECT dv.*, v.fecha AS fecha_venta
+            FROM detalle_ventas dv
+            JOIN ventas v ON v.id = dv.venta_id
+            WHERE {filtro}
+            ORDER BY dv.id
+        """,
+        'id': 'dv.id',
+        'fecha': 'fecha_venta'
+    },
+    'gastos_diarios': {
+        'query': "SELECT * FROM gastos_diarios WHERE {filtro} ORDER BY id",
+        'id': 'id',
+        'fecha': 'fecha'
+    },
+    'cortes_caja': {
+        'query': "SELECT * FROM cortes_caja WHERE {filtro} ORDER BY id",
+        'id': 'id',
+        'fecha': 'fecha'
+    },
+}
+
+# Hueco: rango de ids [desde, hasta] no visto y momento (ISO) en que se vio por primera vez
+Hueco = List[Any]
+
+# Tipos por nombre de columna (los esquemas de SQLite y PostgreSQL no son idénticos)
+COLUMNAS_DINERO = {
+    'total', 'subtotal', 'precio_unitario', 'descuento', 'impuestos', 'monto',
+    'total_ventas', 'total_gastos', 'diferencia', 'dinero_inicial', 'dinero_final',
+    'efectivo_inicial', 'efectivo_final', 'ventas_efectivo', 'ventas_tarjeta'
+}
+COLUMNAS_TIMESTAMP = {'fecha_creacion', 'fecha_registro', 'fecha_actualizacion', 'fecha_venta'}
+COLUMNAS_ENTERAS = {'id', 'cantidad'}
+# Columna 'fecha': timestamp en ventas, fecha de calendario en gastos y cortes
+FECHA_ES_TIMESTAMP = {'ventas'}
+
+
+def _requiere_pyarrow():
+    if pa is None:
+        raise RuntimeError("La exportación a Parquet requiere pyarrow: pip install pyarrow")
+
+
+def _tipo_columna(tabla: str, columna: str) -> 'pa.DataType':
+    if columna in COLUMNAS_DINERO:
+        return pa.decimal128(12, 2)
+    if columna in COLUMNAS_TIMESTAMP or (columna == 'fecha' and tabla in FECHA_ES_TIMESTAMP):
+        return pa.timestamp('us')
+    if columna == 'fecha':
+        return pa.date32()
+    if columna in COLUMNAS_ENTERAS or columna.endswith('_id'):
+        return pa.int64()
+    return pa.string()
+
+
+def _a_decimal(valor) -> Optional[Decimal]:
+    if valor is None:
+        return None
+    try:
+        return Decimal(str(valor)).quantize(CENTAVOS)
+    except InvalidOperation:
+        return None
+
+
+def _a_timestamp(valor) -> Optional[datetime]:
+    if valor is None or isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, date):
+        return datetime(valor.year, valor.month, valor.day)
+    return datetime.fromisoformat(str(valor))
+
+
+def _a_fecha(valor) -> Optional[date]:
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(str(valor)[:10])
+
+
+def _convertidor(tipo: 'pa.DataType'):
+    if pa.types.is_decimal(tipo):
+        return _a_decimal
+    if pa.types.is_timestamp(tipo):
+        return _a_timestamp
+    if pa.types.is_date(tipo):
+        return _a_fecha
+    if pa.types.is_integer(tipo):
+        return lambda v: None if v is None else int(v)
+    return lambda v: None if v is None else str(v)
+
+
+def esquema(tabla: str, columnas: List[str]) -> 'pa.Schema':
+    """Esquema Arrow de una tabla a partir de sus nombres de columna"""
+    _requiere_pyarrow()
+    return pa.schema([(columna, _tipo_columna(tabla, columna)) for columna in columnas])
+
+
+def _mes(valor) -> str:
+    fecha = _a_fecha(valor)
+    return fecha.strftime('%Y-%m') if fecha else 'sin_fecha'
+
+
+def _tabla_arrow(schema: 'pa.Schema', filas: List[Dict[str, Any]]) -> 'pa.Table':
+    """Filas -> columnas tipadas (una lista por columna, convertida una sola vez)"""
+    arrays = []
+    for campo in schema:
+        convertir = _convertidor(campo.type)
+        arrays.append(pa.array([convertir(fila.get(campo.name)) for fila in filas], type=campo.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _escribir_parquet(tabla_arrow: 'pa.Table', ruta: str):
+    """Escritura atómica: el archivo aparece completo o no aparece"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), prefix='.tmp_', suffix='.parquet')
+    os.close(fd)
+    try:
+        pq.write_table(tabla_arrow, tmp, compression='zstd')
+        os.replace(tmp, ruta)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def leer_marcas(destino: str) -> Dict[str, int]:
+    """Último id exportado por tabla"""
+    try:
+        with open(os.path.join(destino, ARCHIVO_MARCAS)) as f:
+            return {tabla: int(valor) for tabla, valor in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def _guardar_marcas(destino: str, marcas: Dict[str, int]):
+    os.makedirs(destino, exist_ok=True)
+    ruta = os.path.join(destino, ARCHIVO_MARCAS)
+    tmp = ruta + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(marcas, f, indent=2, sort_keys=True)
+    os.replace(tmp, ruta)
+
+
+def leer_huecos(destino: str) -> Dict[str, List[Hueco]]:
+    """Huecos pendientes por tabla"""
+    try:
+        with open(os.path.join(destino, ARCHIVO_HUECOS)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _guardar_huecos(destino: str, huecos: Dict[str, List[Hueco]]):
+    os.makedirs(destino, exist_ok=True)
+    ruta = os.path.join(destino, ARCHIVO_HUECOS)
+    tmp = ruta + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(huecos, f, indent=2, sort_keys=True)
+    os.replace(tmp, ruta)
+
+
+def _filtro_ids(columna: str, desde_id: int, huecos: List[Hueco]) -> Tuple[str, tuple]:
+    """WHERE para las filas nuevas (id > desde_id) y las de los huecos pendientes"""
+    condiciones = [f"{columna} > %s"]
+    params: List[int] = [desde_id]
+    for inicio, fin, _ in huecos:
+        condiciones.append(f"{columna} BETWEEN %s AND %s")
+        params.extend((inicio, fin))
+    return " OR ".join(condiciones), tuple(params)
+
+
+def _restar_ids(huecos: List[Hueco], encontrados: Set[int]) -> List[Hueco]:
+    """Quita de los huecos los ids que ya aparecieron (puede partir un rango en varios)"""
+    restantes = []
+    for inicio, fin, visto_en in huecos:
+        actual = inicio
+        for id_encontrado in sorted(i for i in encontrados if inicio <= i <= fin):
+            if id_encontrado > actual:
+                restantes.append([actual, id_encontrado - 1, visto_en])
+            actual = id_encontrado + 1
+        if actual <= fin:
+            restantes.append([actual, fin, visto_en])
+    return restantes
+
+
+def _huecos_vigentes(huecos: List[Hueco], ahora: datetime) -> List[Hueco]:
+    limite = ahora - timedelta(minutes=HUECOS_MINUTOS)
+    return [hueco for hueco in huecos if datetime.fromisoformat(hueco[2]) >= limite]
+
+
+def _bloques(filas: Iterable[Dict[str, Any]], tamano: int) -> Iterable[List[Dict[str, Any]]]:
+    bloque = []
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) >= tamano:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def exportar_tabla(tabla: str, destino: str, desde_id: int = 0,
+                   huecos: Optional[List[Hueco]] = None) -> Dict[str, Any]:
+    """
+    Exporta las filas de `tabla` con id > desde_id y las que llenen `huecos`.
+    Cada bloque de FILAS_POR_ARCHIVO filas produce un archivo por mes, nombrado por
+    el primer id del bloque: repetir una corrida interrumpida sobrescribe los mismos
+    archivos en lugar de duplicar filas.
+    Retorna también los huecos que siguen pendientes más los nuevos encontrados.
+    """
+    _requiere_pyarrow()
+    config = TABLAS[tabla]
+    huecos = huecos or []
+    visto_en = datetime.now().isoformat(timespec='seconds')
+    schema = None
+    filas_exportadas = 0
+    archivos = 0
+    ultimo_id = desde_id
+    recuperados: Set[int] = set()
+    nuevos_huecos: List[Hueco] = []
+
+    filtro, params = _filtro_ids(config['id'], desde_id, huecos)
+    filas = stream_query(config['query'].format(filtro=filtro), params)
+    for bloque in _bloques(filas, FILAS_POR_ARCHIVO):
+        if schema is None:
+            schema = esquema(tabla, list(bloque[0].keys()))
+        por_mes: Dict[str, List[Dict[str, Any]]] = {}
+        for fila in bloque:
+            por_mes.setdefault(_mes(fila.get(config['fecha'])), []).append(fila)
+        for mes, filas in por_mes.items():
+            ruta = os.path.join(destino, tabla, f'mes={mes}', f"part-{bloque[0]['id']:012d}.parquet")
+            _escribir_parquet(_tabla_arrow(schema, filas), ruta)
+            archivos += 1
+        for fila in bloque:
+            if fila['id'] <= desde_id:
+                recuperados.add(fila['id'])
+                continue
+            # Ids sin fila entre dos exportadas: pueden ser transacciones aún sin confirmar
+            if fila['id'] > ultimo_id + 1:
+                nuevos_huecos.append([ultimo_id + 1, fila['id'] - 1, visto_en])
+            ultimo_id = fila['id']
+        filas_exportadas += len(bloque)
+
+    return {
+        'filas': filas_exportadas,
+        'archivos': archivos,
+        'ultimo_id': ultimo_id,
+        'recuperadas': len(recuperados),
+        'huecos': _restar_ids(huecos, recuperados) + nuevos_huecos
+    }
+
+
+def exportar(destino: str, tablas: Optional[List[str]] = None, completo: bool = False) -> Dict[str, Dict[str, int]]:
+    """
+    Exporta las tablas pendientes y avanza su marca de agua.
+    La marca y los huecos se guardan después de escribir los archivos de cada tabla.
+    """
+    _requiere_pyarrow()
+    tablas = tablas or list(TABLAS)
+    marcas = leer_marcas(destino)
+    huecos = leer_huecos(destino)
+    ahora = datetime.now()
+    resultados = {}
+    for tabla in tablas:
+        if completo:
+            shutil.rmtree(os.path.join(destino, tabla), ignore_errors=True)
+            marcas.pop(tabla, None)
+            huecos.pop(tabla, None)
+        pendientes = _huecos_vigentes(huecos.get(tabla, []), ahora)
+        resultado = exportar_tabla(tabla, destino, marcas.get(tabla, 0), pendientes)
+        marcas[tabla] = resultado['ultimo_id']
+        huecos[tabla] = resultado['huecos']
+        _guardar_marcas(destino, marcas)
+        _guardar_huecos(destino, huecos)
+        resultados[tabla] = resultado
+        logger.info(f"📦 {tabla}: {resultado['filas']} filas nuevas en {resultado['archivos']} archivo(s), "
+                    f"{resultado['recuperadas']} de huecos anteriores")
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta ventas, detalle, gastos y cortes a Parquet por mes")
+    parser.add_argument('--destino', default=os.getenv('PARQUET_DESTINO', 'exports/parquet'),
+                        help="Directorio de salida (default: exports/parquet)")
+    parser.add_argument('--tablas', help=f"Tablas separadas por coma (default: {','.join(TABLAS)})")
+    parser.add_argument('--completo', action='store_true',
+                        help="Borra lo exportado y vuelve a exportar desde el id 0")
+    args = parser.parse_args()
+
+    tablas = args.tablas.split(',') if args.tablas else None
+    desconocidas = set(tablas or []) - set(TABLAS)
+    if desconocidas:
+        parser.error(f"Tablas no soportadas: {', '.join(sorted(desconocidas))}")
+    if pa is None:
+        parser.error("pyarrow no está instalado (pip install pyarrow)")
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    print(f"📦 Exportando a Parquet desde {get_db_type()} hacia {args.destino}...")
+    resultados = exportar(args.destino, tablas, args.completo)
+    for tabla, resultado in resultados.items():
+        print(f"✅ {tabla}: {resultado['filas']} filas, {resultado['archivos']} archivo(s), "
+              f"marca en id {resultado['ultimo_id']}, {len(resultado['huecos'])} hueco(s) pendiente(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -90,7 +90,31 @@ INSERT INTO categorias (nombre, descripcion, activo)
 SELECT 'Extras', 'Porciones adicionales y complementos', TRUE
 WHERE NOT EXISTS (SELECT 1 FROM categorias WHERE nombre = 'Extras');
 
--- 8. Mensaje de éxito
+-- 8. Versiones de cache (invalidación del catálogo en memoria entre workers)
+CREATE TABLE IF NOT EXISTS cache_versiones (
+    clave VARCHAR(50) PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+-- 9. Resumen diario de ventas (se mantiene en la transacción de cada venta)
+--    Backfill: python -m database.resumen_ventas
+CREATE TABLE IF NOT EXISTS ventas_diarias (
+    fecha DATE NOT NULL,
+    metodo_pago VARCHAR(50) NOT NULL,
+    num_ventas INTEGER NOT NULL DEFAULT 0,
+    total DECIMAL(12,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, metodo_pago)
+);
+
+CREATE TABLE IF NOT EXISTS ventas_producto_diarias (
+    fecha DATE NOT NULL,
+    producto_id INTEGER NOT NULL,
+    cantidad INTEGER NOT NULL DEFAULT 0,
+    total DECIMAL(12,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, producto_id)
+);
+
+-- 10. Mensaje de éxito
 DO $$
 BEGIN
     RAISE NOTICE '✅ Migración completada exitosamente';
@@ -2,17 +2,84 @@
 Modelos de datos para el sistema de facturación - PostgreSQL
 OPTIMIZADO - imports al inicio para evitar importaciones repetidas
 """
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 from datetime import datetime
 from decimal import Decimal
 import logging
-from database.connection_dual import execute_query, execute_update, execute_insert
-from utils.timezone_utils import get_mexico_datetime  # Import al inicio
+import os
+import threading
+import time
+from database.connection_dual import (
+    execute_query, execute_update, execute_insert, execute_values, transaction, Transaction, get_db_type
+)
+from database import cache_versiones, resumen_ventas
+from utils.timezone_utils import get_mexico_datetime, get_mexico_date_range, get_mexico_today_range  # Import al inicio
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Cache en memoria del catálogo de productos (por worker)
+# Se valida contra la fila 'catalogo' de cache_versiones para mantener coherentes a todos los workers
+CATALOGO_CACHE_VERIFICAR_CADA = float(os.getenv('CATALOGO_CACHE_VERIFICAR_CADA', '2'))  # segundos
+# Red de seguridad para escrituras que no incrementan la versión (p. ej. SQL a mano)
+CATALOGO_CACHE_MAX_EDAD = float(os.getenv('CATALOGO_CACHE_MAX_EDAD', '300'))  # segundos
+
+_catalogo_cache = {
+    'version': None,          # versión global con la que se cargaron las entradas
+    'verificado_en': 0.0,     # última vez que se consultó la versión global
+    'productos': {},          # activos_solamente -> (version, List[Producto], cargado_en)
+    'hits': 0,
+    'misses': 0,
+    'lock': threading.Lock()
+}
+
+def _version_catalogo() -> Optional[int]:
+    """Versión global del catálogo, consultada como máximo cada CATALOGO_CACHE_VERIFICAR_CADA segundos"""
+    ahora = time.monotonic()
+    if (_catalogo_cache['version'] is not None
+            and ahora - _catalogo_cache['verificado_en'] < CATALOGO_CACHE_VERIFICAR_CADA):
+        return _catalogo_cache['version']
+    try:
+        version = cache_versiones.get_version(cache_versiones.CATALOGO)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer la versión del catálogo, cache deshabilitada: {e}")
+        return None
+    with _catalogo_cache['lock']:
+        if version != _catalogo_cache['version']:
+            _catalogo_cache['productos'] = {}
+            _catalogo_cache['version'] = version
+        _catalogo_cache['verificado_en'] = ahora
+    return version
+
+def invalidar_catalogo(tx: Optional[Transaction] = None):
+    """Invalida el catálogo en este worker y, vía cache_versiones, en todos los demás"""
+    with _catalogo_cache['lock']:
+        _catalogo_cache['productos'] = {}
+        _catalogo_cache['version'] = None
+    try:
+        cache_versiones.incrementar_version(cache_versiones.CATALOGO, tx)
+    except Exception as e:
+        if tx is not None:
+            raise
+        logger.warning(f"⚠️ No se pudo propagar la invalidación del catálogo: {e}")
+
+def get_catalogo_cache_stats() -> Dict[str, int]:
+    """Aciertos y fallos de la cache del catálogo en este worker"""
+    return {
+        'hits': _catalogo_cache['hits'],
+        'misses': _catalogo_cache['misses'],
+        'version': _catalogo_cache['version'] or 0
+    }
+
+class StockInsuficienteError(Exception):
+    """Uno o más productos no tienen existencias suficientes para la venta"""
+    
+    def __init__(self, faltantes: List[Dict]):
+        self.faltantes = faltantes
+        nombres = ", ".join(str(f['nombre'] or f['producto_id']) for f in faltantes)
+        super().__init__(f"Stock insuficiente para {nombres}")
+
 def safe_float(value) -> float:
     """Convierte de forma segura cualquier valor numérico a float"""
     if isinstance(value, Decimal):
@@ -35,7 +102,28 @@ class Producto:
 
     @classmethod
     def get_all(cls, activos_solamente: bool = True) -> List['Producto']:
-        """Obtiene todos los productos"""
+        """Obtiene todos los productos (desde la cache del catálogo si está vigente)"""
+        version = _version_catalogo()
+        if version is not None:
+            cached = _catalogo_cache['productos'].get(activos_solamente)
+            if (cached is not None and cached[0] == version
+                    and time.monotonic() - cached[2] < CATALOGO_CACHE_MAX_EDAD):
+                _catalogo_cache['hits'] += 1
+                # Copias para que los llamadores no modifiquen la cache
+                return [replace(p) for p in cached[1]]
+        
+        _catalogo_cache['misses'] += 1
+        productos = cls._cargar_todos(activos_solamente)
+        if version is not None:
+            with _catalogo_cache['lock']:
+                if _catalogo_cache['version'] == version:
+                    _catalogo_cache['productos'][activos_solamente] = (version, productos, time.monotonic())
+            return [replace(p) for p in productos]
+        return productos
+    
+    @classmethod
+    def _cargar_todos(cls, activos_solamente: bool) -> List['Producto']:
+        """Consulta todos los productos en la base de datos"""
         query = "SELECT * FROM productos"
         if activos_solamente:
             query += " WHERE activo = TRUE OR activo = 1"
@@ -59,6 +147,26 @@ class Producto:
             return cls(**data)
         return None
     
+    @classmethod
+    def get_many(cls, producto_ids) -> Dict[int, 'Producto']:
+        """Obtiene varios productos en una sola consulta, como dict {id: Producto}"""
+        ids = list({int(producto_id) for producto_id in producto_ids})
+        if not ids:
+            return {}
+        
+        if get_db_type() == 'postgres':
+            rows = execute_query("SELECT * FROM productos WHERE id = ANY(%s)", (ids,))
+        else:
+            placeholders = ", ".join(["%s"] * len(ids))
+            rows = execute_query(f"SELECT * FROM productos WHERE id IN ({placeholders})", tuple(ids))
+        
+        productos = {}
+        for row in rows:
+            data = dict(row)
+            data['precio'] = safe_float(data.get('precio', 0))
+            productos[data['id']] = cls(**data)
+        return productos
+    
     @classmethod
     def get_by_categoria(cls, categoria_id: int) -> List['Producto']:
         """Obtiene productos por categoría"""
@@ -97,12 +205,86 @@ class Producto:
             params = (self.nombre, self.precio, self.stock, self.categoria,
                      self.codigo_barras, self.descripcion, self.activo, self.id)
             execute_update(query, params)
+        invalidar_catalogo()
         return self.id or 0
     
     def actualizar_stock(self, nueva_cantidad: int):
         """Actualiza el stock del producto"""
         execute_update("UPDATE productos SET stock = %s WHERE id = %s", (nueva_cantidad, self.id))
         self.stock = nueva_cantidad
+        invalidar_catalogo()
+    
+    @classmethod
+    def reservar_stock(cls, cantidades: Union[Dict[int, int], Iterable[Tuple[int, int]]], tx: Transaction) -> None:
+        """
+        Descuenta stock de varios productos ({producto_id: cantidad} o pares
+        (producto_id, cantidad), que pueden repetir producto) verificando existencias
+        en la misma sentencia (sin leer-modificar-escribir en Python).
+        Si algún producto no alcanza, lanza StockInsuficienteError con todos los faltantes;
+        el llamador debe dejar que la transacción haga rollback.
+        """
+        # UPDATE ... FROM (VALUES) aplica una sola fila de VALUES por producto:
+        # las líneas repetidas se suman antes
+        pares = cantidades.items() if isinstance(cantidades, dict) else cantidades
+        cantidades = {}
+        for producto_id, cantidad in pares:
+            cantidades[int(producto_id)] = cantidades.get(int(producto_id), 0) + int(cantidad)
+        if not cantidades:
+            return
+        
+        if get_db_type() == 'postgres':
+            # El UPDATE ... FROM bloquea filas en el orden que elija el planner; dos ventas
+            # con productos en común podrían bloquearse mutuamente (deadlock). Se toman
+            # primero los bloqueos en orden de id para que todas las ventas coincidan.
+            ids = sorted(cantidades)
+            placeholders = ", ".join(["%s"] * len(ids))
+            tx.execute_query(
+                f"SELECT id FROM productos WHERE id IN ({placeholders}) ORDER BY id FOR UPDATE",
+                tuple(ids)
+            )
+            # Una sola sentencia para todos los productos; la condición se re-evalúa
+            # tras el bloqueo de fila, así dos workers no pueden sobrevender
+            query = """
+                UPDATE productos AS p
+                SET stock = p.stock - v.cantidad
+                FROM (VALUES %s) AS v(id, cantidad)
+                WHERE p.id = v.id AND p.stock >= v.cantidad
+                RETURNING p.id
+            """
+            reservados = set(tx.execute_values(
+                query, sorted(cantidades.items()), page_size=len(cantidades), returning=True
+            ))
+        else:
+            # SQLite serializa escritores: dentro de la transacción cada UPDATE es atómico
+            reservados = set()
+            for producto_id, cantidad in cantidades.items():
+                actualizados = tx.execute_update(
+                    "UPDATE productos SET stock = stock - %s WHERE id = %s AND stock >= %s",
+                    (cantidad, producto_id, cantidad)
+                )
+                if actualizados:
+                    reservados.add(producto_id)
+        
+        fallidos = [producto_id for producto_id in cantidades if producto_id not in reservados]
+        if not fallidos:
+            return
+        
+        placeholders = ", ".join(["%s"] * len(fallidos))
+        rows = tx.execute_query(
+            f"SELECT id, nombre, stock FROM productos WHERE id IN ({placeholders})",
+            tuple(fallidos)
+        )
+        encontrados = {row['id']: row for row in rows}
+        faltantes = []
+        for producto_id in fallidos:
+            row = encontrados.get(producto_id)
+            faltantes.append({
+                'producto_id': producto_id,
+                'nombre': row['nombre'] if row else None,
+                'solicitado': cantidades[producto_id],
+                'disponible': row['stock'] if row else 0
+            })
+        raise StockInsuficienteError(faltantes)
 
 @dataclass
 class Venta:
@@ -135,8 +317,8 @@ class Venta:
     @classmethod
     def get_by_fecha(cls, fecha_inicio: str, fecha_fin: str) -> List['Venta']:
         """Obtiene ventas por rango de fechas"""
-        query = "SELECT * FROM ventas WHERE DATE(fecha) BETWEEN %s AND %s ORDER BY fecha DESC"
-        rows = execute_query(query, (fecha_inicio, fecha_fin))
+        query = "SELECT * FROM ventas WHERE fecha >= %s AND fecha < %s ORDER BY fecha DESC"
+        rows = execute_query(query, get_mexico_date_range(fecha_inicio, fecha_fin))
         ventas = []
         for row in rows:
             data = dict(row)
@@ -152,8 +334,8 @@ class Venta:
     @classmethod
     def get_ventas_hoy(cls) -> List['Venta']:
         """Obtiene las ventas del día actual"""
-        query = "SELECT * FROM ventas WHERE DATE(fecha) = CURRENT_DATE ORDER BY fecha DESC"
-        rows = execute_query(query)
+        query = "SELECT * FROM ventas WHERE fecha >= %s AND fecha < %s ORDER BY fecha DESC"
+        rows = execute_query(query, get_mexico_today_range())
         ventas = []
         for row in rows:
             data = dict(row)
@@ -166,7 +348,7 @@ class Venta:
             ventas.append(cls(**data))
         return ventas
     
-    def save(self) -> int:
+    def save(self, tx: Optional[Transaction] = None) -> int:
         """Guarda la venta - adaptado al schema real de SQLite"""
         try:
             if self.fecha is None:
@@ -180,6 +362,7 @@ class Venta:
             query = """
                 INSERT INTO ventas (fecha, total, metodo_pago, notas, fecha_creacion)
                 VALUES (%s, %s, %s, %s, %s)
+                RETURNING id
             """
             
             # Combinar observaciones y vendedor en notas
@@ -197,7 +380,7 @@ class Venta:
             
             logger.info(f"💾 Guardando venta con parámetros: Total=${self.total}, Fecha={self.fecha}")
             
-            result_id = execute_insert(query, params)
+            result_id = tx.execute_insert(query, params) if tx is not None else execute_insert(query, params)
             self.id = result_id
             
             logger.info(f"✅ Venta #{result_id} guardada exitosamente - Total: ${self.total} - Fecha: {self.fecha}")
@@ -238,6 +421,23 @@ class DetalleVenta:
                  self.precio_unitario, self.subtotal)
         self.id = execute_insert(query, params)
         return self.id or 0
+    
+    @classmethod
+    def save_many(cls, detalles: List['DetalleVenta'], tx: Optional[Transaction] = None) -> int:
+        """Guarda varios detalles de venta con un INSERT multi-fila (execute_values)"""
+        query = """
+            INSERT INTO detalle_ventas (venta_id, producto_id, cantidad, precio_unitario, subtotal)
+            VALUES %s
+            RETURNING id
+        """
+        rows = [(d.venta_id, d.producto_id, d.cantidad, d.precio_unitario, d.subtotal) for d in detalles]
+        if tx is not None:
+            ids = tx.execute_values(query, rows, returning=True)
+        else:
+            ids = execute_values(query, rows, returning=True)
+        for detalle, detalle_id in zip(detalles, ids):
+            detalle.id = detalle_id
+        return len(ids)
 
 @dataclass
 class Categoria:
@@ -323,11 +523,19 @@ class Categoria:
                 ('Extras', 'Porciones adicionales y complementos')
             ]
             
-            for nombre, descripcion in categorias_default:
-                if not cls.existe_categoria(nombre):
-                    categoria = cls(nombre=nombre, descripcion=descripcion)
-                    categoria.save()
-                    logger.info(f"Categoría '{nombre}' creada exitosamente")
+            existentes = {row['nombre'] for row in execute_query("SELECT nombre FROM categorias")}
+            faltantes = [(nombre, descripcion) for nombre, descripcion in categorias_default
+                         if nombre not in existentes]
+            if not faltantes:
+                return
+            
+            fecha_creacion = get_mexico_datetime()
+            execute_values(
+                "INSERT INTO categorias (nombre, descripcion, activo, fecha_creacion) VALUES %s",
+                [(nombre, descripcion, True, fecha_creacion) for nombre, descripcion in faltantes]
+            )
+            for nombre, _ in faltantes:
+                logger.info(f"Categoría '{nombre}' creada exitosamente")
         
         except Exception as e:
             logger.error(f"Error al crear categorías por defecto: {e}")
@@ -426,11 +634,20 @@ class Carrito:
         """Retorna la cantidad total de items en el carrito"""
         return sum(item.cantidad for item in self.items)
     
-    def procesar_venta(self, metodo_pago: str = "Efectivo", vendedor: str = "", observaciones: str = "", fecha_personalizada=None) -> Optional[Venta]:
-        """Procesa la venta del carrito actual con fecha personalizable"""
+    def procesar_venta(self, metodo_pago: str = "Efectivo", vendedor: str = "", observaciones: str = "",
+                       fecha_personalizada=None, tx: Optional[Transaction] = None) -> Optional[Venta]:
+        """
+        Procesa la venta del carrito actual con fecha personalizable.
+        Venta, detalles y stock se escriben en una sola transacción; si se pasa `tx`
+        se usa la transacción del llamador (p. ej. para registrar también la entrega).
+        """
         if not self.items:
             return None
         
+        if tx is None:
+            with transaction() as tx:
+                return self.procesar_venta(metodo_pago, vendedor, observaciones, fecha_personalizada, tx=tx)
+        
         # Usar fecha personalizada o fecha actual de México
         if fecha_personalizada:
             # Si se proporciona solo una fecha (date), convertir a datetime
@@ -455,23 +672,38 @@ class Carrito:
         )
         
         logger.info(f"🛒 Venta creada con fecha: {venta.fecha}")
-        venta_id = venta.save()
+        venta_id = venta.save(tx)
+        if not venta_id or venta_id <= 0:
+            # Sin id válido el detalle, la entrega y el resumen quedarían huérfanos
+            raise RuntimeError(f"La venta no obtuvo un id válido ({venta_id!r})")
         venta.id = venta_id
         
-        # Guardar detalle de venta y actualizar stock
-        for item in self.items:
-            detalle = DetalleVenta(
+        # Guardar detalle de venta (un INSERT multi-fila)
+        detalles = [
+            DetalleVenta(
                 venta_id=venta_id,
                 producto_id=item.producto.id or 0,
                 cantidad=item.cantidad,
                 precio_unitario=item.producto.precio,
                 subtotal=item.subtotal
             )
-            detalle.save()
-            
-            # Actualizar stock del producto
-            nuevo_stock = item.producto.stock - item.cantidad
-            item.producto.actualizar_stock(nuevo_stock)
+            for item in self.items
+        ]
+        DetalleVenta.save_many(detalles, tx)
+        
+        # Reservar stock de todos los productos (verificación y descuento atómicos)
+        Producto.reservar_stock([(item.producto.id, item.cantidad) for item in self.items], tx)
+        for item in self.items:
+            item.producto.stock -= item.cantidad
+        
+        # Resumen diario para estadísticas (misma transacción que la venta)
+        resumen_ventas.registrar_venta(
+            tx, fecha_venta, metodo_pago, self.total,
+            [(d.producto_id, d.cantidad, d.subtotal) for d in detalles]
+        )
+        
+        # El stock cambió: invalidar el catálogo en todos los workers al confirmar
+        invalidar_catalogo(tx)
         
         # Limpiar carrito después de procesar
         self.limpiar()
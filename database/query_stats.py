@@ -0,0 +1,205 @@
+"""
+Instrumentación de consultas SQL
+Registra para cada sentencia: SQL normalizado, duración, filas y endpoint que la originó.
+- Log de consultas lentas (DB_SLOW_QUERY_MS)
+- Totales por request (consultas y ms de BD) en flask.g
+- Tabla agregada de sentencias (top por tiempo total) para /api/debug/queries
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from utils.logging_config import log_performance
+
+try:
+    from flask import g, has_request_context, request
+except ImportError:  # Streamlit sin Flask instalado
+    g = request = None
+
+    def has_request_context() -> bool:
+        return False
+
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '200'))
+MAX_SENTENCIAS = int(os.getenv('DB_QUERY_STATS_MAX', '500'))
+MAX_REQUESTS_RECIENTES = 50
+
+_state = {
+    'lock': threading.Lock(),
+    'sentencias': {},  # sql normalizado -> agregado
+    'requests': deque(maxlen=MAX_REQUESTS_RECIENTES),
+    'total_consultas': 0,
+    'total_ms': 0.0,
+    'desde': time.time()
+}
+
+_RE_COMENTARIOS = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_RE_CADENAS = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMEROS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_RE_PLACEHOLDERS = re.compile(r'%s|\?')
+_RE_LISTAS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_RE_ESPACIOS = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def normalizar_sql(query: str) -> str:
+    """
+    SQL sin literales ni espacios redundantes, para agrupar sentencias equivalentes.
+    `IN (%s, %s, %s)` y `VALUES (?, ?), (?, ?)` colapsan a `(?...)`.
+    """
+    sql = _RE_COMENTARIOS.sub(' ', query)
+    sql = _RE_CADENAS.sub('?', sql)
+    sql = _RE_NUMEROS.sub('?', sql)
+    sql = _RE_PLACEHOLDERS.sub('?', sql)
+    sql = _RE_LISTAS.sub('(?...)', sql)
+    sql = re.sub(r'\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+', '(?...)', sql)
+    return _RE_ESPACIOS.sub(' ', sql).strip()
+
+
+def _endpoint_actual() -> str:
+    if has_request_context():
+        return request.endpoint or request.path
+    return '-'
+
+
+def registrar(query: str, duracion: float, filas: int = -1, error: bool = False):
+    """Registra una sentencia ejecutada (duración en segundos)"""
+    sql = normalizar_sql(query)
+    ms = duracion * 1000
+    endpoint = _endpoint_actual()
+
+    with _state['lock']:
+        _state['total_consultas'] += 1
+        _state['total_ms'] += ms
+        sentencias = _state['sentencias']
+        agregado = sentencias.get(sql)
+        if agregado is None:
+            if len(sentencias) >= MAX_SENTENCIAS:
+                # Descartar la sentencia con menos tiempo acumulado
+                menor = min(sentencias, key=lambda k: sentencias[k]['total_ms'])
+                del sentencias[menor]
+            agregado = sentencias[sql] = {
+                'sql': sql, 'llamadas': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'filas': 0, 'errores': 0, 'endpoints': {}
+            }
+        agregado['llamadas'] += 1
+        agregado['total_ms'] += ms
+        agregado['max_ms'] = max(agregado['max_ms'], ms)
+        if filas > 0:
+            agregado['filas'] += filas
+        if error:
+            agregado['errores'] += 1
+        agregado['endpoints'][endpoint] = agregado['endpoints'].get(endpoint, 0) + 1
+
+    if has_request_context():
+        g.db_consultas = getattr(g, 'db_consultas', 0) + 1
+        g.db_ms = getattr(g, 'db_ms', 0.0) + ms
+
+    if ms >= SLOW_QUERY_MS:
+        log_performance(f"Consulta lenta [{endpoint}]", duracion,
+                        f"{ms:.1f}ms filas={filas} sql={sql[:300]}", umbral=SLOW_QUERY_MS / 1000)
+
+
+@contextmanager
+def medir(query: str):
+    """
+    Mide una sentencia:
+        with medir(query) as m:
+            cursor.execute(query, params)
+            m['filas'] = cursor.rowcount
+    """
+    medicion = {'filas': -1}
+    inicio = time.perf_counter()
+    error = False
+    try:
+        yield medicion
+    except Exception:
+        error = True
+        raise
+    finally:
+        registrar(query, time.perf_counter() - inicio, medicion['filas'], error)
+
+
+def total_consultas() -> int:
+    """Sentencias registradas en este proceso"""
+    return _state['total_consultas']
+
+
+def totales_request() -> Dict[str, Any]:
+    """Consultas y ms de BD del request actual"""
+    if not has_request_context():
+        return {'consultas': 0, 'db_ms': 0.0}
+    return {'consultas': getattr(g, 'db_consultas', 0), 'db_ms': round(getattr(g, 'db_ms', 0.0), 2)}
+
+
+def top_sentencias(limite: int = 20, orden: str = 'total_ms') -> List[Dict[str, Any]]:
+    """Sentencias agregadas ordenadas por `total_ms`, `llamadas` o `max_ms`"""
+    if orden not in ('total_ms', 'llamadas', 'max_ms'):
+        orden = 'total_ms'
+    with _state['lock']:
+        filas = [dict(a, endpoints=dict(a['endpoints'])) for a in _state['sentencias'].values()]
+    filas.sort(key=lambda a: a[orden], reverse=True)
+    for fila in filas:
+        fila['promedio_ms'] = round(fila['total_ms'] / fila['llamadas'], 3)
+        fila['total_ms'] = round(fila['total_ms'], 3)
+        fila['max_ms'] = round(fila['max_ms'], 3)
+    return filas[:limite]
+
+
+def requests_recientes() -> List[Dict[str, Any]]:
+    with _state['lock']:
+        return list(_state['requests'])
+
+
+def resumen(limite: int = 20, orden: str = 'total_ms') -> Dict[str, Any]:
+    """Estado completo para el endpoint de depuración"""
+    return {
+        'pid': os.getpid(),
+        'desde': _state['desde'],
+        'total_consultas': _state['total_consultas'],
+        'total_ms': round(_state['total_ms'], 2),
+        'umbral_lenta_ms': SLOW_QUERY_MS,
+        'sentencias': top_sentencias(limite, orden),
+        'requests_recientes': requests_recientes()
+    }
+
+
+def reiniciar():
+    """Limpia las estadísticas agregadas del proceso"""
+    with _state['lock']:
+        _state['sentencias'].clear()
+        _state['requests'].clear()
+        _state['total_consultas'] = 0
+        _state['total_ms'] = 0.0
+        _state['desde'] = time.time()
+
+
+def init_app(app):
+    """Registra los totales por request (consultas y ms de BD) en la app Flask"""
+
+    @app.before_request
+    def _query_stats_inicio():
+        g.db_consultas = 0
+        g.db_ms = 0.0
+        g.request_inicio = time.perf_counter()
+
+    @app.after_request
+    def _query_stats_fin(response):
+        if request.endpoint == 'static':
+            return response
+        total_ms = (time.perf_counter() - g.get('request_inicio', time.perf_counter())) * 1000
+        with _state['lock']:
+            _state['requests'].append({
+                'metodo': request.method,
+                'ruta': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'consultas': g.get('db_consultas', 0),
+                'db_ms': round(g.get('db_ms', 0.0), 2),
+                'total_ms': round(total_ms, 2)
+            })
+        return response
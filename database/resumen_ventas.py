@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Resumen diario de ventas (rollup) para estadísticas y dashboards
+
+- ventas_diarias: número de ventas y total por día y método de pago
+- ventas_producto_diarias: cantidad y total por día y producto
+
+Las tablas se actualizan en la misma transacción que cada venta
+(`Carrito.procesar_venta` y `DirectPostgreSQLAdapter.crear_venta`), así que los días cerrados se leen del resumen y
+solo el día de hoy se agrega desde las tablas crudas (cubre también ventas
+registradas por rutas que no actualizan el resumen).
+
+Reconstruir (backfill) desde ventas/detalle_ventas:
+    python -m database.resumen_ventas                      # todo el historial
+    python -m database.resumen_ventas --desde 2024-01-01 --hasta 2024-01-31
+"""
+import argparse
+import logging
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from database.connection_dual import execute_query, execute_update, en_transaccion, transaction, Transaction, get_db_type
+from utils.timezone_utils import get_mexico_datetime, get_mexico_date_range, to_date
+
+logger = logging.getLogger(__name__)
+
+Fecha = Union[str, date]
+Ejecutor = Callable[[str, tuple], List[Dict[str, Any]]]
+
+METODO_PAGO_DEFAULT = 'Efectivo'
+
+UPSERT_VENTAS_DIARIAS = """
+    INSERT INTO ventas_diarias (fecha, metodo_pago, num_ventas, total)
+    VALUES (%s, %s, 1, %s)
+    ON CONFLICT (fecha, metodo_pago) DO UPDATE SET
+        num_ventas = ventas_diarias.num_ventas + 1,
+        total = ventas_diarias.total + excluded.total
+"""
+
+UPSERT_VENTAS_PRODUCTO_DIARIAS = """
+    INSERT INTO ventas_producto_diarias (fecha, producto_id, cantidad, total)
+    VALUES %s
+    ON CONFLICT (fecha, producto_id) DO UPDATE SET
+        cantidad = ventas_producto_diarias.cantidad + excluded.cantidad,
+        total = ventas_producto_diarias.total + excluded.total
+"""
+
+_schema_state = {'tablas': False, 'ready': False}
+
+
+def _crear_tablas(tx: Optional[Transaction] = None):
+    ejecutar = tx.execute_update if tx is not None else execute_update
+    ejecutar("""
+        CREATE TABLE IF NOT EXISTS ventas_diarias (
+            fecha DATE NOT NULL,
+            metodo_pago VARCHAR(50) NOT NULL,
+            num_ventas INTEGER NOT NULL DEFAULT 0,
+            total DECIMAL(12,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, metodo_pago)
+        )
+    """)
+    ejecutar("""
+        CREATE TABLE IF NOT EXISTS ventas_producto_diarias (
+            fecha DATE NOT NULL,
+            producto_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            total DECIMAL(12,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, producto_id)
+        )
+    """)
+    # Con tx (o anidado) el CREATE se revierte junto con la venta si esta falla
+    _schema_state['tablas'] = tx is None and not en_transaccion()
+
+
+def _asegurar_tablas():
+    """
+    Crea las tablas de resumen si no existen (una vez por proceso).
+    Si el resumen no tiene días anteriores a hoy pero las ventas sí, lo reconstruye completo.
+    """
+    if _schema_state['ready']:
+        return
+    _crear_tablas()
+    _schema_state['ready'] = _schema_state['tablas']
+
+    hoy = get_mexico_datetime().date()
+    if not execute_query("SELECT 1 AS hay FROM ventas_diarias WHERE fecha < %s LIMIT 1", (hoy.isoformat(),)) and \
+            execute_query("SELECT 1 AS hay FROM ventas WHERE fecha < %s LIMIT 1", (get_mexico_date_range(hoy)[0],)):
+        logger.info("📊 Resumen diario sin historial con ventas existentes: reconstruyendo...")
+        reconstruir()
+
+
+def _iso(valor) -> str:
+    """Fecha de la BD (date en PostgreSQL, texto en SQLite) a 'YYYY-MM-DD'"""
+    return str(valor)[:10]
+
+
+def registrar_venta(tx: Transaction, fecha, metodo_pago: Optional[str], total: float,
+                    detalles: List[Tuple[int, int, float]]):
+    """
+    Suma una venta al resumen dentro de la transacción de la venta.
+    `detalles` son tuplas (producto_id, cantidad, subtotal).
+    """
+    if not _schema_state['tablas']:
+        _crear_tablas(tx)
+    dia = to_date(fecha).isoformat()
+    tx.execute_update(UPSERT_VENTAS_DIARIAS, (dia, metodo_pago or METODO_PAGO_DEFAULT, float(total)))
+
+    # Un mismo producto puede aparecer varias veces en el carrito; PostgreSQL no permite
+    # que un INSERT ... ON CONFLICT toque la misma fila dos veces
+    por_producto: Dict[int, List[float]] = {}
+    for producto_id, cantidad, subtotal in detalles:
+        acumulado = por_producto.setdefault(producto_id, [0, 0.0])
+        acumulado[0] += cantidad
+        acumulado[1] += float(subtotal)
+
+    tx.execute_values(
+        UPSERT_VENTAS_PRODUCTO_DIARIAS,
+        [(dia, producto_id, cantidad, total_producto)
+         for producto_id, (cantidad, total_producto) in por_producto.items()]
+    )
+
+
+def vaciar(tx: Transaction):
+    """Borra todo el resumen dentro de `tx` (p. ej. al borrar todas las ventas)"""
+    if not _schema_state['tablas']:
+        _crear_tablas(tx)
+    tx.execute_update("DELETE FROM ventas_diarias")
+    tx.execute_update("DELETE FROM ventas_producto_diarias")
+
+
+def reconstruir(fecha_inicio: Optional[Fecha] = None, fecha_fin: Optional[Fecha] = None) -> Dict[str, int]:
+    """
+    Recalcula el resumen desde ventas/detalle_ventas en una sola transacción.
+    Sin fechas reconstruye todo el historial.
+    """
+    _crear_tablas()
+    _schema_state['ready'] = _schema_state['tablas']
+
+    filtro_resumen, filtro_ventas, params_resumen, params_ventas = "", "", (), ()
+    if fecha_inicio is not None:
+        inicio = to_date(fecha_inicio)
+        fin = to_date(fecha_fin) if fecha_fin is not None else get_mexico_datetime().date()
+        filtro_resumen = "WHERE fecha >= %s AND fecha <= %s"
+        params_resumen = (inicio.isoformat(), fin.isoformat())
+        filtro_ventas = "WHERE v.fecha >= %s AND v.fecha < %s"
+        params_ventas = get_mexico_date_range(inicio, fin)
+
+    with transaction() as tx:
+        tx.execute_update(f"DELETE FROM ventas_diarias {filtro_resumen}", params_resumen)
+        tx.execute_update(f"DELETE FROM ventas_producto_diarias {filtro_resumen}", params_resumen)
+        dias = tx.execute_update(f"""
+            INSERT INTO ventas_diarias (fecha, metodo_pago, num_ventas, total)
+            SELECT DATE(v.fecha), COALESCE(v.metodo_pago, '{METODO_PAGO_DEFAULT}'),
+                   COUNT(*), COALESCE(SUM(v.total), 0)
+            FROM ventas v
+            {filtro_ventas}
+            GROUP BY DATE(v.fecha), COALESCE(v.metodo_pago, '{METODO_PAGO_DEFAULT}')
+        """, params_ventas)
+        productos = tx.execute_update(f"""
+            INSERT INTO ventas_producto_diarias (fecha, producto_id, cantidad, total)
+            SELECT DATE(v.fecha), dv.producto_id, SUM(dv.cantidad), COALESCE(SUM(dv.subtotal), 0)
+            FROM detalle_ventas dv
+            JOIN ventas v ON dv.venta_id = v.id
+            {filtro_ventas}
+            GROUP BY DATE(v.fecha), dv.producto_id
+        """, params_ventas)
+
+    logger.info(f"📊 Resumen diario reconstruido: {dias} filas día/método, {productos} filas día/producto")
+    return {'ventas_diarias': dias, 'ventas_producto_diarias': productos}
+
+
+def _dividir_periodo(fecha_inicio: Optional[Fecha], fecha_fin: Optional[Fecha]):
+    """
+    Separa el periodo en días cerrados (se leen del resumen) y hoy (tablas crudas).
+    Retorna ((inicio, fin) cerrados o None, incluye_hoy).
+    """
+    hoy = get_mexico_datetime().date()
+    inicio = to_date(fecha_inicio) if fecha_inicio is not None else None
+    fin = min(to_date(fecha_fin), hoy) if fecha_fin is not None else hoy
+
+    ayer = hoy - timedelta(days=1)
+    cerrados = None
+    if inicio is None or inicio <= min(fin, ayer):
+        cerrados = (inicio, min(fin, ayer))
+    incluye_hoy = fin == hoy and (inicio is None or inicio <= hoy)
+    return cerrados, incluye_hoy
+
+
+def _filtro_cerrados(cerrados, columna: str = 'fecha') -> Tuple[str, tuple]:
+    inicio, fin = cerrados
+    if inicio is None:
+        return f"{columna} <= %s", (fin.isoformat(),)
+    return f"{columna} >= %s AND {columna} <= %s", (inicio.isoformat(), fin.isoformat())
+
+
+def ventas_por_dia(fecha_inicio: Optional[Fecha] = None, fecha_fin: Optional[Fecha] = None,
+                   ejecutar: Optional[Ejecutor] = None) -> List[Dict[str, Any]]:
+    """
+    Ventas por día y método de pago: [{dia, metodo_pago, num_ventas, total}]
+    ordenadas del día más reciente al más antiguo.
+    `ejecutar` permite usar otro adaptador (p. ej. DirectPostgreSQLAdapter.execute_query).
+    """
+    if ejecutar is None:
+        _asegurar_tablas()
+        ejecutar = execute_query
+    cerrados, incluye_hoy = _dividir_periodo(fecha_inicio, fecha_fin)
+    filas: List[Dict[str, Any]] = []
+
+    if cerrados is not None:
+        filtro, params = _filtro_cerrados(cerrados)
+        for row in ejecutar(f"""
+            SELECT fecha, metodo_pago, num_ventas, total
+            FROM ventas_diarias
+            WHERE {filtro}
+        """, params):
+            filas.append({
+                'dia': _iso(row['fecha']),
+                'metodo_pago': row['metodo_pago'],
+                'num_ventas': int(row['num_ventas']),
+                'total': float(row['total'] or 0)
+            })
+
+    if incluye_hoy:
+        hoy = get_mexico_datetime().date()
+        for row in ejecutar(f"""
+            SELECT COALESCE(metodo_pago, '{METODO_PAGO_DEFAULT}') AS metodo_pago,
+                   COUNT(*) AS num_ventas, COALESCE(SUM(total), 0) AS total
+            FROM ventas
+            WHERE fecha >= %s AND fecha < %s
+            GROUP BY COALESCE(metodo_pago, '{METODO_PAGO_DEFAULT}')
+        """, get_mexico_date_range(hoy)):
+            filas.append({
+                'dia': hoy.isoformat(),
+                'metodo_pago': row['metodo_pago'],
+                'num_ventas': int(row['num_ventas']),
+                'total': float(row['total'] or 0)
+            })
+
+    filas.sort(key=lambda f: (f['dia'], f['metodo_pago']), reverse=True)
+    return filas
+
+
+def productos_top(fecha_inicio: Optional[Fecha] = None, fecha_fin: Optional[Fecha] = None,
+                  limite: int = 10, ejecutar: Optional[Ejecutor] = None) -> List[Dict[str, Any]]:
+    """Productos más vendidos del periodo: [{producto_id, nombre, cantidad_vendida, total_ventas}]"""
+    if ejecutar is None:
+        _asegurar_tablas()
+        ejecutar = execute_query
+    cerrados, incluye_hoy = _dividir_periodo(fecha_inicio, fecha_fin)
+    acumulado: Dict[int, Dict[str, Any]] = {}
+
+    def acumular(rows):
+        for row in rows:
+            item = acumulado.setdefault(row['producto_id'], {
+                'producto_id': row['producto_id'],
+                'nombre': row['nombre'],
+                'cantidad_vendida': 0,
+                'total_ventas': 0.0
+            })
+            item['cantidad_vendida'] += int(row['cantidad'] or 0)
+            item['total_ventas'] += float(row['total'] or 0)
+
+    if cerrados is not None:
+        filtro, params = _filtro_cerrados(cerrados, 'r.fecha')
+        acumular(ejecutar(f"""
+            SELECT r.producto_id, p.nombre, SUM(r.cantidad) AS cantidad, SUM(r.total) AS total
+            FROM ventas_producto_diarias r
+            JOIN productos p ON r.producto_id = p.id
+            WHERE {filtro}
+            GROUP BY r.producto_id, p.nombre
+        """, params))
+
+    if incluye_hoy:
+        acumular(ejecutar("""
+            SELECT dv.producto_id, p.nombre, SUM(dv.cantidad) AS cantidad, SUM(dv.subtotal) AS total
+            FROM detalle_ventas dv
+            JOIN productos p ON dv.producto_id = p.id
+            JOIN ventas v ON dv.venta_id = v.id
+            WHERE v.fecha >= %s AND v.fecha < %s
+            GROUP BY dv.producto_id, p.nombre
+        """, get_mexico_date_range(get_mexico_datetime().date())))
+
+    top = sorted(acumulado.values(), key=lambda item: item['cantidad_vendida'], reverse=True)
+    return top[:limite]
+
+
+def resumen_periodo(fecha_inicio: Optional[Fecha] = None, fecha_fin: Optional[Fecha] = None,
+                    ejecutar: Optional[Ejecutor] = None) -> Dict[str, Any]:
+    """Totales del periodo y desglose por método de pago"""
+    filas = ventas_por_dia(fecha_inicio, fecha_fin, ejecutar)
+
+    por_metodo: Dict[str, Dict[str, Any]] = {}
+    for fila in filas:
+        metodo = por_metodo.setdefault(fila['metodo_pago'], {'metodo': fila['metodo_pago'], 'cantidad': 0, 'total': 0.0})
+        metodo['cantidad'] += fila['num_ventas']
+        metodo['total'] += fila['total']
+
+    num_ventas = sum(fila['num_ventas'] for fila in filas)
+    total = sum(fila['total'] for fila in filas)
+    return {
+        'num_ventas': num_ventas,
+        'total_ventas': round(total, 2),
+        'promedio_venta': round(total / num_ventas, 2) if num_ventas else 0.0,
+        'por_metodo_pago': sorted(por_metodo.values(), key=lambda m: m['total'], reverse=True)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruye el resumen diario de ventas")
+    parser.add_argument('--desde', help="Fecha inicial YYYY-MM-DD (por defecto todo el historial)")
+    parser.add_argument('--hasta', help="Fecha final YYYY-MM-DD (por defecto hoy)")
+    args = parser.parse_args()
+
+    if args.hasta and not args.desde:
+        parser.error("--hasta requiere --desde")
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    print(f"📊 Reconstruyendo resumen diario de ventas ({get_db_type()})...")
+    resultado = reconstruir(args.desde, args.hasta)
+    print(f"✅ {resultado['ventas_diarias']} filas en ventas_diarias, "
+          f"{resultado['ventas_producto_diarias']} filas en ventas_producto_diarias")
+
+
+if __name__ == '__main__':
+    main()
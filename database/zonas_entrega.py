@@ -0,0 +1,294 @@
+"""
+Zonas de entrega (tabla zonas_entrega)
+Cada zona es un polígono [[lat, lng], ...] con su tarifa de envío. La cobertura real
+no es un círculo: el río, la carretera y los fraccionamientos cerrados la recortan.
+
+- Las zonas activas se cargan en un índice por proceso: R-tree STR sobre las cajas
+  de los polígonos y prueba punto-en-polígono solo con las candidatas
+- Se recargan cuando otro proceso las modifica (fila 'zonas_entrega' de
+  cache_versiones, verificada cada ZONAS_VERIFICAR_CADA segundos)
+- Zonas superpuestas: gana la de mayor prioridad. Una zona excluida (p. ej. un
+  fraccionamiento cerrado) deja el punto fuera aunque otra zona lo cubra
+- Sin zonas activas, `zona_de` no aplica (hay_zonas() es False) y la API usa el
+  círculo RADIO_ENTREGA_KM alrededor del negocio
+"""
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import cache_versiones
+from database.connection_dual import (
+    execute_query, execute_update, en_transaccion, get_db_type, transaction, Transaction
+)
+import numpy as np
+
+from utils.geo import caja_poligono, punto_en_poligono, puntos_en_poligono
+from utils.indice_espacial import RTree
+
+logger = logging.getLogger(__name__)
+
+ZONAS_VERIFICAR_CADA = float(os.getenv('ZONAS_VERIFICAR_CADA', '5'))  # segundos
+
+_schema_state = {'ready': False}
+
+_cache = {
+    'indice': None,         # _IndiceZonas
+    'version': None,
+    'verificado_en': 0.0,
+    'lock': threading.Lock()
+}
+
+
+@dataclass
+class ZonaEntrega:
+    id: Optional[int] = None
+    nombre: str = ""
+    poligono: List[Tuple[float, float]] = field(default_factory=list)
+    tarifa: float = 0.0
+    prioridad: int = 0
+    excluida: bool = False
+    activa: bool = True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'nombre': self.nombre,
+            'poligono': [list(punto) for punto in self.poligono],
+            'tarifa': self.tarifa,
+            'prioridad': self.prioridad,
+            'excluida': self.excluida,
+            'activa': self.activa
+        }
+
+    @classmethod
+    def desde_dict(cls, data: Dict[str, Any], id: Optional[int] = None) -> 'ZonaEntrega':
+        """Zona a partir del JSON de la API; lanza ValueError si el polígono no es válido"""
+        nombre = str(data.get('nombre') or '').strip()
+        if not nombre:
+            raise ValueError("La zona necesita un nombre")
+        return cls(
+            id=id,
+            nombre=nombre,
+            poligono=validar_poligono(data.get('poligono')),
+            tarifa=float(data.get('tarifa') or 0),
+            prioridad=int(data.get('prioridad') or 0),
+            excluida=bool(data.get('excluida', False)),
+            activa=bool(data.get('activa', True))
+        )
+
+    @classmethod
+    def desde_fila(cls, row: Dict[str, Any]) -> 'ZonaEntrega':
+        return cls(
+            id=row['id'],
+            nombre=row['nombre'],
+            poligono=[tuple(punto) for punto in json.loads(row['poligono'])],
+            tarifa=float(row['tarifa'] or 0),
+            prioridad=int(row['prioridad'] or 0),
+            excluida=bool(row['excluida']),
+            activa=bool(row['activa'])
+        )
+
+
+def validar_poligono(poligono) -> List[Tuple[float, float]]:
+    """[[lat, lng], ...] con al menos 3 vértices distintos y coordenadas válidas"""
+    if not isinstance(poligono, list):
+        raise ValueError("El polígono debe ser una lista de puntos [lat, lng]")
+    try:
+        puntos = [(float(p[0]), float(p[1])) for p in poligono]
+    except (TypeError, ValueError, IndexError):
+        raise ValueError("El polígono debe ser una lista de puntos [lat, lng]")
+    if len(puntos) > 1 and puntos[0] == puntos[-1]:
+        puntos.pop()  # polígono cerrado: el último vértice repite el primero
+    if len(set(puntos)) < 3:
+        raise ValueError("El polígono necesita al menos 3 vértices")
+    if any(not (-90 <= lat <= 90 and -180 <= lng <= 180) for lat, lng in puntos):
+        raise ValueError("Coordenadas fuera de rango en el polígono")
+    return puntos
+
+
+# ============================================================================
+# Tabla
+# ============================================================================
+
+def _asegurar_tabla():
+    """Crea la tabla de zonas si no existe (una vez por proceso)"""
+    if _schema_state['ready']:
+        return
+    columna_id = 'id SERIAL PRIMARY KEY' if get_db_type() == 'postgres' else 'id INTEGER PRIMARY KEY AUTOINCREMENT'
+    execute_update(f"""
+        CREATE TABLE IF NOT EXISTS zonas_entrega (
+            {columna_id},
+            nombre VARCHAR(100) NOT NULL,
+            poligono TEXT NOT NULL,
+            tarifa DECIMAL(10,2) NOT NULL DEFAULT 0,
+            prioridad INTEGER NOT NULL DEFAULT 0,
+            excluida BOOLEAN NOT NULL DEFAULT FALSE,
+            activa BOOLEAN NOT NULL DEFAULT TRUE,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Ver cache_versiones._asegurar_tabla
+    _schema_state['ready'] = not en_transaccion()
+
+
+def listar(solo_activas: bool = False) -> List[ZonaEntrega]:
+    _asegurar_tabla()
+    query = "SELECT id, nombre, poligono, tarifa, prioridad, excluida, activa FROM zonas_entrega"
+    if solo_activas:
+        query += " WHERE activa = TRUE"
+    rows = execute_query(query + " ORDER BY prioridad DESC, id")
+    return [ZonaEntrega.desde_fila(row) for row in rows]
+
+
+def guardar(zona: ZonaEntrega) -> int:
+    """Inserta o actualiza la zona e invalida el índice en todos los workers (una transacción)"""
+    _asegurar_tabla()
+    params = (zona.nombre, json.dumps([list(p) for p in zona.poligono]), zona.tarifa,
+              zona.prioridad, zona.excluida, zona.activa)
+    with transaction() as tx:
+        if zona.id is None:
+            zona_id = tx.execute_insert("""
+                INSERT INTO zonas_entrega (nombre, poligono, tarifa, prioridad, excluida, activa)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """, params)
+        elif tx.execute_update("""
+                UPDATE zonas_entrega
+                SET nombre = %s, poligono = %s, tarifa = %s, prioridad = %s, excluida = %s, activa = %s
+                WHERE id = %s
+            """, params + (zona.id,)):
+            zona_id = zona.id
+        else:
+            raise LookupError(f"Zona {zona.id} no encontrada")
+        invalidar(tx)
+    zona.id = zona_id
+    return zona_id
+
+
+def eliminar(zona_id: int) -> bool:
+    _asegurar_tabla()
+    with transaction() as tx:
+        borradas = tx.execute_update("DELETE FROM zonas_entrega WHERE id = %s", (zona_id,))
+        if borradas:
+            invalidar(tx)
+    return bool(borradas)
+
+
+# ============================================================================
+# Índice en memoria
+# ============================================================================
+
+def _precedencia(zona: ZonaEntrega):
+    """Mayor prioridad primero; a igual prioridad la exclusión gana"""
+    return -zona.prioridad, not zona.excluida, zona.id or 0
+
+
+class _IndiceZonas:
+    def __init__(self, zonas: List[ZonaEntrega]):
+        self.zonas = zonas
+        self.cajas = [caja_poligono(zona.poligono) for zona in zonas]
+        self.rtree = RTree(self.cajas)
+        self.por_precedencia = sorted(range(len(zonas)), key=lambda i: _precedencia(zonas[i]))
+
+    def zonas_en(self, lat: float, lng: float) -> List[ZonaEntrega]:
+        """Zonas que contienen el punto, de mayor a menor prioridad"""
+        zonas = [self.zonas[i] for i in self.rtree.buscar(lat, lng)
+                 if punto_en_poligono(lat, lng, self.zonas[i].poligono)]
+        zonas.sort(key=_precedencia)
+        return zonas
+
+    def zonas_de_lote(self, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+        """
+        Posición (en self.zonas) de la zona que decide cada punto, o -1 si ninguna lo
+        contiene. Recorre las zonas por precedencia una sola vez: los candidatos de
+        cada zona salen de una búsqueda binaria por latitud sobre los puntos ordenados
+        y la prueba punto-en-polígono es vectorizada.
+        """
+        resultado = np.full(lats.shape, -1, dtype=np.int64)
+        orden = np.argsort(lats, kind='stable')
+        lats_ordenadas = lats[orden]
+        for i in self.por_precedencia:
+            lat_min, lat_max, lng_min, lng_max = self.cajas[i]
+            inicio = np.searchsorted(lats_ordenadas, lat_min, side='left')
+            fin = np.searchsorted(lats_ordenadas, lat_max, side='right')
+            candidatos = orden[inicio:fin]
+            candidatos = candidatos[(resultado[candidatos] == -1)
+                                    & (lngs[candidatos] >= lng_min) & (lngs[candidatos] <= lng_max)]
+            if candidatos.size:
+                dentro = puntos_en_poligono(lats[candidatos], lngs[candidatos], self.zonas[i].poligono)
+                resultado[candidatos[dentro]] = i
+        return resultado
+
+
+def _version() -> Optional[int]:
+    try:
+        return cache_versiones.get_version(cache_versiones.ZONAS_ENTREGA)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer la versión de zonas de entrega: {e}")
+        return None
+
+
+def _indice() -> _IndiceZonas:
+    ahora = time.monotonic()
+    indice = _cache['indice']
+    if indice is not None and ahora - _cache['verificado_en'] < ZONAS_VERIFICAR_CADA:
+        return indice
+
+    version = _version()
+    if indice is not None and version is not None and version == _cache['version']:
+        _cache['verificado_en'] = ahora
+        return indice
+
+    with _cache['lock']:
+        try:
+            zonas = listar(solo_activas=True)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron leer las zonas de entrega: {e}")
+            zonas = []
+        indice = _IndiceZonas(zonas)
+        _cache['indice'] = indice
+        _cache['version'] = version
+        _cache['verificado_en'] = time.monotonic()
+    if zonas:
+        logger.info(f"🗺️ {len(zonas)} zona(s) de entrega indexadas (R-tree de altura {indice.rtree.altura})")
+    return indice
+
+
+def hay_zonas() -> bool:
+    """True si hay zonas activas (si no, la cobertura es el radio de entrega)"""
+    return bool(_indice().zonas)
+
+
+def zona_de(lat: float, lng: float) -> Optional[ZonaEntrega]:
+    """Zona que atiende el punto, o None si queda fuera (o en una zona excluida)"""
+    zonas = _indice().zonas_en(lat, lng)
+    if not zonas or zonas[0].excluida:
+        return None
+    return zonas[0]
+
+
+def zonas_de_lote(lats: np.ndarray, lngs: np.ndarray) -> List[Optional[ZonaEntrega]]:
+    """zona_de para arreglos de puntos (validación por lote)"""
+    indice = _indice()
+    zonas = indice.zonas
+    return [
+        None if posicion < 0 or zonas[posicion].excluida else zonas[posicion]
+        for posicion in indice.zonas_de_lote(lats, lngs).tolist()
+    ]
+
+
+def invalidar(tx: Optional[Transaction] = None):
+    """Descarta el índice en este proceso y, vía cache_versiones, en los demás"""
+    with _cache['lock']:
+        _cache['indice'] = None
+        _cache['version'] = None
+    try:
+        cache_versiones.incrementar_version(cache_versiones.ZONAS_ENTREGA, tx)
+    except Exception as e:
+        if tx is not None:
+            raise
+        logger.warning(f"⚠️ No se pudo propagar la invalidación de zonas de entrega: {e}")
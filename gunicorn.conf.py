@@ -1,4 +1,7 @@
-workers = 2
+# Workers sync: una exportación ZIP de tickets (/api/tickets/export) ocupa uno durante
+# toda la descarga y cada cupo de renderizado (RENDER_CUPOS) puede retener otro esperando
+# cupo. Para que siempre quede uno libre para vender: workers >= RENDER_CUPOS + 2
+workers = 3
 worker_class = 'sync'
 worker_connections = 1000
 timeout = 120
@@ -7,3 +10,28 @@ bind = '0.0.0.0:5000'
 errorlog = '-'
 accesslog = '-'
 loglevel = 'info'
+
+
+def on_starting(server):
+    """Borrar métricas de ejecuciones anteriores antes de crear los workers"""
+    from utils.metrics import limpiar_directorio
+    limpiar_directorio()
+
+
+def when_ready(server):
+    """Avisar si con esta cantidad de workers una exportación puede dejar sin worker a las ventas"""
+    from utils.render_service import RENDER_CUPOS
+    minimo = RENDER_CUPOS + 2
+    if server.cfg.workers < minimo:
+        server.log.warning(
+            f"⚠️ {server.cfg.workers} workers: durante una exportación de tickets las ventas pueden "
+            f"esperar a que se libere un worker (se recomiendan al menos {minimo})"
+        )
+
+
+def worker_exit(server, worker):
+    """Cerrar las conexiones del pool y el pool de renderizado del worker al terminar"""
+    from database.connection_dual import close_pool
+    from utils.render_service import cerrar
+    close_pool()
+    cerrar()
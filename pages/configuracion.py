@@ -5,6 +5,7 @@ Sistema MiChaska - PostgreSQL Directo
 import streamlit as st
 from datetime import datetime
 from database.connection_optimized import get_db_adapter
+from database import configuracion
 
 def show_configuracion():
     """Mostrar configuración del sistema optimizada para tablets"""
@@ -72,11 +73,7 @@ def configuracion_negocio(adapter):
     st.markdown("**🏢 Información del Negocio**")
     
     # Obtener configuración actual
-    try:
-        config_items = adapter.execute_query("SELECT clave, valor, descripcion FROM configuracion ORDER BY clave")
-        config_dict = {item['clave']: item['valor'] for item in config_items}
-    except:
-        config_dict = {}
+    config_dict = configuracion.get_todas()
     
     with st.form("config_negocio_form"):
         nombre_negocio = st.text_input(
@@ -157,6 +154,9 @@ def actualizar_configuracion_negocio(adapter, config_data):
                     'fecha_modificacion': datetime.now()
                 })
         
+        # Los tickets leen la configuración desde cache: invalidarla en todos los procesos
+        configuracion.invalidar()
+        
         st.success("✅ Configuración actualizada exitosamente")
         st.rerun()
     
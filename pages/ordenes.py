@@ -6,6 +6,7 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, date, timedelta
 from database.connection_optimized import get_db_adapter
+from utils.timezone_utils import get_mexico_date_range
 
 def show_ordenes():
     """Mostrar gestión de órdenes/ventas optimizada para tablets"""
@@ -375,20 +376,14 @@ def analisis_ventas(adapter):
             key="analisis_fecha_hasta"
         )
     
-    # Obtener datos para análisis
-    ventas_analisis = adapter.execute_query("""
-        SELECT 
-            DATE(fecha) as dia,
-            COUNT(*) as num_ventas,
-            SUM(total) as ingresos_dia,
-            AVG(total) as promedio_venta,
-            metodo_pago,
-            vendedor
-        FROM ventas
-        WHERE fecha BETWEEN %s AND %s
-        GROUP BY DATE(fecha), metodo_pago, vendedor
-        ORDER BY dia DESC
-    """, (fecha_desde_analisis.strftime('%Y-%m-%d'), fecha_hasta_analisis.strftime('%Y-%m-%d')))
+    # Obtener datos para análisis (resumen diario; solo hoy se agrega desde ventas)
+    ventas_analisis = [{
+        'dia': fila['dia'],
+        'num_ventas': fila['num_ventas'],
+        'ingresos_dia': fila['total'],
+        'promedio_venta': fila['total'] / fila['num_ventas'] if fila['num_ventas'] else 0.0,
+        'metodo_pago': fila['metodo_pago']
+    } for fila in adapter.get_ventas_por_dia(fecha_desde_analisis, fecha_hasta_analisis)]
     
     if ventas_analisis:
         df_analisis = pd.DataFrame(ventas_analisis)
@@ -438,11 +433,18 @@ def analisis_ventas(adapter):
         st.markdown("---")
         st.markdown("**👤 Análisis por Vendedor:**")
         
-        vendedores_stats = df_analisis.groupby('vendedor').agg({
-            'num_ventas': 'sum',
-            'ingresos_dia': 'sum',
-            'promedio_venta': 'mean'
-        }).reset_index()
+        # El resumen diario no tiene dimensión de vendedor: se agrega desde ventas
+        inicio, fin = get_mexico_date_range(fecha_desde_analisis, fecha_hasta_analisis)
+        vendedores_stats = pd.DataFrame(adapter.execute_query("""
+            SELECT 
+                vendedor,
+                COUNT(*) as num_ventas,
+                SUM(total) as ingresos_dia,
+                AVG(total) as promedio_venta
+            FROM ventas
+            WHERE fecha >= %s AND fecha < %s AND vendedor IS NOT NULL
+            GROUP BY vendedor
+        """, (inicio, fin)), columns=['vendedor', 'num_ventas', 'ingresos_dia', 'promedio_venta'])
         
         vendedores_stats = vendedores_stats.sort_values('ingresos_dia', ascending=False)
         
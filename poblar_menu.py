@@ -3,28 +3,40 @@
 """
 Script para poblar la base de datos con el menú completo de Mi Chas-K
 """
-import os
-import sqlite3
-from datetime import datetime
+import sys
+from database.connection_dual import execute_query, transaction, get_db_type, SQLITE_DB_PATH
+from database import cache_versiones, resumen_ventas
 
 def poblar_menu_michaska():
     """Crea el menú completo de Mi Chas-K"""
     
-    db_path = os.path.join(os.path.dirname(__file__), 'database', 'michaska_local.db')
-    print(f"📂 Base de datos: {db_path}\n")
+    if get_db_type() == 'postgres' and '--permitir-postgres' not in sys.argv:
+        print("⛔ DATABASE_URL apunta a PostgreSQL: este script BORRA ventas, productos y vendedores.")
+        print("   Ejecuta con --permitir-postgres si realmente quieres hacerlo.")
+        return
     
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    if get_db_type() == 'sqlite':
+        print(f"📂 Base de datos: {SQLITE_DB_PATH}\n")
+    else:
+        print("📂 Base de datos: PostgreSQL\n")
+    
+    with transaction() as tx:
+        poblar_en_transaccion(tx)
+    
+    mostrar_resumen()
+
+def poblar_en_transaccion(tx):
+    """Limpia y carga categorías, productos y vendedores en una sola transacción"""
     
     # Limpiar datos existentes
     print("🧹 Limpiando datos existentes...")
-    cursor.execute("DELETE FROM detalle_ventas")
-    cursor.execute("DELETE FROM entregas")
-    cursor.execute("DELETE FROM ventas")
-    cursor.execute("DELETE FROM productos")
-    cursor.execute("DELETE FROM categorias")
-    cursor.execute("DELETE FROM vendedores")
-    conn.commit()
+    tx.execute("DELETE FROM detalle_ventas")
+    tx.execute("DELETE FROM entregas")
+    tx.execute("DELETE FROM ventas")
+    resumen_ventas.vaciar(tx)  # sin ventas, el resumen diario también queda vacío
+    tx.execute("DELETE FROM productos")
+    tx.execute("DELETE FROM categorias")
+    tx.execute("DELETE FROM vendedores")
     print("   ✅ Datos limpiados\n")
     
     # Categorías del menú
@@ -37,15 +49,15 @@ def poblar_menu_michaska():
         ('Especialidades', 'Platillos especiales y combinaciones')
     ]
     
-    cursor.executemany(
-        "INSERT INTO categorias (nombre, descripcion) VALUES (?, ?)",
-        categorias
+    categoria_ids = tx.execute_values(
+        "INSERT INTO categorias (nombre, descripcion) VALUES %s RETURNING id",
+        categorias,
+        returning=True
     )
     print(f"   ✅ {len(categorias)} categorías insertadas\n")
     
-    # Obtener IDs de categorías
-    cursor.execute("SELECT id, nombre FROM categorias")
-    cats = {nombre: id for id, nombre in cursor.fetchall()}
+    # IDs de categorías (RETURNING id, en el mismo orden de inserción)
+    cats = {nombre: cat_id for (nombre, _), cat_id in zip(categorias, categoria_ids)}
     
     # Productos del menú
     print("🍴 Insertando productos del menú...")
@@ -93,8 +105,8 @@ def poblar_menu_michaska():
         ('Sabrimaruchan Deluxe', 'Sabrimaruchan con ingredientes premium', 140.00, 50, cats['Especialidades']),
     ]
     
-    cursor.executemany(
-        "INSERT INTO productos (nombre, descripcion, precio, stock, categoria_id) VALUES (?, ?, ?, ?, ?)",
+    tx.execute_values(
+        "INSERT INTO productos (nombre, descripcion, precio, stock, categoria_id) VALUES %s",
         productos
     )
     print(f"   ✅ {len(productos)} productos insertados\n")
@@ -108,13 +120,17 @@ def poblar_menu_michaska():
         ('Carlos', 'Ramírez', 'carlos@michaska.com', '449-333-3333'),
     ]
     
-    cursor.executemany(
-        "INSERT INTO vendedores (nombre, apellido, email, telefono) VALUES (?, ?, ?, ?)",
+    tx.execute_values(
+        "INSERT INTO vendedores (nombre, apellido, email, telefono) VALUES %s",
         vendedores
     )
     print(f"   ✅ {len(vendedores)} vendedores insertados\n")
     
-    conn.commit()
+    # Catálogo nuevo: los workers de Flask descartan su cache en memoria
+    cache_versiones.incrementar_version(cache_versiones.CATALOGO, tx)
+
+def mostrar_resumen():
+    """Muestra el resumen del menú cargado"""
     
     # Mostrar resumen
     print("=" * 60)
@@ -122,29 +138,27 @@ def poblar_menu_michaska():
     print("=" * 60)
     
     # Mostrar productos por categoría
-    cursor.execute("""
+    resumen = execute_query("""
         SELECT c.nombre, COUNT(p.id) as total, 
                MIN(p.precio) as min_precio, MAX(p.precio) as max_precio
         FROM categorias c
         LEFT JOIN productos p ON c.id = p.categoria_id
-        GROUP BY c.nombre
+        GROUP BY c.id, c.nombre
         ORDER BY c.id
     """)
     
     print("\n📊 Resumen del menú:\n")
-    for cat_nombre, total, min_precio, max_precio in cursor.fetchall():
-        if total > 0:
-            print(f"   {cat_nombre}:")
-            print(f"      • {total} productos")
-            print(f"      • Precios: ${min_precio:.2f} - ${max_precio:.2f}\n")
+    for row in resumen:
+        if row['total'] > 0:
+            print(f"   {row['nombre']}:")
+            print(f"      • {row['total']} productos")
+            print(f"      • Precios: ${float(row['min_precio']):.2f} - ${float(row['max_precio']):.2f}\n")
     
     # Total
-    cursor.execute("SELECT COUNT(*) FROM productos")
-    total_productos = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM vendedores")
-    total_vendedores = cursor.fetchone()[0]
+    total_productos = execute_query("SELECT COUNT(*) as total FROM productos")[0]['total']
+    total_vendedores = execute_query("SELECT COUNT(*) as total FROM vendedores")[0]['total']
     
-    print(f"📦 Total: {total_productos} productos en {len(categorias)} categorías")
+    print(f"📦 Total: {total_productos} productos en {len(resumen)} categorías")
     print(f"👥 Total: {total_vendedores} vendedores\n")
     
     print("📍 Ubicación del negocio:")
@@ -152,9 +166,6 @@ def poblar_menu_michaska():
     print("   Villas de Ntra. Sra. de la Asunción")
     print("   20126 Aguascalientes, Ags.\n")
     
-    cursor.close()
-    conn.close()
-    
     print("✅ ¡Listo para vender! 🚀")
 
 if __name__ == '__main__':
@@ -2,24 +2,39 @@
 MiChaska - Sistema de Facturación y POS
 Flask Backend API con geolocalización para entregas locales
 """
-from flask import Flask, request, jsonify, render_template, send_file
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
 from datetime import datetime, date, timedelta
 import os
 from dotenv import load_dotenv
 import logging
 from decimal import Decimal
-import math
+import numpy as np
+import hmac
+import hashlib
+import csv
+import io
+import json
 
 # Importaciones del proyecto
 from database.models import (
     Producto, Venta, DetalleVenta, Categoria, GastoDiario, 
-    CorteCaja, Vendedor, Carrito, ItemCarrito
+    CorteCaja, Vendedor, Carrito, ItemCarrito, StockInsuficienteError, get_catalogo_cache_stats
 )
 # Usar conexión dual (SQLite local / PostgreSQL producción)
-from database.connection_dual import execute_query, execute_update, execute_insert, get_db_type, test_connection
-from utils.pdf_generator import TicketGenerator
-from utils.timezone_utils import get_mexico_datetime, format_mexico_datetime
+from database.connection_dual import (
+    execute_query, execute_update, execute_insert, get_db_type, test_connection, get_pool_stats, transaction, stream_query,
+    init_app as init_db
+)
+from database import resumen_ventas, query_stats
+from database import configuracion as servicio_configuracion
+from database import zonas_entrega
+from utils import gazetteer, geo, geocoding, metrics, render_service, request_timing, ticket_cache
+from utils.pdf_generator import TicketGenerator, renderizar_ticket
+from utils.pdf_generator_old import renderizar_reporte_diario
+from utils.escpos_generator import EscPosTicketGenerator, COLUMNAS_SOPORTADAS
+from utils.zip_stream import ZipEnStream
+from utils.timezone_utils import get_mexico_datetime, format_mexico_datetime, get_mexico_date_range
 
 # Cargar variables de entorno
 load_dotenv()
@@ -44,6 +59,66 @@ app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
 # Habilitar CORS
 CORS(app)
 
+# Una conexión de base de datos por request (commit/rollback en teardown)
+init_db(app)
+
+# Totales de consultas por request (ver /api/debug/queries)
+query_stats.init_app(app)
+DEBUG_TOKEN = os.getenv('DEBUG_TOKEN')
+
+# Métricas Prometheus agregadas entre workers (ver /metrics)
+metrics.init_app(app)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+def _metricas_proceso():
+    """Pool de conexiones, cache del catálogo y consultas SQL de este worker"""
+    pool = get_pool_stats()
+    en_uso = pool.get('in_use', 0)
+    yield ('gauge', 'db_pool_connections', {'state': 'in_use'}, en_uso)
+    yield ('gauge', 'db_pool_connections', {'state': 'idle'}, pool.get('idle', pool.get('size', 0) - en_uso))
+    yield ('counter', 'db_pool_checkouts_total', {}, pool.get('checkouts', 0))
+    yield ('counter', 'db_pool_waits_total', {}, pool.get('waits', 0))
+    yield ('counter', 'db_pool_timeouts_total', {}, pool.get('timeouts', 0))
+    
+    catalogo = get_catalogo_cache_stats()
+    yield ('counter', 'cache_hits_total', {'cache': 'catalogo'}, catalogo['hits'])
+    yield ('counter', 'cache_misses_total', {'cache': 'catalogo'}, catalogo['misses'])
+    
+    config = servicio_configuracion.get_cache_stats()
+    yield ('counter', 'cache_hits_total', {'cache': 'configuracion'}, config['hits'])
+    yield ('counter', 'cache_misses_total', {'cache': 'configuracion'}, config['misses'])
+    
+    tickets = ticket_cache.get_cache_stats()
+    yield ('counter', 'cache_hits_total', {'cache': 'tickets'}, tickets['memoria'] + tickets['disco'])
+    yield ('counter', 'cache_misses_total', {'cache': 'tickets'}, tickets['fallos'])
+    yield ('gauge', 'ticket_cache_bytes', {}, tickets['bytes'])
+    
+    geo = geocoding.get_cache_stats()
+    yield ('counter', 'cache_hits_total', {'cache': 'geocoding'}, geo['memoria'] + geo['disco'])
+    yield ('counter', 'cache_misses_total', {'cache': 'geocoding'}, geo['fallos'])
+    yield ('counter', 'cache_hits_total', {'cache': 'geocoding_reversa'}, geo['reversa_celda'] + geo['reversa_vecina'])
+    yield ('counter', 'cache_misses_total', {'cache': 'geocoding_reversa'}, geo['reversa_fallos'])
+    yield ('counter', 'geocoding_reversa_vecina_total', {}, geo['reversa_vecina'])
+    yield ('counter', 'geocoding_upstream_requests_total', {}, geo['upstream'])
+    yield ('counter', 'geocoding_limited_total', {}, geo['limitadas'])
+    
+    local = gazetteer.get_stats()
+    yield ('counter', 'gazetteer_busquedas_total', {'resultado': 'acierto'}, local['aciertos'])
+    yield ('counter', 'gazetteer_busquedas_total', {'resultado': 'fallo'}, local['fallos'])
+    yield ('gauge', 'gazetteer_entradas', {}, local['entradas'])
+    
+    yield ('counter', 'db_queries_total', {}, query_stats.total_consultas())
+    
+    render = render_service.get_stats()
+    for resultado in ('ok', 'rechazados', 'timeouts', 'errores'):
+        yield ('counter', 'render_jobs_total', {'resultado': resultado}, render[resultado])
+    yield ('gauge', 'render_jobs_en_curso', {}, render['en_curso'])
+
+metrics.registrar_colector(_metricas_proceso)
+
+# Server-Timing / X-Query-Count en respuestas de la API (SERVER_TIMING_SAMPLE_RATE)
+request_timing.init_app(app)
+
 # Configuración de ubicación del negocio (para entregas locales)
 UBICACION_NEGOCIO = {
     'lat': float(os.getenv('BUSINESS_LAT', '21.8853')),  # Aguascalientes
@@ -51,6 +126,11 @@ UBICACION_NEGOCIO = {
     'direccion': os.getenv('BUSINESS_ADDRESS', 'Av. Valle de Los Romeros & Federico Méndez, Villas de Ntra. Sra. de la Asunción, 20126 Aguascalientes, Ags.')
 }
 RADIO_ENTREGA_KM = float(os.getenv('MAX_DELIVERY_DISTANCE_KM', '10'))  # Radio de entrega en kilómetros
+TARIFA_ENTREGA = float(os.getenv('DELIVERY_FEE', '0'))  # Tarifa de envío cuando no hay zonas de entrega
+VALIDAR_LOTE_MAX = int(os.getenv('VALIDAR_LOTE_MAX', '50000'))  # Puntos por petición de validación por lote
+
+# Ancho por defecto de los tickets ESC/POS (32 = 58mm, 42/48 = 80mm)
+ESCPOS_COLUMNAS = int(os.getenv('ESCPOS_COLUMNAS', '48'))
 
 # Helper para convertir objetos a dict
 def safe_float(value):
@@ -91,18 +171,31 @@ def venta_to_dict(venta):
 def calcular_distancia(lat1, lng1, lat2, lng2):
     """
     Calcula la distancia en kilómetros entre dos puntos usando la fórmula de Haversine
+    (mismo kernel vectorizado que la validación por lote)
     """
-    R = 6371  # Radio de la Tierra en km
-    
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lng = math.radians(lng2 - lng1)
-    
-    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lng/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    
-    return R * c
+    return geo.distancia_km(lat1, lng1, lat2, lng2)
+
+def cobertura_entrega(lat, lng):
+    """
+    Cobertura de entrega de un punto: la zona de entrega que lo contiene (polígonos de
+    zonas_entrega) o, si no hay zonas definidas, el círculo de RADIO_ENTREGA_KM
+    """
+    distancia = calcular_distancia(UBICACION_NEGOCIO['lat'], UBICACION_NEGOCIO['lng'], lat, lng)
+    if zonas_entrega.hay_zonas():
+        zona = zonas_entrega.zona_de(lat, lng)
+        return {
+            'dentro_rango': zona is not None,
+            'distancia_km': distancia,
+            'zona': {'id': zona.id, 'nombre': zona.nombre} if zona else None,
+            'tarifa_entrega': zona.tarifa if zona else None
+        }
+    dentro_rango = distancia <= RADIO_ENTREGA_KM
+    return {
+        'dentro_rango': dentro_rango,
+        'distancia_km': distancia,
+        'zona': None,
+        'tarifa_entrega': TARIFA_ENTREGA if dentro_rango else None
+    }
 
 # ============================================================================
 # RUTAS PRINCIPALES
@@ -354,12 +447,13 @@ def get_venta(venta_id):
         venta_data['descuento'] = safe_float(venta_data.get('descuento', 0))
         venta_data['impuestos'] = safe_float(venta_data.get('impuestos', 0))
         
-        # Obtener detalles
+        # Obtener detalles y sus productos en una sola consulta
         detalles = DetalleVenta.get_by_venta(venta_id)
+        productos = Producto.get_many(d.producto_id for d in detalles)
         venta_data['detalles'] = []
         
         for detalle in detalles:
-            producto = Producto.get_by_id(detalle.producto_id)
+            producto = productos.get(detalle.producto_id)
             venta_data['detalles'].append({
                 'producto_id': detalle.producto_id,
                 'producto_nombre': producto.nombre if producto else 'Producto no encontrado',
@@ -376,6 +470,76 @@ def get_venta(venta_id):
         logger.error(f"Error obteniendo venta: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+EXPORT_FILAS_POR_ENVIO = 500  # filas por fragmento de la respuesta
+
+def _valor_export(valor):
+    """Decimal y fechas a tipos serializables en CSV/NDJSON"""
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return valor
+
+def _export_csv(filas):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    pendientes = 0
+    for numero, fila in enumerate(filas):
+        if numero == 0:
+            writer.writerow(fila.keys())
+        writer.writerow('' if v is None else _valor_export(v) for v in fila.values())
+        pendientes += 1
+        if pendientes >= EXPORT_FILAS_POR_ENVIO:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _export_ndjson(filas):
+    lineas = []
+    for fila in filas:
+        lineas.append(json.dumps({k: _valor_export(v) for k, v in fila.items()}, ensure_ascii=False))
+        if len(lineas) >= EXPORT_FILAS_POR_ENVIO:
+            yield '\n'.join(lineas) + '\n'
+            lineas = []
+    if lineas:
+        yield '\n'.join(lineas) + '\n'
+
+@app.route('/api/ventas/export', methods=['GET'])
+def exportar_ventas():
+    """
+    Exporta ventas en streaming (?format=csv|ndjson, opcional ?fecha_inicio=&fecha_fin=)
+    Las filas se leen con un cursor del lado del servidor y se envían por fragmentos:
+    la memoria no crece con el número de ventas.
+    """
+    formato = request.args.get('format', 'csv').lower()
+    if formato not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'error': 'Formato no soportado (csv o ndjson)'}), 400
+    
+    query = "SELECT * FROM ventas"
+    params = ()
+    fecha_inicio = request.args.get('fecha_inicio')
+    if fecha_inicio:
+        try:
+            params = get_mexico_date_range(fecha_inicio, request.args.get('fecha_fin') or fecha_inicio)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Fecha inválida (usar YYYY-MM-DD)'}), 400
+        query += " WHERE fecha >= %s AND fecha < %s"
+    query += " ORDER BY id"
+    
+    filas = stream_query(query, params)
+    if formato == 'csv':
+        cuerpo, mimetype = _export_csv(filas), 'text/csv'
+    else:
+        cuerpo, mimetype = _export_ndjson(filas), 'application/x-ndjson'
+    
+    # stream_with_context: la conexión del request se libera (teardown) al terminar el envío
+    response = Response(stream_with_context(cuerpo), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=ventas.{formato}'
+    return response
+
 @app.route('/api/ventas', methods=['POST'])
 def crear_venta():
     """
@@ -400,63 +564,80 @@ def crear_venta():
         # Crear carrito temporal
         carrito = Carrito()
         
-        # Agregar productos al carrito
-        for item in items:
-            producto = Producto.get_by_id(item['producto_id'])
+        # Agregar productos al carrito (todos los productos en una sola consulta)
+        try:
+            producto_ids = [int(item['producto_id']) for item in items]
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'Cada producto debe tener un producto_id numérico'}), 400
+        productos = Producto.get_many(producto_ids)
+        for item, producto_id in zip(items, producto_ids):
+            producto = productos.get(producto_id)
             if not producto:
                 return jsonify({'success': False, 'error': f'Producto {item["producto_id"]} no encontrado'}), 404
             
-            if producto.stock < item['cantidad']:
-                return jsonify({'success': False, 'error': f'Stock insuficiente para {producto.nombre}'}), 400
-            
+            # El stock se verifica y descuenta de forma atómica al procesar la venta
             carrito.agregar_producto(producto, item['cantidad'])
         
         # Validar entrega local si aplica
         es_entrega = data.get('es_entrega', False)
         distancia = None
+        cobertura = None
         
         if es_entrega:
             direccion = data.get('direccion_entrega')
             if not direccion or 'lat' not in direccion or 'lng' not in direccion:
                 return jsonify({'success': False, 'error': 'Dirección de entrega incompleta'}), 400
             
-            # Calcular distancia
-            distancia = calcular_distancia(
-                UBICACION_NEGOCIO['lat'], UBICACION_NEGOCIO['lng'],
-                float(direccion['lat']), float(direccion['lng'])
-            )
+            # Zona de entrega (o radio de entrega si no hay zonas)
+            cobertura = cobertura_entrega(float(direccion['lat']), float(direccion['lng']))
+            distancia = cobertura['distancia_km']
             
-            if distancia > RADIO_ENTREGA_KM:
+            if not cobertura['dentro_rango']:
+                area = 'las zonas de entrega' if zonas_entrega.hay_zonas() else f'el área de entrega ({RADIO_ENTREGA_KM}km)'
                 return jsonify({
                     'success': False, 
-                    'error': f'La dirección está fuera del área de entrega ({RADIO_ENTREGA_KM}km). Distancia: {distancia:.2f}km'
+                    'error': f'La dirección está fuera de {area}. Distancia: {distancia:.2f}km'
                 }), 400
         
-        # Procesar venta
-        venta = carrito.procesar_venta(
-            metodo_pago=data.get('metodo_pago', 'Efectivo'),
-            vendedor=data.get('vendedor', ''),
-            observaciones=data.get('observaciones', '')
-        )
-        
-        if not venta:
-            return jsonify({'success': False, 'error': 'Error procesando la venta'}), 500
+        # Procesar venta, detalle, stock y entrega en una sola transacción
+        num_items = sum(item.cantidad for item in carrito.items)
+        try:
+            with transaction() as tx:
+                venta = carrito.procesar_venta(
+                    metodo_pago=data.get('metodo_pago', 'Efectivo'),
+                    vendedor=data.get('vendedor', ''),
+                    observaciones=data.get('observaciones', ''),
+                    tx=tx
+                )
+                
+                if not venta:
+                    # Salir con excepción para que la transacción haga rollback (un return confirmaría)
+                    raise RuntimeError('Error procesando la venta')
+                
+                # Si es entrega, guardar información de entrega
+                if es_entrega:
+                    direccion = data['direccion_entrega']
+                    query = """
+                        INSERT INTO entregas (venta_id, direccion, latitud, longitud, distancia_km, estado)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                    """
+                    tx.execute_insert(query, (
+                        venta.id,
+                        direccion.get('direccion_completa', ''),
+                        direccion['lat'],
+                        direccion['lng'],
+                        distancia,
+                        'Pendiente'
+                    ))
+        except StockInsuficienteError as e:
+            # La transacción ya hizo rollback: no quedó venta ni stock descontado
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'faltantes': e.faltantes
+            }), 400
         
-        # Si es entrega, guardar información de entrega
-        if es_entrega:
-            direccion = data['direccion_entrega']
-            query = """
-                INSERT INTO entregas (venta_id, direccion, latitud, longitud, distancia_km, estado)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            execute_insert(query, (
-                venta.id,
-                direccion.get('direccion_completa', ''),
-                direccion['lat'],
-                direccion['lng'],
-                distancia,
-                'Pendiente'
-            ))
+        metrics.registrar_venta(num_items, venta.total)
         
         return jsonify({
             'success': True,
@@ -464,7 +645,9 @@ def crear_venta():
             'total': safe_float(venta.total),
             'message': 'Venta procesada exitosamente',
             'es_entrega': es_entrega,
-            'distancia_km': distancia if es_entrega else None
+            'distancia_km': distancia if es_entrega else None,
+            'zona': cobertura['zona'] if es_entrega else None,
+            'tarifa_entrega': cobertura['tarifa_entrega'] if es_entrega else None
         }), 201
         
     except Exception as e:
@@ -486,24 +669,120 @@ def validar_ubicacion():
         lat = float(data['lat'])
         lng = float(data['lng'])
         
-        distancia = calcular_distancia(
-            UBICACION_NEGOCIO['lat'], UBICACION_NEGOCIO['lng'],
-            lat, lng
-        )
-        
-        dentro_rango = distancia <= RADIO_ENTREGA_KM
+        cobertura = cobertura_entrega(lat, lng)
         
         return jsonify({
             'success': True,
-            'dentro_rango': dentro_rango,
-            'distancia_km': round(distancia, 2),
+            'dentro_rango': cobertura['dentro_rango'],
+            'distancia_km': round(cobertura['distancia_km'], 2),
             'radio_maximo_km': RADIO_ENTREGA_KM,
+            'zona': cobertura['zona'],
+            'tarifa_entrega': cobertura['tarifa_entrega'],
             'ubicacion_negocio': UBICACION_NEGOCIO
         })
     except Exception as e:
         logger.error(f"Error validando ubicación: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/entregas/validar-ubicacion/batch', methods=['POST'])
+def validar_ubicacion_lote():
+    """
+    Valida muchas ubicaciones en una sola petición (hasta VALIDAR_LOTE_MAX)
+    Body: {"puntos": [[lat, lng], ...]} o {"puntos": [{"lat": float, "lng": float}, ...]}
+    Respuesta por columnas, en el orden de los puntos: dentro_rango, distancia_km
+    y, si hay zonas de entrega, zona_id y tarifa_entrega
+    """
+    try:
+        puntos = (request.json or {}).get('puntos')
+        if not isinstance(puntos, list) or not puntos:
+            return jsonify({'success': False, 'error': 'Se requiere una lista de puntos'}), 400
+        if len(puntos) > VALIDAR_LOTE_MAX:
+            return jsonify({
+                'success': False,
+                'error': f'Máximo {VALIDAR_LOTE_MAX} puntos por petición (recibidos {len(puntos)})'
+            }), 413
+        
+        try:
+            if isinstance(puntos[0], dict):
+                puntos = [(p['lat'], p['lng']) for p in puntos]
+            coordenadas = np.asarray(puntos, dtype=np.float64)
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'Cada punto debe ser [lat, lng] o {"lat", "lng"}'}), 400
+        if coordenadas.ndim != 2 or coordenadas.shape[1] != 2:
+            return jsonify({'success': False, 'error': 'Cada punto debe ser [lat, lng] o {"lat", "lng"}'}), 400
+        lats, lngs = coordenadas[:, 0], coordenadas[:, 1]
+        invalidos = ~(np.isfinite(lats) & np.isfinite(lngs) & (np.abs(lats) <= 90) & (np.abs(lngs) <= 180))
+        if invalidos.any():
+            return jsonify({
+                'success': False,
+                'error': 'Coordenadas inválidas',
+                'indices_invalidos': np.flatnonzero(invalidos)[:100].tolist()
+            }), 400
+        
+        distancias = geo.haversine_km(UBICACION_NEGOCIO['lat'], UBICACION_NEGOCIO['lng'], lats, lngs)
+        respuesta = {
+            'success': True,
+            'total': int(coordenadas.shape[0]),
+            'radio_maximo_km': RADIO_ENTREGA_KM,
+            'distancia_km': np.round(distancias, 2).tolist()
+        }
+        if zonas_entrega.hay_zonas():
+            zonas = zonas_entrega.zonas_de_lote(lats, lngs)
+            dentro_rango = [zona is not None for zona in zonas]
+            respuesta['zona_id'] = [zona.id if zona else None for zona in zonas]
+            respuesta['tarifa_entrega'] = [zona.tarifa if zona else None for zona in zonas]
+        else:
+            dentro_rango = (distancias <= RADIO_ENTREGA_KM).tolist()
+            respuesta['tarifa_entrega'] = [TARIFA_ENTREGA if dentro else None for dentro in dentro_rango]
+        respuesta['dentro_rango'] = dentro_rango
+        respuesta['dentro'] = sum(dentro_rango)
+        
+        return jsonify(respuesta)
+    except Exception as e:
+        logger.error(f"Error validando ubicaciones por lote: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/entregas/zonas', methods=['GET'])
+def get_zonas_entrega():
+    """Lista las zonas de entrega (polígonos con su tarifa)"""
+    try:
+        zonas = zonas_entrega.listar()
+        return jsonify({'success': True, 'zonas': [zona.to_dict() for zona in zonas]})
+    except Exception as e:
+        logger.error(f"Error obteniendo zonas de entrega: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/entregas/zonas', methods=['POST'])
+@app.route('/api/entregas/zonas/<int:zona_id>', methods=['PUT'])
+def guardar_zona_entrega(zona_id=None):
+    """
+    Crea o actualiza una zona de entrega
+    Body: {"nombre": str, "poligono": [[lat, lng], ...], "tarifa": float,
+           "prioridad": int, "excluida": bool, "activa": bool}
+    """
+    try:
+        zona = zonas_entrega.ZonaEntrega.desde_dict(request.json or {}, id=zona_id)
+        zonas_entrega.guardar(zona)
+        return jsonify({'success': True, 'zona': zona.to_dict()}), 200 if zona_id else 201
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except LookupError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error guardando zona de entrega: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/entregas/zonas/<int:zona_id>', methods=['DELETE'])
+def eliminar_zona_entrega(zona_id):
+    """Elimina una zona de entrega"""
+    try:
+        if not zonas_entrega.eliminar(zona_id):
+            return jsonify({'success': False, 'error': 'Zona no encontrada'}), 404
+        return jsonify({'success': True, 'message': 'Zona eliminada'})
+    except Exception as e:
+        logger.error(f"Error eliminando zona de entrega: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/entregas', methods=['GET'])
 def get_entregas():
     """Obtiene lista de entregas con filtros opcionales"""
@@ -524,8 +803,8 @@ def get_entregas():
             params.append(estado)
         
         if fecha:
-            query += " AND DATE(v.fecha) = %s"
-            params.append(fecha)
+            query += " AND v.fecha >= %s AND v.fecha < %s"
+            params.extend(get_mexico_date_range(fecha))
         
         query += " ORDER BY v.fecha DESC"
         
@@ -638,7 +917,7 @@ def get_venta_detalle(venta_id):
 
 @app.route('/api/direcciones/buscar', methods=['GET'])
 def buscar_direccion():
-    """Busca direcciones usando Nominatim (OpenStreetMap)"""
+    """Busca direcciones usando Nominatim (OpenStreetMap), vía el servicio con cache"""
     try:
         query = request.args.get('q', '')
         
@@ -648,45 +927,19 @@ def buscar_direccion():
                 'error': 'La búsqueda debe tener al menos 3 caracteres'
             }), 400
         
-        import requests
-        
-        # Agregar contexto de Aguascalientes para mejores resultados
-        search_query = f"{query}, Aguascalientes, México"
-        
-        # Usar Nominatim API (OpenStreetMap)
-        url = 'https://nominatim.openstreetmap.org/search'
-        params = {
-            'q': search_query,
-            'format': 'json',
-            'limit': 5,
-            'addressdetails': 1,
-            'countrycodes': 'mx'
-        }
-        headers = {
-            'User-Agent': 'MiChaska-POS/1.0'
-        }
-        
-        response = requests.get(url, params=params, headers=headers, timeout=5)
-        response.raise_for_status()
-        
-        resultados = response.json()
-        
-        # Formatear resultados
-        direcciones = []
-        for r in resultados:
-            direcciones.append({
-                'display_name': r.get('display_name', ''),
-                'lat': float(r.get('lat', 0)),
-                'lon': float(r.get('lon', 0)),
-                'type': r.get('type', ''),
-                'address': r.get('address', {})
-            })
+        # Primero el nomenclátor local (en memoria); Nominatim solo si no hay coincidencias
+        resultados = gazetteer.buscar(query, limite=5)
+        if resultados:
+            return jsonify({'success': True, 'resultados': resultados, 'fuente': 'local'})
         
         return jsonify({
             'success': True,
-            'resultados': direcciones
+            'resultados': geocoding.buscar(query, limite=5),
+            'fuente': 'nominatim'
         })
-    except requests.RequestException as e:
+    except geocoding.LimiteExcedido as e:
+        return _respuesta_limite_geocoding(e)
+    except geocoding.GeocodingError as e:
         logger.error(f"Error en búsqueda de direcciones: {e}")
         return jsonify({
             'success': False, 
@@ -710,32 +963,10 @@ def geocodificacion_reversa():
                 'error': 'Coordenadas requeridas'
             }), 400
         
-        import requests
-        
-        url = 'https://nominatim.openstreetmap.org/reverse'
-        params = {
-            'lat': lat,
-            'lon': lng,
-            'format': 'json',
-            'addressdetails': 1
-        }
-        headers = {
-            'User-Agent': 'MiChaska-POS/1.0'
-        }
-        
-        response = requests.get(url, params=params, headers=headers, timeout=5)
-        response.raise_for_status()
-        
-        resultado = response.json()
-        
-        return jsonify({
-            'success': True,
-            'direccion': resultado.get('display_name', ''),
-            'address': resultado.get('address', {}),
-            'lat': float(resultado.get('lat', lat)),
-            'lon': float(resultado.get('lon', lng))
-        })
-    except requests.RequestException as e:
+        return jsonify({'success': True, **geocoding.reversa(lat, lng)})
+    except geocoding.LimiteExcedido as e:
+        return _respuesta_limite_geocoding(e)
+    except geocoding.GeocodingError as e:
         logger.error(f"Error en geocodificación reversa: {e}")
         return jsonify({
             'success': False, 
@@ -745,6 +976,17 @@ def geocodificacion_reversa():
         logger.error(f"Error en geocodificación reversa: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _respuesta_limite_geocoding(error):
+    """Sin turno para consultar Nominatim (1 req/s): el cliente reintenta"""
+    logger.warning(f"⏳ {error}")
+    response = jsonify({
+        'success': False,
+        'error': 'Demasiadas búsquedas seguidas, intenta de nuevo en un momento'
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 # ============================================================================
 # API - GASTOS DIARIOS
 # ============================================================================
@@ -866,64 +1108,28 @@ def get_estadisticas_ventas():
         fecha_inicio = request.args.get('fecha_inicio', date.today().isoformat())
         fecha_fin = request.args.get('fecha_fin', date.today().isoformat())
         
-        # Ventas totales
-        query_total = """
-            SELECT 
-                COUNT(*) as num_ventas,
-                COALESCE(SUM(total), 0) as total_ventas,
-                COALESCE(AVG(total), 0) as promedio_venta
-            FROM ventas
-            WHERE DATE(fecha) BETWEEN %s AND %s
-        """
-        total_rows = execute_query(query_total, (fecha_inicio, fecha_fin))
-        total_data = dict(total_rows[0]) if total_rows else {}
-        
-        # Ventas por método de pago
-        query_metodos = """
-            SELECT 
-                metodo_pago,
-                COUNT(*) as cantidad,
-                COALESCE(SUM(total), 0) as total
-            FROM ventas
-            WHERE DATE(fecha) BETWEEN %s AND %s
-            GROUP BY metodo_pago
-        """
-        metodos_rows = execute_query(query_metodos, (fecha_inicio, fecha_fin))
-        
-        # Productos más vendidos
-        query_productos = """
-            SELECT 
-                p.nombre,
-                SUM(dv.cantidad) as cantidad_vendida,
-                COALESCE(SUM(dv.subtotal), 0) as total_ventas
-            FROM detalle_ventas dv
-            JOIN productos p ON dv.producto_id = p.id
-            JOIN ventas v ON dv.venta_id = v.id
-            WHERE DATE(v.fecha) BETWEEN %s AND %s
-            GROUP BY p.id, p.nombre
-            ORDER BY cantidad_vendida DESC
-            LIMIT 10
-        """
-        productos_rows = execute_query(query_productos, (fecha_inicio, fecha_fin))
+        # Días cerrados desde el resumen diario, hoy desde las ventas
+        resumen = resumen_ventas.resumen_periodo(fecha_inicio, fecha_fin)
+        productos_top = resumen_ventas.productos_top(fecha_inicio, fecha_fin, limite=10)
         
         return jsonify({
             'success': True,
             'periodo': {'inicio': fecha_inicio, 'fin': fecha_fin},
             'resumen': {
-                'num_ventas': total_data.get('num_ventas', 0),
-                'total_ventas': safe_float(total_data.get('total_ventas', 0)),
-                'promedio_venta': safe_float(total_data.get('promedio_venta', 0))
+                'num_ventas': resumen['num_ventas'],
+                'total_ventas': safe_float(resumen['total_ventas']),
+                'promedio_venta': safe_float(resumen['promedio_venta'])
             },
             'por_metodo_pago': [{
-                'metodo': row['metodo_pago'],
+                'metodo': row['metodo'],
                 'cantidad': row['cantidad'],
                 'total': safe_float(row['total'])
-            } for row in metodos_rows],
+            } for row in resumen['por_metodo_pago']],
             'productos_top': [{
                 'nombre': row['nombre'],
                 'cantidad_vendida': row['cantidad_vendida'],
                 'total_ventas': safe_float(row['total_ventas'])
-            } for row in productos_rows]
+            } for row in productos_top]
         })
     except Exception as e:
         logger.error(f"Error obteniendo estadísticas: {e}")
@@ -1029,10 +1235,49 @@ def eliminar_vendedor(vendedor_id):
 # API - PDFs y REPORTES
 # ============================================================================
 
+def _respuesta_ticket(response: Response, etag: str, venta_id: int, extension: str = 'pdf') -> Response:
+    """Headers de cache del ticket: el contenido para un ETag nunca cambia"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response.headers['Content-Disposition'] = f'attachment; filename=ticket_{venta_id}.{extension}'
+    return response
+
+def _detalle_tickets(venta_ids: list) -> dict:
+    """
+    Detalle de productos de varias ventas: venta_id -> filas ordenadas por dv.id.
+    Las filas son las mismas que ve el ticket individual, así la clave de cache coincide.
+    """
+    detalle = {venta_id: [] for venta_id in venta_ids}
+    if not venta_ids:
+        return detalle
+    placeholders = ', '.join(['%s'] * len(venta_ids))
+    rows = execute_query(f"""
+        SELECT dv.*, p.nombre as producto_nombre
+        FROM detalle_ventas dv
+        JOIN productos p ON dv.producto_id = p.id
+        WHERE dv.venta_id IN ({placeholders})
+        ORDER BY dv.venta_id, dv.id
+    """, tuple(venta_ids))
+    for row in rows:
+        detalle[row['venta_id']].append(row)
+    return detalle
+
 @app.route('/api/ticket/<int:venta_id>', methods=['GET'])
 def generar_ticket(venta_id):
-    """Genera y descarga el ticket PDF de una venta"""
+    """
+    Genera y descarga el ticket de una venta
+    ?format=pdf (default) o escpos (bytes para impresora térmica;
+    opcionales ?columnas=32|42|48 y ?barcode=1)
+    """
     try:
+        formato = request.args.get('format', 'pdf').lower()
+        if formato not in ('pdf', 'escpos'):
+            return jsonify({'success': False, 'error': 'Formato no soportado (pdf o escpos)'}), 400
+        if formato == 'escpos':
+            columnas = request.args.get('columnas', ESCPOS_COLUMNAS, type=int)
+            if columnas not in COLUMNAS_SOPORTADAS:
+                return jsonify({'success': False, 'error': f'columnas debe ser uno de {COLUMNAS_SOPORTADAS}'}), 400
+        
         # Obtener venta con detalle
         query = "SELECT * FROM ventas WHERE id = %s"
         rows = execute_query(query, (venta_id,))
@@ -1043,32 +1288,168 @@ def generar_ticket(venta_id):
         venta_data = dict(rows[0])
         
         # Obtener detalle de productos
-        query_detalle = """
-            SELECT dv.*, p.nombre as producto_nombre
-            FROM detalle_ventas dv
-            JOIN productos p ON dv.producto_id = p.id
-            WHERE dv.venta_id = %s
-        """
-        detalle_rows = execute_query(query_detalle, (venta_id,))
-        
-        # Generar PDF
-        from utils.pdf_generator import TicketGenerator
+        detalle_rows = _detalle_tickets([venta_id])[venta_id]
+        
+        if formato == 'escpos':
+            # Se genera en microsegundos: sin cache, el ETag es el hash del contenido
+            barcode = request.args.get('barcode', '0').lower() in ('1', 'true', 'si')
+            datos = EscPosTicketGenerator(columnas).generar_ticket(venta_data, detalle_rows, barcode)
+            etag = hashlib.sha256(datos).hexdigest()
+            if request.if_none_match.contains(etag):
+                return _respuesta_ticket(Response(status=304), etag, venta_id, 'bin')
+            return _respuesta_ticket(Response(datos, mimetype='application/octet-stream'), etag, venta_id, 'bin')
+        
+        # La clave cambia si cambia la venta, su detalle, la plantilla o la configuración
         generator = TicketGenerator()
-        pdf_bytes = generator.generar_ticket_memoria(venta_data, detalle_rows)
-        
-        # Enviar archivo
-        from io import BytesIO
-        return send_file(
-            BytesIO(pdf_bytes),
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'ticket_{venta_id}.pdf'
-        )
+        clave = generator.clave_cache(venta_data, detalle_rows)
         
+        etag = ticket_cache.etag(clave)
+        if etag and request.if_none_match.contains(etag):
+            return _respuesta_ticket(Response(status=304), etag, venta_id)
+        
+        # ReportLab corre en el servicio de renderizado, no en este worker
+        config_ticket = generator.configuracion_ticket()
+        with request_timing.medir('pdf'):
+            etag, pdf_bytes = ticket_cache.obtener_o_generar(
+                clave, lambda: render_service.ejecutar(renderizar_ticket, venta_data, detalle_rows, config_ticket)
+            )
+        return _respuesta_ticket(Response(pdf_bytes, mimetype='application/pdf'), etag, venta_id)
+        
+    except (render_service.ServicioSaturado, render_service.RenderTimeout):
+        raise
     except Exception as e:
         logger.error(f"Error generando ticket: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+EXPORT_TICKETS_LOTE = 50  # ventas por consulta/lote de renderizado
+
+def _fecha_zip(fecha) -> tuple:
+    """Fecha de la venta para la entrada del ZIP (mismo ZIP para los mismos tickets)"""
+    if isinstance(fecha, str):
+        try:
+            fecha = datetime.fromisoformat(fecha)
+        except ValueError:
+            fecha = None
+    if not isinstance(fecha, datetime) or fecha.year < 1980:
+        return (1980, 1, 1, 0, 0, 0)
+    return fecha.timetuple()[:6]
+
+def _lotes_tickets(inicio: datetime, fin: datetime):
+    """Lotes de (venta_data, detalle_rows) del rango, paginados por id"""
+    ultimo_id = 0
+    while True:
+        ventas = execute_query("""
+            SELECT * FROM ventas
+            WHERE fecha >= %s AND fecha < %s AND id > %s
+            ORDER BY id
+            LIMIT %s
+        """, (inicio, fin, ultimo_id, EXPORT_TICKETS_LOTE))
+        if not ventas:
+            return
+        ultimo_id = ventas[-1]['id']
+        detalle = _detalle_tickets([v['id'] for v in ventas])
+        yield [(dict(v), detalle[v['id']]) for v in ventas]
+
+def _zip_tickets(inicio: datetime, fin: datetime, cupo):
+    """
+    Genera el ZIP por partes: tickets de la cache y, por lote, los faltantes en el pool.
+    Libera `cupo` (el de exportación) al terminar o si el cliente se desconecta.
+    """
+    try:
+        yield from _entradas_zip_tickets(inicio, fin)
+    finally:
+        cupo.close()
+
+def _entradas_zip_tickets(inicio: datetime, fin: datetime):
+    generator = TicketGenerator()
+    config_ticket = generator.configuracion_ticket()
+    zip_stream = ZipEnStream()
+    fallidos = []
+    
+    for lote in _lotes_tickets(inicio, fin):
+        claves = [generator.clave_cache(venta_data, detalle_rows) for venta_data, detalle_rows in lote]
+        pdfs = [ticket_cache.obtener(clave) for clave in claves]
+        
+        faltantes = [i for i, pdf in enumerate(pdfs) if pdf is None]
+        if faltantes:
+            trabajos = [(*lote[i], config_ticket) for i in faltantes]
+            try:
+                # Misma espera corta que un ticket suelto: si el cupo está ocupado, el lote
+                # va a errores.txt en vez de retener este worker
+                resultados = render_service.ejecutar_lote(renderizar_ticket, trabajos)
+            except render_service.ServicioSaturado as e:
+                resultados = [e] * len(trabajos)
+            for i, resultado in zip(faltantes, resultados):
+                if isinstance(resultado, Exception):
+                    continue
+                pdfs[i] = (ticket_cache.guardar(claves[i], resultado), resultado)
+        
+        for (venta_data, _), pdf in zip(lote, pdfs):
+            if pdf is None:
+                fallidos.append(venta_data['id'])
+                continue
+            yield zip_stream.agregar(f"ticket_{venta_data['id']}.pdf", pdf[1], _fecha_zip(venta_data.get('fecha')))
+    
+    if fallidos:
+        logger.warning(f"⚠️ Exportación de tickets con {len(fallidos)} ticket(s) sin generar")
+        yield zip_stream.agregar(
+            'errores.txt',
+            ('Tickets que no se pudieron generar (reintentar):\n' +
+             '\n'.join(str(venta_id) for venta_id in fallidos) + '\n').encode('utf-8')
+        )
+    yield zip_stream.cerrar()
+
+@app.route('/api/tickets/export', methods=['GET'])
+def exportar_tickets():
+    """
+    ZIP con los tickets PDF de las ventas de un rango (?fecha_inicio=&fecha_fin=, YYYY-MM-DD)
+    Se envía en streaming, ticket por ticket; los que no se pudieron generar
+    se listan en errores.txt dentro del ZIP.
+    La descarga ocupa un worker de principio a fin: solo una exportación a la vez
+    entre todos los workers (503 + Retry-After si ya hay una). Para que una
+    reimpresión simultánea no deje sin worker a POST /api/ventas se necesitan
+    al menos RENDER_CUPOS + 2 workers (ver gunicorn.conf.py).
+    """
+    fecha_inicio = request.args.get('fecha_inicio')
+    fecha_fin = request.args.get('fecha_fin') or fecha_inicio
+    if not fecha_inicio:
+        return jsonify({'success': False, 'error': 'fecha_inicio es requerida'}), 400
+    try:
+        inicio, fin = get_mexico_date_range(fecha_inicio, fecha_fin)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Fecha inválida (usar YYYY-MM-DD)'}), 400
+    if fin <= inicio:
+        return jsonify({'success': False, 'error': 'fecha_fin debe ser mayor o igual a fecha_inicio'}), 400
+    
+    cupo = render_service.tomar_cupo_exclusivo('exportacion_tickets')
+    response = Response(stream_with_context(_zip_tickets(inicio, fin, cupo)), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename=tickets_{fecha_inicio}_{fecha_fin}.zip'
+    # Si el generador nunca arranca (cliente desconectado antes del primer byte)
+    response.call_on_close(cupo.close)
+    return response
+
+@app.route('/api/reportes/diario', methods=['GET'])
+def reporte_diario():
+    """Reporte contable del día en PDF (?fecha=YYYY-MM-DD, default hoy)"""
+    fecha = request.args.get('fecha') or get_mexico_datetime().strftime('%Y-%m-%d')
+    try:
+        datetime.strptime(fecha, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Fecha inválida (usar YYYY-MM-DD)'}), 400
+    
+    try:
+        with request_timing.medir('pdf'):
+            pdf_bytes = render_service.ejecutar(renderizar_reporte_diario, fecha)
+    except (render_service.ServicioSaturado, render_service.RenderTimeout):
+        raise
+    except Exception as e:
+        logger.error(f"Error generando reporte diario: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    response = Response(pdf_bytes, mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'attachment; filename=reporte_{fecha}.pdf'
+    return response
+
 # ============================================================================
 # API - SALUD DEL SISTEMA
 # ============================================================================
@@ -1084,7 +1465,8 @@ def health_check():
             'success': True,
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
-            'database': 'connected'
+            'database': 'connected',
+            'pool': get_pool_stats()
         })
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -1094,6 +1476,40 @@ def health_check():
             'error': str(e)
         }), 500
 
+@app.route('/api/debug/queries', methods=['GET', 'DELETE'])
+def debug_queries():
+    """
+    Estadísticas de consultas SQL de este worker (top sentencias por tiempo total).
+    Requiere DEBUG_TOKEN en el header X-Debug-Token; sin DEBUG_TOKEN configurado no existe.
+    Parámetros: limite (default 20), orden (total_ms | llamadas | max_ms). DELETE reinicia.
+    """
+    token = request.headers.get('X-Debug-Token', '')
+    if not DEBUG_TOKEN:
+        return jsonify({'success': False, 'error': 'Recurso no encontrado'}), 404
+    if not hmac.compare_digest(token, DEBUG_TOKEN):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 403
+    
+    if request.method == 'DELETE':
+        query_stats.reiniciar()
+        return jsonify({'success': True, 'message': 'Estadísticas reiniciadas'})
+    
+    limite = request.args.get('limite', 20, type=int)
+    orden = request.args.get('orden', 'total_ms')
+    return jsonify({'success': True, **query_stats.resumen(limite, orden)})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Métricas en formato Prometheus agregadas de todos los workers.
+    Si METRICS_TOKEN está configurado se requiere `Authorization: Bearer <token>`.
+    """
+    if METRICS_TOKEN:
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(token, METRICS_TOKEN):
+            return jsonify({'success': False, 'error': 'No autorizado'}), 403
+    
+    return Response(metrics.exposicion(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # ============================================================================
 # MANEJO DE ERRORES
 # ============================================================================
@@ -1103,6 +1519,27 @@ def not_found(error):
     """Manejo de error 404"""
     return jsonify({'success': False, 'error': 'Recurso no encontrado'}), 404
 
+@app.errorhandler(render_service.ServicioSaturado)
+def render_saturado(error):
+    """Servicio de renderizado sin cupo: el cliente debe reintentar"""
+    stats = render_service.get_stats()
+    response = jsonify({
+        'success': False,
+        'error': 'Generación de documentos saturada, intenta de nuevo en unos segundos',
+        'en_curso': stats['en_curso'],
+        'en_espera': stats['en_espera'],
+        'cupos': stats['cupos']
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.reintentar_en)
+    return response
+
+@app.errorhandler(render_service.RenderTimeout)
+def render_timeout(error):
+    """El documento tardó más de RENDER_TIMEOUT"""
+    logger.error(f"Timeout de renderizado: {error}")
+    return jsonify({'success': False, 'error': str(error)}), 504
+
 @app.errorhandler(500)
 def internal_error(error):
     """Manejo de error 500"""
@@ -1121,4 +1558,5 @@ if __name__ == '__main__':
     logger.info(f"Ubicación del negocio: {UBICACION_NEGOCIO}")
     logger.info(f"Radio de entrega: {RADIO_ENTREGA_KM}km")
     
+    metrics.limpiar_directorio()
     app.run(host='0.0.0.0', port=port, debug=debug)
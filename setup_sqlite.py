@@ -110,6 +110,21 @@ def crear_tablas_completas():
         )
     """)
     
+    # Zonas de entrega (polígonos con tarifa)
+    print("🗺️ Creando tabla zonas_entrega...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS zonas_entrega (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre VARCHAR(100) NOT NULL,
+            poligono TEXT NOT NULL,
+            tarifa DECIMAL(10,2) NOT NULL DEFAULT 0,
+            prioridad INTEGER NOT NULL DEFAULT 0,
+            excluida BOOLEAN NOT NULL DEFAULT FALSE,
+            activa BOOLEAN NOT NULL DEFAULT TRUE,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
     # Tabla de carrito
     print("🛒 Creando tabla carrito...")
     cursor.execute("""
@@ -166,6 +181,36 @@ def crear_tablas_completas():
         )
     """)
     
+    # Tabla de versiones de cache (invalidación entre workers)
+    print("🔄 Creando tabla cache_versiones...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cache_versiones (
+            clave VARCHAR(50) PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    
+    # Resumen diario de ventas (estadísticas sin re-agregar ventas crudas)
+    print("📊 Creando tablas de resumen diario...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ventas_diarias (
+            fecha DATE NOT NULL,
+            metodo_pago VARCHAR(50) NOT NULL,
+            num_ventas INTEGER NOT NULL DEFAULT 0,
+            total DECIMAL(12,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, metodo_pago)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ventas_producto_diarias (
+            fecha DATE NOT NULL,
+            producto_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            total DECIMAL(12,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, producto_id)
+        )
+    """)
+    
     # Crear índices
     print("\n📊 Creando índices...")
     indices = [
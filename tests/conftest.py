@@ -0,0 +1,123 @@
+"""
+Fixtures comunes: base de datos SQLite temporal por prueba
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+from collections import OrderedDict
+
+import pytest
+
+# Las pruebas siempre usan SQLite, y las caches/cupos en disco en un directorio propio
+os.environ.pop('DATABASE_URL', None)
+_DIR_PRUEBAS = tempfile.mkdtemp(prefix='michaska_pruebas_')
+for _variable, _subdir in (('METRICS_DIR', 'metrics'), ('RENDER_DIR', 'render'),
+                           ('TICKET_CACHE_DIR', 'tickets'), ('GEOCODING_DIR', 'geocoding')):
+    os.environ[_variable] = os.path.join(_DIR_PRUEBAS, _subdir)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import cache_versiones, connection_dual, resumen_ventas, zonas_entrega  # noqa: E402
+from utils import ticket_cache  # noqa: E402
+
+ESQUEMA = [
+    """
+    CREATE TABLE productos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        descripcion TEXT,
+        precio REAL NOT NULL CHECK(precio >= 0),
+        stock INTEGER DEFAULT 0 CHECK(stock >= 0),
+        categoria_id INTEGER,
+        codigo_barras TEXT UNIQUE,
+        imagen_url TEXT,
+        activo INTEGER DEFAULT 1,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE ventas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        total REAL NOT NULL CHECK(total >= 0),
+        vendedor_id INTEGER,
+        metodo_pago TEXT DEFAULT 'Efectivo',
+        notas TEXT,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE detalle_ventas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        venta_id INTEGER NOT NULL,
+        producto_id INTEGER NOT NULL,
+        cantidad INTEGER NOT NULL CHECK(cantidad > 0),
+        precio_unitario REAL NOT NULL CHECK(precio_unitario >= 0),
+        subtotal REAL NOT NULL CHECK(subtotal >= 0)
+    )
+    """
+]
+
+
+@pytest.fixture
+def db_sqlite(tmp_path, monkeypatch):
+    """Apunta connection_dual a una base SQLite nueva con el esquema mínimo de ventas"""
+    ruta = str(tmp_path / 'michaska_test.db')
+    conn = sqlite3.connect(ruta)
+    for ddl in ESQUEMA:
+        conn.execute(ddl)
+    conn.commit()
+    conn.close()
+
+    connection_dual.close_pool()
+    monkeypatch.setattr(connection_dual, 'SQLITE_DB_PATH', ruta)
+    # Forzar la creación perezosa de tablas, como en el primer uso de un proceso
+    monkeypatch.setitem(cache_versiones._schema_state, 'ready', False)
+    monkeypatch.setitem(resumen_ventas._schema_state, 'tablas', False)
+    monkeypatch.setitem(resumen_ventas._schema_state, 'ready', False)
+    yield ruta
+    connection_dual.close_pool()
+
+
+@pytest.fixture
+def cliente(db_sqlite):
+    """Cliente de prueba de la app Flask sobre la base SQLite temporal"""
+    import server
+    server.app.config['TESTING'] = True
+    with server.app.test_client() as c:
+        yield c
+
+
+@pytest.fixture
+def cache_vacia(tmp_path, monkeypatch):
+    """Cache de tickets sin entradas, con su directorio en disco propio"""
+    monkeypatch.setattr(ticket_cache, 'TICKET_CACHE_DIR', str(tmp_path / 'tickets'))
+    monkeypatch.setitem(ticket_cache._memoria, 'entradas', OrderedDict())
+    monkeypatch.setitem(ticket_cache._memoria, 'bytes', 0)
+    monkeypatch.setitem(ticket_cache._memoria, 'stats', {'memoria': 0, 'disco': 0, 'fallos': 0})
+    return tmp_path / 'tickets'
+
+
+@pytest.fixture
+def venta(db_sqlite):
+    """Una venta de una línea; regresa (venta_id, detalle_id)"""
+    producto_id = connection_dual.execute_insert(
+        "INSERT INTO productos (nombre, precio, stock) VALUES (%s, %s, %s) RETURNING id",
+        ('Chasca Mediana', 50.0, 10)
+    )
+    venta_id = connection_dual.execute_insert("INSERT INTO ventas (total) VALUES (%s) RETURNING id", (50.0,))
+    detalle_id = connection_dual.execute_insert("""
+        INSERT INTO detalle_ventas (venta_id, producto_id, cantidad, precio_unitario, subtotal)
+        VALUES (%s, %s, %s, %s, %s) RETURNING id
+    """, (venta_id, producto_id, 1, 50.0, 50.0))
+    return venta_id, detalle_id
+
+
+@pytest.fixture
+def zonas(db_sqlite, monkeypatch):
+    """Tabla de zonas nueva e índice vacío en este proceso"""
+    monkeypatch.setitem(zonas_entrega._schema_state, 'ready', False)
+    monkeypatch.setitem(zonas_entrega._cache, 'indice', None)
+    monkeypatch.setitem(zonas_entrega._cache, 'version', None)
+    return zonas_entrega
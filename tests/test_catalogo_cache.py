@@ -0,0 +1,55 @@
+"""
+Cache del catálogo en memoria: cambios hechos por otro worker (otra conexión) se ven
+"""
+import sqlite3
+
+import pytest
+
+from database import models
+from database.connection_dual import execute_insert
+from database.models import Producto
+
+
+@pytest.fixture
+def catalogo(db_sqlite, monkeypatch):
+    """Catálogo vacío en este worker, con un producto en la base"""
+    monkeypatch.setitem(models._catalogo_cache, 'productos', {})
+    monkeypatch.setitem(models._catalogo_cache, 'version', None)
+    monkeypatch.setattr(models, 'CATALOGO_CACHE_VERIFICAR_CADA', 0)
+    producto_id = execute_insert(
+        "INSERT INTO productos (nombre, precio, stock) VALUES (%s, %s, %s) RETURNING id",
+        ('Chasca Mediana', 50.0, 10)
+    )
+    assert Producto.get_all()[0].precio == 50.0  # queda en cache
+    return producto_id
+
+
+def _otra_conexion(ruta: str, *sentencias):
+    """Escribe como lo haría otro worker: con su propia conexión y su propia transacción"""
+    conn = sqlite3.connect(ruta)
+    for sql, params in sentencias:
+        conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+def test_cambio_con_version_incrementada_desde_otra_conexion(db_sqlite, catalogo):
+    _otra_conexion(
+        db_sqlite,
+        ("UPDATE productos SET precio = ?, activo = 0 WHERE id = ?", (65.0, catalogo)),
+        ("""INSERT INTO cache_versiones (clave, version) VALUES ('catalogo', 1)
+            ON CONFLICT (clave) DO UPDATE SET version = cache_versiones.version + 1""", ()),
+    )
+
+    assert Producto.get_all() == []
+    assert Producto.get_all(activos_solamente=False)[0].precio == 65.0
+
+
+def test_sin_version_se_recarga_al_vencer_la_edad_maxima(db_sqlite, catalogo, monkeypatch):
+    _otra_conexion(db_sqlite, ("UPDATE productos SET stock = ? WHERE id = ?", (3, catalogo)))
+
+    # Sin incrementar la versión la cache sigue vigente...
+    assert Producto.get_all()[0].stock == 10
+    # ...hasta que pasa CATALOGO_CACHE_MAX_EDAD
+    monkeypatch.setattr(models, 'CATALOGO_CACHE_MAX_EDAD', 0)
+    assert Producto.get_all()[0].stock == 3
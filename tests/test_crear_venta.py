@@ -0,0 +1,54 @@
+"""
+POST /api/ventas: productos del carrito en una sola consulta con Producto.get_many
+"""
+import pytest
+
+from database.connection_dual import execute_insert, execute_query
+from database.models import Producto
+
+
+def _producto(nombre: str, stock: int = 10) -> int:
+    return execute_insert(
+        "INSERT INTO productos (nombre, precio, stock) VALUES (%s, %s, %s) RETURNING id",
+        (nombre, 30.0, stock)
+    )
+
+
+def test_get_many_omite_los_ids_que_no_existen(db_sqlite):
+    chasca = _producto('Chasca Mediana')
+    elote = _producto('Elote')
+
+    productos = Producto.get_many([chasca, 9999, elote, str(chasca)])
+
+    assert sorted(productos) == [chasca, elote]
+    assert productos[elote].nombre == 'Elote'
+    assert Producto.get_many([9999]) == {}
+    assert Producto.get_many([]) == {}
+
+
+@pytest.mark.parametrize('item', [
+    {'producto_id': 'chasca', 'cantidad': 1},
+    {'producto_id': None, 'cantidad': 1},
+    {'cantidad': 1},
+    'chasca',
+])
+def test_producto_id_invalido_400(cliente, item):
+    chasca = _producto('Chasca Mediana')
+
+    respuesta = cliente.post('/api/ventas', json={'items': [{'producto_id': chasca, 'cantidad': 1}, item]})
+
+    assert respuesta.status_code == 400
+    assert respuesta.get_json()['success'] is False
+    assert execute_query("SELECT COUNT(*) AS n FROM ventas")[0]['n'] == 0
+
+
+def test_producto_inexistente_404(cliente):
+    chasca = _producto('Chasca Mediana')
+
+    respuesta = cliente.post('/api/ventas', json={'items': [
+        {'producto_id': chasca, 'cantidad': 1}, {'producto_id': 9999, 'cantidad': 1}
+    ]})
+
+    assert respuesta.status_code == 404
+    assert 'Producto 9999' in respuesta.get_json()['error']
+    assert execute_query("SELECT COUNT(*) AS n FROM ventas")[0]['n'] == 0
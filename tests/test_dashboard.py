@@ -0,0 +1,64 @@
+"""
+DirectPostgreSQLAdapter.get_dashboard_data: periodos abiertos por cualquiera de los dos lados
+"""
+from datetime import timedelta
+
+import pytest
+
+from database import resumen_ventas
+from database.connection_direct_simple import DirectPostgreSQLAdapter
+from database.connection_dual import execute_query, transaction
+from utils.timezone_utils import get_mexico_datetime
+
+
+@pytest.fixture
+def adaptador(db_sqlite):
+    """Adaptador del dashboard sobre la base SQLite de prueba, sin conectarse a PostgreSQL"""
+    adaptador = DirectPostgreSQLAdapter.__new__(DirectPostgreSQLAdapter)
+    adaptador.execute_query = execute_query
+    return adaptador
+
+
+@pytest.fixture
+def dias(db_sqlite):
+    """Una venta de una chasca en cada uno de los últimos tres días cerrados"""
+    hoy = get_mexico_datetime().date()
+    dias = [hoy - timedelta(days=n) for n in (3, 2, 1)]
+    with transaction() as tx:
+        producto_id = tx.execute_insert(
+            "INSERT INTO productos (nombre, precio, stock) VALUES (%s, %s, %s) RETURNING id",
+            ('Chasca Mediana', 50.0, 10)
+        )
+        for n, dia in enumerate(dias, start=1):
+            venta_id = tx.execute_insert("INSERT INTO ventas (fecha, total) VALUES (%s, %s) RETURNING id",
+                                         (f'{dia.isoformat()} 12:00:00', 50.0 * n))
+            tx.execute_insert("""
+                INSERT INTO detalle_ventas (venta_id, producto_id, cantidad, precio_unitario, subtotal)
+                VALUES (%s, %s, %s, %s, %s) RETURNING id
+            """, (venta_id, producto_id, n, 50.0, 50.0 * n))
+    resumen_ventas.reconstruir()
+    return [dia.isoformat() for dia in dias]
+
+
+def _dias(datos):
+    return sorted(dia['dia'] for dia in datos['ventas_por_dia'])
+
+
+def test_solo_fecha_hasta(adaptador, dias):
+    datos = adaptador.get_dashboard_data(fecha_hasta=dias[1])
+
+    assert _dias(datos) == dias[:2]
+    assert datos['resumen'] == {'total_ventas': 2, 'total_ingresos': 150.0}
+    assert datos['productos_top'] == [{'nombre': 'Chasca Mediana', 'cantidad_vendida': 3}]
+
+
+def test_solo_fecha_desde(adaptador, dias):
+    datos = adaptador.get_dashboard_data(fecha_desde=dias[1])
+
+    assert _dias(datos) == dias[1:]
+    assert datos['resumen']['total_ingresos'] == 250.0
+
+
+def test_ambos_limites_y_sin_limites(adaptador, dias):
+    assert _dias(adaptador.get_dashboard_data(dias[1], dias[1])) == dias[1:2]
+    assert _dias(adaptador.get_dashboard_data()) == dias
@@ -0,0 +1,80 @@
+"""
+Tickets ESC/POS comparados byte a byte contra archivos golden (tests/golden/escpos)
+
+Para regenerar los golden tras un cambio intencional del formato:
+    ESCPOS_ACTUALIZAR_GOLDEN=1 python -m pytest tests/test_escpos_generator.py
+"""
+import os
+import re
+
+import pytest
+
+from utils.escpos_generator import COLUMNAS_SOPORTADAS, EscPosTicketGenerator
+
+DIR_GOLDEN = os.path.join(os.path.dirname(__file__), 'golden', 'escpos')
+ACTUALIZAR = os.getenv('ESCPOS_ACTUALIZAR_GOLDEN') == '1'
+
+# Comandos que emite el generador (sin texto imprimible); el código de barras incluye sus datos
+COMANDOS = re.compile(rb'\x1b@|\x1b[taE].|\x1d[!hwH].|\x1dVB\x00|\x1dkI(?s:.)\{B\d+')
+
+CONFIGURACION = {
+    'nombre_negocio': 'Mi Chas-K Peñuelas',
+    'direccion': 'Av. Convención de 1914 #123, Aguascalientes, Ags.',
+    'telefono': '449 123 4567',
+    'mensaje_ticket': '¿Te gustó? ¡Vuelve pronto, señor cliente!'
+}
+
+VENTA = {
+    'id': 1234,
+    'fecha': '2026-01-15 13:45:00',
+    'metodo_pago': 'Efectivo',
+    'notas': 'Vendedor: María José Ñúñez | Para llevar',
+    'total': 215.0
+}
+
+DETALLE = [
+    {'producto_nombre': 'Chasca Mediana', 'cantidad': 2, 'precio_unitario': 50.0, 'subtotal': 100.0},
+    {'producto_nombre': 'Empapelado de Champiñones con queso añejo y jalapeño',
+     'cantidad': 1, 'precio_unitario': 90.0, 'subtotal': 90.0},
+    {'producto_nombre': 'Elote pequeño', 'cantidad': 1, 'precio_unitario': 25.0, 'subtotal': 25.0},
+]
+
+
+@pytest.fixture
+def generator_fijo(monkeypatch):
+    """Generador que lee la configuración fija de arriba en vez de la base de datos"""
+    monkeypatch.setattr(
+        EscPosTicketGenerator, 'get_configuracion',
+        lambda self, clave, default="": CONFIGURACION.get(clave, default)
+    )
+    return EscPosTicketGenerator
+
+
+@pytest.mark.parametrize('codigo_barras', [False, True], ids=['sin_barras', 'con_barras'])
+@pytest.mark.parametrize('columnas', COLUMNAS_SOPORTADAS)
+def test_ticket_igual_al_golden(generator_fijo, columnas, codigo_barras):
+    ticket = generator_fijo(columnas=columnas).generar_ticket(VENTA, DETALLE, codigo_barras=codigo_barras)
+
+    nombre = f"ticket_{columnas}{'_barras' if codigo_barras else ''}.bin"
+    ruta = os.path.join(DIR_GOLDEN, nombre)
+    if ACTUALIZAR:
+        with open(ruta, 'wb') as f:
+            f.write(ticket)
+
+    with open(ruta, 'rb') as f:
+        assert ticket == f.read()
+
+
+def test_texto_en_pc858(generator_fijo):
+    ticket = generator_fijo(columnas=32).generar_ticket(VENTA, DETALLE)
+
+    assert b'\x1bt\x13' in ticket  # ESC t 19 = PC858
+    assert 'Peñuelas'.encode('cp858') in ticket
+    assert '¿Te gustó?'.encode('cp858') in ticket
+
+
+def test_renglones_no_exceden_el_ancho(generator_fijo):
+    for columnas in COLUMNAS_SOPORTADAS:
+        ticket = generator_fijo(columnas=columnas).generar_ticket(VENTA, DETALLE)
+        texto = COMANDOS.sub(b'', ticket)
+        assert max(len(renglon) for renglon in texto.split(b'\n')) == columnas
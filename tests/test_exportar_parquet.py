@@ -0,0 +1,54 @@
+"""
+Exportación incremental a Parquet: filas confirmadas después de la marca de agua
+"""
+import pytest
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+from database import exportar_parquet  # noqa: E402
+from database.connection_dual import execute_update  # noqa: E402
+
+
+def _insertar_venta(venta_id: int):
+    execute_update(
+        "INSERT INTO ventas (id, fecha, total, metodo_pago) VALUES (%s, %s, %s, %s)",
+        (venta_id, '2024-01-15 12:00:00', 50.0, 'Efectivo')
+    )
+
+
+def _ids_exportados(destino) -> list:
+    return sorted(pq.read_table(str(destino / 'ventas')).column('id').to_pylist())
+
+
+def test_id_confirmado_tarde_se_exporta_en_la_siguiente_corrida(db_sqlite, tmp_path):
+    destino = tmp_path / 'parquet'
+    # El id 2 está "en vuelo" (asignado pero sin confirmar) durante la primera corrida
+    _insertar_venta(1)
+    _insertar_venta(3)
+
+    resultado = exportar_parquet.exportar(str(destino), ['ventas'])['ventas']
+    assert resultado['ultimo_id'] == 3
+    assert [hueco[:2] for hueco in resultado['huecos']] == [[2, 2]]
+
+    _insertar_venta(2)
+    _insertar_venta(4)
+    resultado = exportar_parquet.exportar(str(destino), ['ventas'])['ventas']
+    assert resultado['recuperadas'] == 1
+    assert resultado['huecos'] == []
+    assert _ids_exportados(destino) == [1, 2, 3, 4]
+
+    # Sin filas nuevas no se duplica nada
+    exportar_parquet.exportar(str(destino), ['ventas'])
+    assert _ids_exportados(destino) == [1, 2, 3, 4]
+
+
+def test_huecos_vencidos_ya_no_se_buscan(db_sqlite, tmp_path, monkeypatch):
+    destino = tmp_path / 'parquet'
+    _insertar_venta(1)
+    _insertar_venta(3)
+    exportar_parquet.exportar(str(destino), ['ventas'])
+
+    monkeypatch.setattr(exportar_parquet, 'HUECOS_MINUTOS', -1)
+    resultado = exportar_parquet.exportar(str(destino), ['ventas'])['ventas']
+    assert resultado['huecos'] == []
+    assert exportar_parquet.leer_huecos(str(destino)) == {'ventas': []}
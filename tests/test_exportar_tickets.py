@@ -0,0 +1,61 @@
+"""
+/api/tickets/export: ZIP en streaming, una sola exportación a la vez entre workers
+"""
+import io
+import threading
+import zipfile
+
+import pytest
+
+from utils import render_service
+
+URL = '/api/tickets/export?fecha_inicio=2000-01-01&fecha_fin=2100-12-31'
+
+
+def _en_otro_hilo(app, url):
+    """Request atendido en otro hilo, como lo haría otro worker (su propio contexto de Flask)"""
+    respuesta = {}
+
+    def pedir():
+        r = app.test_client().get(url)
+        r.get_data()  # la descarga termina y se cierra en su propio hilo
+        r.close()
+        respuesta['r'] = r
+
+    hilo = threading.Thread(target=pedir)
+    hilo.start()
+    hilo.join()
+    return respuesta['r']
+
+
+@pytest.fixture
+def app(db_sqlite, cache_vacia, tmp_path, monkeypatch):
+    """App sin contexto preservado entre requests y renderizado en el mismo proceso"""
+    import server
+    monkeypatch.setattr(render_service, 'RENDER_DIR', str(tmp_path / 'render'))
+    monkeypatch.setattr(render_service, 'RENDER_PROCESOS', 0)
+    return server.app
+
+
+def test_segunda_exportacion_simultanea_recibe_503(app, venta):
+    primera = app.test_client().get(URL, buffered=False)
+    assert primera.status_code == 200
+
+    # La primera sigue descargándose: la segunda no espera ni ocupa otro worker
+    segunda = _en_otro_hilo(app, URL)
+    assert segunda.status_code == 503
+    assert segunda.headers['Retry-After']
+
+    # Al terminar la primera descarga el cupo se libera
+    venta_id, _ = venta
+    contenido = zipfile.ZipFile(io.BytesIO(b''.join(primera.response)))
+    assert contenido.namelist() == [f'ticket_{venta_id}.pdf']
+    primera.close()
+    assert _en_otro_hilo(app, URL).status_code == 200
+
+
+def test_cliente_que_se_desconecta_libera_el_cupo(app, venta):
+    primera = app.test_client().get(URL, buffered=False)
+    primera.close()  # desconexión antes de leer el primer byte
+
+    assert _en_otro_hilo(app, URL).status_code == 200
@@ -0,0 +1,96 @@
+"""
+/api/ventas/export: CSV y NDJSON en streaming desde stream_query
+"""
+import csv
+import io
+import json
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from database.connection_dual import transaction
+
+FECHAS = [
+    '2024-02-29 23:59:59',
+    '2024-03-01 00:00:00',
+    '2024-03-01 13:45:00',
+    '2024-03-02 23:59:59',
+    '2024-03-03 00:00:00',
+]
+
+
+@pytest.fixture
+def app(db_sqlite):
+    """App sin contexto preservado: cada respuesta en streaming se consume o se cierra aparte"""
+    import server
+    with transaction() as tx:
+        tx.execute_values("INSERT INTO ventas (fecha, total, metodo_pago) VALUES %s",
+                          [(fecha, 10.0 * (i + 1), 'Efectivo') for i, fecha in enumerate(FECHAS)])
+    return server.app
+
+
+def _csv(respuesta):
+    return list(csv.DictReader(io.StringIO(respuesta.get_data(as_text=True))))
+
+
+def test_csv_todas_las_ventas(app):
+    respuesta = app.test_client().get('/api/ventas/export?format=csv')
+
+    assert respuesta.status_code == 200
+    assert respuesta.mimetype == 'text/csv'
+    assert respuesta.headers['Content-Disposition'] == 'attachment; filename=ventas.csv'
+    filas = _csv(respuesta)
+    assert [fila['fecha'] for fila in filas] == FECHAS
+    assert filas[0]['total'] == '10.0'
+
+
+def test_csv_con_rango_de_fechas(app):
+    respuesta = app.test_client().get('/api/ventas/export?format=csv&fecha_inicio=2024-03-01&fecha_fin=2024-03-02')
+
+    assert [fila['fecha'] for fila in _csv(respuesta)] == FECHAS[1:4]
+
+
+def test_ndjson_un_dia(app):
+    respuesta = app.test_client().get('/api/ventas/export?format=ndjson&fecha_inicio=2024-03-01')
+
+    assert respuesta.mimetype == 'application/x-ndjson'
+    filas = [json.loads(linea) for linea in respuesta.get_data(as_text=True).splitlines()]
+    assert [fila['fecha'] for fila in filas] == FECHAS[1:3]
+    assert [fila['total'] for fila in filas] == [20.0, 30.0]
+
+
+def test_formato_o_fecha_invalidos(app):
+    cliente = app.test_client()
+    assert cliente.get('/api/ventas/export?format=xlsx').status_code == 400
+    assert cliente.get('/api/ventas/export?fecha_inicio=2024-02-30').status_code == 400
+
+
+def _escribir_desde_otro_worker(ruta: str):
+    """Escritura con otra conexión, sin esperar: falla si un cursor abierto retiene la base"""
+    conn = sqlite3.connect(ruta, timeout=0)
+    try:
+        conn.execute("INSERT INTO ventas (fecha, total) VALUES (?, ?)", (datetime(2024, 4, 1), 1.0))
+        conn.commit()
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def test_cliente_que_corta_la_descarga_libera_el_cursor(app, db_sqlite):
+    # Más filas que un lote de stream_query: el cursor queda a medias tras el primer envío
+    with transaction() as tx:
+        tx.execute_values("INSERT INTO ventas (fecha, total) VALUES %s",
+                          [('2024-03-15 12:00:00', 1.0)] * 2500)
+
+    respuesta = app.test_client().get('/api/ventas/export?format=ndjson', buffered=False)
+    primer_envio = next(iter(respuesta.response))
+    assert primer_envio.count(b'\n') == 500
+
+    # Con el cursor abierto otro worker no puede escribir
+    with pytest.raises(sqlite3.OperationalError, match='locked'):
+        _escribir_desde_otro_worker(db_sqlite)
+
+    # Al desconectarse el cliente, GeneratorExit cierra el cursor y revierte la conexión
+    respuesta.close()
+    _escribir_desde_otro_worker(db_sqlite)
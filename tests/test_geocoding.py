@@ -0,0 +1,168 @@
+"""
+Servicio de geocodificación con un upstream de prueba en lugar de Nominatim
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+from utils import geocoding
+from utils.geo import geohash, limites_geohash, vecinos_geohash
+
+
+class UpstreamFalso:
+    """Upstream en memoria que cuenta las llamadas (interfaz de NominatimUpstream)"""
+
+    def __init__(self, resultados=None, demora: float = 0.0):
+        self.resultados = resultados if resultados is not None else []
+        self.demora = demora
+        self.llamadas = []
+        self.lock = threading.Lock()
+
+    def buscar(self, consulta, limite):
+        with self.lock:
+            self.llamadas.append(('buscar', consulta))
+        time.sleep(self.demora)
+        return self.resultados
+
+    def reversa(self, lat, lng):
+        with self.lock:
+            self.llamadas.append(('reversa', lat, lng))
+        time.sleep(self.demora)
+        return {'display_name': f'Punto {lat:.6f},{lng:.6f}', 'address': {}, 'lat': lat, 'lon': lng}
+
+
+@pytest.fixture
+def geo(tmp_path, monkeypatch):
+    """Cache, limitador y vuelos vacíos en un directorio propio; sin límite de peticiones"""
+    monkeypatch.setattr(geocoding, 'GEOCODING_DIR', str(tmp_path))
+    monkeypatch.setattr(geocoding, 'CACHE_DB', str(tmp_path / 'cache.db'))
+    monkeypatch.setattr(geocoding, 'RATE', 1000.0)
+    monkeypatch.setattr(geocoding, 'BURST', 1000.0)
+    monkeypatch.setitem(geocoding._state, 'db', threading.local())
+    monkeypatch.setitem(geocoding._state, 'lru', OrderedDict())
+    monkeypatch.setitem(geocoding._state, 'vuelos', {})
+    monkeypatch.setitem(geocoding._state, 'stats', dict.fromkeys(geocoding._state['stats'], 0))
+    yield geocoding
+    geocoding.configurar(None)
+
+
+def _otro_worker(geo):
+    """Simula otro worker: misma cache en disco, memoria vacía"""
+    geo._state['lru'].clear()
+    geo._state['db'] = threading.local()
+
+
+def test_consultas_identicas_simultaneas_hacen_una_peticion(geo):
+    resultado = {'display_name': 'Av. Convención de 1914', 'lat': '21.88', 'lon': '-102.29'}
+    upstream = UpstreamFalso([resultado], demora=0.2)
+    geo.configurar(upstream)
+
+    inicio = threading.Barrier(8)
+    respuestas = []
+
+    def buscar():
+        inicio.wait()
+        respuestas.append(geo.buscar('Av. Convención'))
+
+    hilos = [threading.Thread(target=buscar) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert len(upstream.llamadas) == 1
+    assert len(respuestas) == 8
+    assert all(r == respuestas[0] for r in respuestas)
+    assert respuestas[0][0]['lat'] == 21.88
+    assert geo.get_cache_stats()['coalescidas'] >= 1
+
+
+def test_resultado_vacio_tambien_se_guarda(geo):
+    upstream = UpstreamFalso([])
+    geo.configurar(upstream)
+
+    assert geo.buscar('calle que no existe') == []
+    assert geo.buscar('Calle que NO existe') == []  # misma consulta normalizada
+    _otro_worker(geo)
+    assert geo.buscar('calle que no existe') == []
+
+    assert len(upstream.llamadas) == 1
+    assert geo.get_cache_stats()['disco'] == 1
+
+
+@pytest.fixture
+def bucket_vacio(geo, monkeypatch):
+    """Sin tokens en el limitador compartido y sin tiempo para esperar el siguiente"""
+    monkeypatch.setattr(geo, 'RATE', 0.01)
+    monkeypatch.setattr(geo, 'BURST', 1.0)
+    monkeypatch.setattr(geo, 'ESPERA_MAX', 0.1)
+    with geo._archivo_bloqueado('limitador') as f:
+        f.write(f'0 {time.time()}')
+    return geo
+
+
+def test_sin_tokens_no_consulta_al_upstream(bucket_vacio):
+    geo = bucket_vacio
+    upstream = UpstreamFalso([])
+    geo.configurar(upstream)
+
+    with pytest.raises(geo.LimiteExcedido):
+        geo.buscar('Av. Convención')
+    assert upstream.llamadas == []
+    assert geo.get_cache_stats()['limitadas'] == 1
+
+
+def test_api_responde_degradada_sin_tokens(cliente, bucket_vacio):
+    upstream = UpstreamFalso([])
+    bucket_vacio.configurar(upstream)
+
+    respuesta = cliente.post('/api/direcciones/reversa', json={'lat': 21.88, 'lng': -102.29})
+
+    assert respuesta.status_code == 503
+    assert respuesta.headers['Retry-After'] == '1'
+    assert respuesta.get_json()['success'] is False
+    assert upstream.llamadas == []
+
+
+def _celda_y_limites(lat, lng):
+    celda = geohash(lat, lng, geocoding.GEOHASH_PRECISION)
+    return celda, limites_geohash(celda)
+
+
+def test_reversa_misma_celda_una_sola_peticion(geo):
+    upstream = UpstreamFalso()
+    geo.configurar(upstream)
+    _, (lat_min, lat_max, lng_min, lng_max) = _celda_y_limites(21.8818, -102.2916)
+
+    # Dos pines en esquinas opuestas de la misma celda (~35 x 19 m)
+    primero = geo.reversa(lat_min + 1e-6, lng_min + 1e-6)
+    segundo = geo.reversa(lat_max - 1e-6, lng_max - 1e-6)
+    _otro_worker(geo)
+    tercero = geo.reversa((lat_min + lat_max) / 2, (lng_min + lng_max) / 2)
+
+    assert len(upstream.llamadas) == 1
+    assert primero == segundo == tercero
+
+
+def test_reversa_celdas_vecinas(geo):
+    upstream = UpstreamFalso()
+    geo.configurar(upstream)
+    celda, (lat_min, lat_max, lng_min, lng_max) = _celda_y_limites(21.8818, -102.2916)
+    ancho = lng_max - lng_min
+    lat = (lat_min + lat_max) / 2
+
+    primero = geo.reversa(lat, lng_min + 1e-6)  # orilla oeste de la celda
+    # Orilla este de la celda vecina al este: a unos 70 m, fuera del radio aceptado
+    lejano = geo.reversa(lat, lng_max + ancho - 1e-6)
+    assert geohash(lat, lng_max + ancho - 1e-6, geo.GEOHASH_PRECISION) in vecinos_geohash(celda)
+    assert len(upstream.llamadas) == 2
+    assert lejano != primero
+
+    # Justo al otro lado del borde oeste: otra celda, pero a menos de REVERSA_RADIO_M del primero
+    cercano = geo.reversa(lat, lng_min - 1e-6)
+    assert geohash(lat, lng_min - 1e-6, geo.GEOHASH_PRECISION) != celda
+    assert len(upstream.llamadas) == 2
+    assert cercano == primero
+    assert geo.get_cache_stats()['reversa_vecina'] == 1
@@ -0,0 +1,71 @@
+"""
+Agregación de métricas entre workers (METRICS_DIR) y formato de exposición
+"""
+import json
+import os
+import subprocess
+import time
+
+import pytest
+
+from utils import metrics
+
+SIN_ETIQUETAS = metrics._clave({})
+
+
+@pytest.fixture
+def dir_metricas(tmp_path, monkeypatch):
+    """METRICS_DIR vacío y un worker actual sin métricas de otras pruebas"""
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    monkeypatch.setitem(metrics._state, 'worker', None)
+    return tmp_path
+
+
+def _escribir(ruta, pid, ventas, recientes=(), en_curso=0.0):
+    datos = {
+        'pid': pid,
+        'counters': {'ventas_total': {SIN_ETIQUETAS: float(ventas)}},
+        'gauges': {'http_requests_in_flight': {SIN_ETIQUETAS: en_curso}},
+        'histogramas': {'venta_items': {SIN_ETIQUETAS: {
+            'buckets': [1, 2], 'counts': [0, ventas], 'sum': 2.0 * ventas, 'count': ventas}}},
+        'ventas_recientes': list(recientes),
+    }
+    ruta.write_text(json.dumps(datos))
+
+
+def test_agrega_dos_workers_y_el_archivo_de_terminados(dir_metricas):
+    ahora = time.time()
+    viejo = ahora - metrics.VENTANA_VENTAS_SEGUNDOS - 60
+    muerto = subprocess.Popen(['true'])
+    muerto.wait()
+
+    _escribir(dir_metricas / 'worker_a.json', os.getppid(), 2, [ahora - 5], en_curso=1)
+    _escribir(dir_metricas / 'worker_b.json', 1, 3, [ahora - 10], en_curso=2)
+    _escribir(dir_metricas / f'worker_{muerto.pid}.json', muerto.pid, 4, [ahora - 20, viejo], en_curso=7)
+    _escribir(dir_metricas / 'archivado.json', 0, 5, [ahora - 30, viejo])
+
+    total = metrics.agregar()
+
+    assert total['counters']['ventas_total'][SIN_ETIQUETAS] == 14
+    assert total['histogramas']['venta_items'][SIN_ETIQUETAS]['count'] == 14
+    # Los gauges del worker terminado se descartan
+    assert total['gauges']['http_requests_in_flight'][SIN_ETIQUETAS] == 3
+    assert total['gauges']['workers'][SIN_ETIQUETAS] == 3  # a, b y el proceso actual
+    assert total['gauges']['ventas_por_minuto'][SIN_ETIQUETAS] == 4 / (metrics.VENTANA_VENTAS_SEGUNDOS / 60)
+
+    # El worker terminado quedó archivado y el archivo no conserva ventas fuera de la ventana
+    assert not (dir_metricas / f'worker_{muerto.pid}.json').exists()
+    archivado = json.loads((dir_metricas / 'archivado.json').read_text())
+    assert archivado['counters']['ventas_total'][SIN_ETIQUETAS] == 9
+    assert sorted(archivado['ventas_recientes']) == [ahora - 30, ahora - 20]
+
+    # Una segunda lectura no vuelve a sumar al terminado
+    assert metrics.agregar()['counters']['ventas_total'][SIN_ETIQUETAS] == 14
+
+
+def test_valores_especiales_en_la_exposicion():
+    assert metrics._numero(float('inf')) == '+Inf'
+    assert metrics._numero(float('-inf')) == '-Inf'
+    assert metrics._numero(float('nan')) == 'NaN'
+    assert metrics._numero(3.0) == '3'
+    assert metrics._numero(0.25) == '0.25'
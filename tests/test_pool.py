@@ -0,0 +1,128 @@
+"""
+Pool de conexiones de connection_dual: préstamo/devolución y guarda de pid tras fork
+"""
+import os
+import threading
+
+import psycopg2
+import pytest
+from psycopg2.pool import PoolError
+
+from database import connection_dual
+from database.connection_dual import PostgresConnectionPool
+
+
+class ConexionFalsa:
+    """Lo mínimo de una conexión psycopg2 que usa el pool"""
+
+    def __init__(self):
+        self.closed = 0
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+def _pool(**kwargs) -> PostgresConnectionPool:
+    config = {'min_size': 0, 'max_size': 2, 'timeout': 0.05, 'check_after': 3600}
+    config.update(kwargs)
+    return PostgresConnectionPool(ConexionFalsa, **config)
+
+
+def test_prestamo_y_devolucion_reutiliza_la_conexion():
+    pool = _pool()
+
+    conn = pool.getconn()
+    assert pool.stats()['in_use'] == 1
+    pool.putconn(conn)
+    assert pool.stats()['in_use'] == 0
+    assert pool.stats()['idle'] == 1
+
+    assert pool.getconn() is conn
+    stats = pool.stats()
+    assert stats['checkouts'] == 2
+    assert stats['created'] == 1
+
+
+def test_pool_lleno_agota_el_tiempo_de_espera():
+    pool = _pool(max_size=1)
+    pool.getconn()
+
+    with pytest.raises(PoolError):
+        pool.getconn()
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_conexion_descartada_no_vuelve_al_pool():
+    pool = _pool()
+    conn = pool.getconn()
+
+    pool.putconn(conn, discard=True)
+
+    assert conn.closed
+    assert pool.stats()['size'] == 0
+    assert pool.getconn() is not conn
+
+
+def test_guarda_de_pid_crea_otro_pool_tras_fork(monkeypatch):
+    monkeypatch.setattr(connection_dual, '_new_postgres_connection', ConexionFalsa)
+    monkeypatch.setitem(connection_dual.POOL_CONFIG, 'min_size', 1)
+    monkeypatch.setattr(connection_dual, '_pool_state',
+                        {'pid': None, 'pool': None, 'lock': threading.Lock()})
+
+    pool_padre = connection_dual.get_pool()
+    conn_padre = pool_padre.getconn()
+    assert connection_dual.get_pool() is pool_padre
+
+    lectura, escritura = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # hijo: como un worker de gunicorn recién creado
+        try:
+            pool_hijo = connection_dual.get_pool()
+            ok = (pool_hijo is not pool_padre and pool_hijo.getconn() is not conn_padre
+                  and connection_dual._pool_state['pid'] == os.getpid())
+            os.write(escritura, b'1' if ok else b'0')
+        finally:
+            os._exit(0)
+    os.close(escritura)
+    resultado = os.read(lectura, 1)
+    os.close(lectura)
+    os.waitpid(pid, 0)
+
+    assert resultado == b'1'
+    # El hijo no cerró ni tocó las conexiones del padre
+    assert not conn_padre.closed
+    assert connection_dual.get_pool() is pool_padre
+
+
+def test_sqlite_cuenta_prestamos_entre_hilos(db_sqlite):
+    antes = connection_dual.get_pool_stats()['checkouts']
+
+    def consultar():
+        for _ in range(50):
+            connection_dual.execute_query("SELECT 1 AS uno")
+
+    hilos = [threading.Thread(target=consultar) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert connection_dual.get_pool_stats()['checkouts'] - antes == 400
+
+
+def test_sqlite_conexion_aparte_mientras_un_stream_la_ocupa(db_sqlite):
+    connection_dual.execute_update("INSERT INTO ventas (total) VALUES (%s)", (10.0,))
+    connection_dual.execute_update("INSERT INTO ventas (total) VALUES (%s)", (20.0,))
+
+    filas = connection_dual.stream_query("SELECT id FROM ventas ORDER BY id", lote=1)
+    assert next(filas)['id'] == 1
+    with connection_dual.get_db_connection() as conn:
+        assert conn is not connection_dual._sqlite_local.conn
+    assert [fila['id'] for fila in filas] == [2]
+
+    # Terminado el stream, la conexión del hilo vuelve a estar libre
+    with connection_dual.get_db_connection() as conn:
+        assert conn is connection_dual._sqlite_local.conn
@@ -0,0 +1,83 @@
+"""
+Instrumentación de consultas y /api/debug/queries
+"""
+import threading
+import time
+from collections import deque
+
+import pytest
+
+from database import query_stats
+
+URL = '/api/debug/queries'
+TOKEN = 'token-de-prueba'
+
+
+@pytest.fixture
+def estadisticas(monkeypatch):
+    """Agregados de consultas vacíos para este test"""
+    monkeypatch.setattr(query_stats, '_state', {
+        'lock': threading.Lock(),
+        'sentencias': {},
+        'requests': deque(maxlen=query_stats.MAX_REQUESTS_RECIENTES),
+        'total_consultas': 0,
+        'total_ms': 0.0,
+        'desde': time.time()
+    })
+    return query_stats
+
+
+@pytest.fixture
+def con_token(monkeypatch):
+    import server
+    monkeypatch.setattr(server, 'DEBUG_TOKEN', TOKEN)
+
+
+def test_sin_debug_token_no_existe(cliente, estadisticas, monkeypatch):
+    import server
+    monkeypatch.setattr(server, 'DEBUG_TOKEN', None)
+
+    assert cliente.get(URL).status_code == 404
+    assert cliente.get(URL, headers={'X-Debug-Token': TOKEN}).status_code == 404
+    assert cliente.delete(URL, headers={'X-Debug-Token': TOKEN}).status_code == 404
+
+
+def test_token_incorrecto_403(cliente, estadisticas, con_token):
+    assert cliente.get(URL).status_code == 403
+    assert cliente.get(URL, headers={'X-Debug-Token': 'otro'}).status_code == 403
+    assert cliente.delete(URL, headers={'X-Debug-Token': 'otro'}).status_code == 403
+
+
+def test_agrega_tiempos_por_sentencia(cliente, estadisticas, con_token, venta):
+    venta_id, _ = venta
+    for _ in range(3):
+        assert cliente.get(f'/api/ventas/{venta_id}').status_code == 200
+
+    datos = cliente.get(URL, headers={'X-Debug-Token': TOKEN}).get_json()
+
+    por_sql = {s['sql']: s for s in datos['sentencias']}
+    select_venta = por_sql['SELECT * FROM ventas WHERE id = ?']
+    assert select_venta['llamadas'] == 3
+    assert select_venta['filas'] == 3
+    assert select_venta['endpoints'] == {'get_venta': 3}
+    assert 0 <= select_venta['max_ms'] <= select_venta['total_ms']
+    assert select_venta['promedio_ms'] == pytest.approx(select_venta['total_ms'] / 3, abs=1e-3)
+    assert datos['total_consultas'] == sum(s['llamadas'] for s in datos['sentencias'])
+    assert [r['endpoint'] for r in datos['requests_recientes']] == ['get_venta'] * 3
+    assert all(r['consultas'] >= 3 for r in datos['requests_recientes'])
+
+    # Orden por número de llamadas y límite
+    por_llamadas = cliente.get(f'{URL}?orden=llamadas&limite=1', headers={'X-Debug-Token': TOKEN}).get_json()
+    assert len(por_llamadas['sentencias']) == 1
+    assert por_llamadas['sentencias'][0]['llamadas'] == max(s['llamadas'] for s in datos['sentencias'])
+
+    assert cliente.delete(URL, headers={'X-Debug-Token': TOKEN}).status_code == 200
+    assert estadisticas.resumen()['sentencias'] == []
+
+
+def test_normalizar_sql_agrupa_listas_y_literales():
+    assert query_stats.normalizar_sql("SELECT * FROM productos WHERE id IN (%s, %s, %s)") == \
+        query_stats.normalizar_sql("SELECT *  FROM productos\n WHERE id IN (?, ?)") == \
+        'SELECT * FROM productos WHERE id IN (?...)'
+    assert query_stats.normalizar_sql("SELECT 1 FROM ventas WHERE metodo_pago = 'Tarjeta' -- x") == \
+        'SELECT ? FROM ventas WHERE metodo_pago = ?'
@@ -0,0 +1,53 @@
+"""
+Rangos semiabiertos de fechas (get_mexico_date_range) y su uso de idx_ventas_fecha
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from database.connection_dual import execute_update, transaction
+from utils.timezone_utils import get_mexico_date_range
+
+
+@pytest.mark.parametrize('inicio, fin, esperado', [
+    ('2024-01-31', None, (datetime(2024, 1, 31), datetime(2024, 2, 1))),
+    ('2024-02-28', '2024-02-29', (datetime(2024, 2, 28), datetime(2024, 3, 1))),  # bisiesto
+    ('2023-02-28', None, (datetime(2023, 2, 28), datetime(2023, 3, 1))),
+    ('2024-12-31', None, (datetime(2024, 12, 31), datetime(2025, 1, 1))),
+    ('2024-12-01', '2024-12-31', (datetime(2024, 12, 1), datetime(2025, 1, 1))),
+    (date(2025, 6, 30), datetime(2025, 6, 30, 23, 59), (datetime(2025, 6, 30), datetime(2025, 7, 1))),
+])
+def test_rango_semiabierto_en_cambios_de_mes_y_de_anio(inicio, fin, esperado):
+    assert get_mexico_date_range(inicio, fin) == esperado
+
+
+def test_ultimo_instante_del_dia_queda_dentro_y_la_medianoche_fuera():
+    desde, hasta = get_mexico_date_range('2024-12-31')
+
+    assert desde <= datetime(2024, 12, 31, 23, 59, 59, 999999) < hasta
+    assert not datetime(2025, 1, 1) < hasta
+
+
+def test_consultas_vigentes_usan_el_indice_de_fecha(db_sqlite):
+    """Con un año de ventas y estadísticas del planificador, como en una base real"""
+    import verificar_indices
+
+    with transaction() as tx:
+        tx.execute("""
+            CREATE TABLE entregas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                venta_id INTEGER NOT NULL,
+                estado TEXT
+            )
+        """)
+        tx.execute_values(
+            "INSERT INTO ventas (fecha, total) VALUES %s",
+            [(datetime(2023, 6, 1) + timedelta(hours=9 * i), 50.0) for i in range(2000)]
+        )
+        tx.execute_values("INSERT INTO entregas (venta_id, estado) VALUES %s",
+                          [(i, 'Entregado') for i in range(1, 2000, 10)])
+        tx.execute("CREATE INDEX idx_ventas_fecha ON ventas(fecha)")
+        tx.execute("CREATE INDEX idx_entregas_venta ON entregas(venta_id)")
+    execute_update("ANALYZE")
+
+    assert verificar_indices.verificar_indices()
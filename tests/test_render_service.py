@@ -0,0 +1,90 @@
+"""
+Servicio de renderizado: cupos con flock entre workers y respuestas 503/504 de la API
+"""
+import threading
+import time
+
+import pytest
+
+from utils import render_service
+
+
+@pytest.fixture
+def render(tmp_path, monkeypatch):
+    """Cupos en un directorio propio, espera corta y trabajos en el mismo proceso"""
+    monkeypatch.setattr(render_service, 'RENDER_DIR', str(tmp_path / 'render'))
+    monkeypatch.setattr(render_service, 'RENDER_ESPERA_MAX', 0.2)
+    monkeypatch.setattr(render_service, 'RENDER_PROCESOS', 0)
+    monkeypatch.setitem(render_service._state, 'stats',
+                        {'ok': 0, 'rechazados': 0, 'timeouts': 0, 'errores': 0})
+    yield render_service
+    render_service.cerrar()
+
+
+def test_trabajo_libera_el_cupo_al_terminar(render):
+    assert render.ejecutar(len, 'chasca') == 6
+
+    cupo = render._tomar_cupo()
+    assert cupo is not None  # el flock del trabajo ya se soltó
+    cupo.close()
+    assert render.get_stats()['ok'] == 1
+
+
+def test_cupo_ocupado_por_otro_worker_rechaza_tras_la_espera(render):
+    # flock sobre otra apertura del archivo: para este proceso es como si lo tuviera otro worker
+    ocupado = render._tomar_cupo()
+    try:
+        inicio = time.monotonic()
+        with pytest.raises(render.ServicioSaturado) as error:
+            render.ejecutar(len, 'chasca')
+        assert time.monotonic() - inicio >= 0.2
+        assert error.value.reintentar_en == 1
+    finally:
+        ocupado.close()
+    assert render.get_stats()['rechazados'] == 1
+    assert render.ejecutar(len, 'chasca') == 6
+
+
+def test_cola_local_llena_rechaza_sin_esperar(render, monkeypatch):
+    monkeypatch.setitem(render._state, 'pendientes', threading.BoundedSemaphore(1))
+    render._state['pendientes'].acquire()
+
+    with pytest.raises(render.ServicioSaturado):
+        render.ejecutar(len, 'chasca')
+
+
+def test_cupo_exclusivo_solo_uno_a_la_vez(render):
+    primero = render.tomar_cupo_exclusivo('exportacion_tickets')
+    with pytest.raises(render.ServicioSaturado):
+        render.tomar_cupo_exclusivo('exportacion_tickets')
+    primero.close()
+
+    render.tomar_cupo_exclusivo('exportacion_tickets').close()
+
+
+def test_api_503_con_retry_after_si_no_hay_cupo(cliente, cache_vacia, venta, render):
+    venta_id, _ = venta
+    ocupado = render._tomar_cupo()
+    try:
+        respuesta = cliente.get(f'/api/ticket/{venta_id}')
+    finally:
+        ocupado.close()
+
+    assert respuesta.status_code == 503
+    assert respuesta.headers['Retry-After'] == '1'
+    datos = respuesta.get_json()
+    assert datos['success'] is False
+    assert datos['cupos'] == render.RENDER_CUPOS
+
+
+def test_api_504_si_el_renderizado_excede_el_timeout(cliente, cache_vacia, venta, render, monkeypatch):
+    """Proceso hijo real: SIGALRM interrumpe el render y la API responde 504"""
+    monkeypatch.setattr(render, 'RENDER_PROCESOS', 1)
+    monkeypatch.setattr(render, 'RENDER_TIMEOUT', 1e-6)
+    venta_id, _ = venta
+
+    respuesta = cliente.get(f'/api/ticket/{venta_id}')
+
+    assert respuesta.status_code == 504
+    assert respuesta.get_json()['success'] is False
+    assert render.get_stats()['timeouts'] == 1
@@ -0,0 +1,71 @@
+"""
+Producto.reservar_stock: verificación y descuento atómicos de existencias
+"""
+import pytest
+
+from database.connection_dual import execute_insert, execute_query, transaction
+from database.models import Carrito, ItemCarrito, Producto, StockInsuficienteError
+
+
+def _producto(nombre: str, stock: int) -> Producto:
+    producto_id = execute_insert(
+        "INSERT INTO productos (nombre, precio, stock) VALUES (%s, %s, %s) RETURNING id",
+        (nombre, 30.0, stock)
+    )
+    return Producto(id=producto_id, nombre=nombre, precio=30.0, stock=stock)
+
+
+def _stock(producto: Producto) -> int:
+    return execute_query("SELECT stock FROM productos WHERE id = %s", (producto.id,))[0]['stock']
+
+
+def test_sobreventa_lanza_error_con_faltantes_y_no_descuenta(db_sqlite):
+    chasca = _producto('Chasca Mediana', 5)
+    elote = _producto('Elote', 1)
+
+    with pytest.raises(StockInsuficienteError) as error:
+        with transaction() as tx:
+            Producto.reservar_stock({chasca.id: 2, elote.id: 3}, tx)
+
+    assert error.value.faltantes == [
+        {'producto_id': elote.id, 'nombre': 'Elote', 'solicitado': 3, 'disponible': 1}
+    ]
+    # La transacción revirtió también el descuento del producto que sí alcanzaba
+    assert _stock(chasca) == 5
+    assert _stock(elote) == 1
+
+
+def test_venta_del_stock_exacto(db_sqlite):
+    chasca = _producto('Chasca Mediana', 4)
+
+    with transaction() as tx:
+        Producto.reservar_stock({chasca.id: 4}, tx)
+
+    assert _stock(chasca) == 0
+
+
+def test_lineas_repetidas_se_suman(db_sqlite):
+    chasca = _producto('Chasca Mediana', 5)
+
+    with transaction() as tx:
+        Producto.reservar_stock([(chasca.id, 2), (chasca.id, 3)], tx)
+    assert _stock(chasca) == 0
+
+    with pytest.raises(StockInsuficienteError) as error:
+        with transaction() as tx:
+            Producto.reservar_stock([(chasca.id, 1), (chasca.id, 1)], tx)
+    assert error.value.faltantes[0]['solicitado'] == 2
+
+
+def test_carrito_con_el_mismo_producto_en_dos_lineas(db_sqlite):
+    chasca = _producto('Chasca Mediana', 5)
+
+    carrito = Carrito()
+    carrito.items = [ItemCarrito(producto=chasca, cantidad=2), ItemCarrito(producto=chasca, cantidad=2)]
+    carrito.procesar_venta(metodo_pago='Efectivo')
+    assert _stock(chasca) == 1
+
+    carrito.items = [ItemCarrito(producto=chasca, cantidad=1), ItemCarrito(producto=chasca, cantidad=1)]
+    with pytest.raises(StockInsuficienteError):
+        carrito.procesar_venta(metodo_pago='Efectivo')
+    assert _stock(chasca) == 1
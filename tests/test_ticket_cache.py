@@ -0,0 +1,80 @@
+"""
+Cache de tickets PDF (utils/ticket_cache) y su uso en /api/ticket/<id>
+"""
+from database.connection_dual import execute_update
+from utils import ticket_cache
+from utils.pdf_generator import TicketGenerator
+
+
+def test_304_si_el_etag_coincide(cliente, cache_vacia, venta):
+    venta_id, _ = venta
+
+    primera = cliente.get(f'/api/ticket/{venta_id}')
+    assert primera.status_code == 200
+    assert primera.data.startswith(b'%PDF')
+    etag = primera.headers['ETag']
+
+    segunda = cliente.get(f'/api/ticket/{venta_id}', headers={'If-None-Match': etag})
+    assert segunda.status_code == 304
+    assert segunda.data == b''
+    assert segunda.headers['ETag'] == etag
+    assert 'immutable' in segunda.headers['Cache-Control']
+
+
+def test_cambio_en_una_linea_cambia_clave_y_etag(cliente, cache_vacia, venta):
+    venta_id, detalle_id = venta
+    etag = cliente.get(f'/api/ticket/{venta_id}').headers['ETag']
+
+    execute_update("UPDATE detalle_ventas SET cantidad = 2, subtotal = 100 WHERE id = %s", (detalle_id,))
+    execute_update("UPDATE ventas SET total = 100 WHERE id = %s", (venta_id,))
+
+    respuesta = cliente.get(f'/api/ticket/{venta_id}', headers={'If-None-Match': etag})
+    assert respuesta.status_code == 200
+    assert respuesta.headers['ETag'] != etag
+
+
+def test_cambio_de_plantilla_cambia_la_clave(cliente, cache_vacia, venta, monkeypatch):
+    venta_id, _ = venta
+    venta_data = {'id': venta_id, 'total': 50.0}
+    clave = TicketGenerator().clave_cache(venta_data, [])
+    etag = cliente.get(f'/api/ticket/{venta_id}').headers['ETag']
+
+    monkeypatch.setattr(TicketGenerator, 'VERSION_PLANTILLA', TicketGenerator.VERSION_PLANTILLA + 1)
+    assert TicketGenerator().clave_cache(venta_data, []) != clave
+
+    # La clave nueva no está en cache: el ticket se vuelve a generar aunque el cliente traiga el ETag
+    fallos = ticket_cache.get_cache_stats()['fallos']
+    respuesta = cliente.get(f'/api/ticket/{venta_id}', headers={'If-None-Match': etag})
+    assert respuesta.status_code == 200
+    assert ticket_cache.get_cache_stats()['fallos'] == fallos + 1
+
+
+def test_lru_expulsa_la_menos_usada_y_el_disco_la_recupera(cache_vacia, monkeypatch):
+    monkeypatch.setattr(ticket_cache, 'MEMORIA_MAX_BYTES', 250)
+    ticket_cache.guardar('a', b'A' * 100)
+    ticket_cache.guardar('b', b'B' * 100)
+    ticket_cache.obtener('a')  # 'a' pasa a ser la más reciente
+    ticket_cache.guardar('c', b'C' * 100)
+
+    assert list(ticket_cache._memoria['entradas']) == ['a', 'c']
+    assert ticket_cache.get_cache_stats()['bytes'] == 200
+
+    etag, datos = ticket_cache.obtener('b')
+    assert datos == b'B' * 100
+    assert ticket_cache.get_cache_stats()['disco'] == 1
+    assert list(ticket_cache._memoria['entradas']) == ['c', 'b']
+
+
+def test_mismo_contenido_se_guarda_una_vez_en_disco(cache_vacia):
+    etag_1 = ticket_cache.guardar('venta_1_v1', b'%PDF mismo contenido')
+    etag_2 = ticket_cache.guardar('venta_1_v2', b'%PDF mismo contenido')
+    assert etag_1 == etag_2
+
+    blobs = list((cache_vacia / 'blobs').rglob('*.pdf'))
+    assert len(blobs) == 1
+
+    # Otro worker (memoria vacía) lo encuentra en disco por cualquiera de las dos claves
+    ticket_cache._memoria['entradas'].clear()
+    ticket_cache._memoria['bytes'] = 0
+    assert ticket_cache.obtener('venta_1_v2') == (etag_2, b'%PDF mismo contenido')
+    assert ticket_cache.get_cache_stats()['disco'] == 1
@@ -0,0 +1,134 @@
+"""
+Atomicidad de transaction() con bloques de conexión anidados
+"""
+import pytest
+
+from database import cache_versiones, models
+from database.connection_dual import (
+    Transaction, execute_insert, execute_query, execute_update, get_db_connection, transaction
+)
+from database.models import Carrito, Producto
+
+
+def _crear_producto(stock: int = 10) -> Producto:
+    producto_id = execute_insert(
+        "INSERT INTO productos (nombre, precio, stock) VALUES (%s, %s, %s) RETURNING id",
+        ('Chasca chica', 35.0, stock)
+    )
+    return Producto(id=producto_id, nombre='Chasca chica', precio=35.0, stock=stock)
+
+
+def _conteo(tabla: str) -> int:
+    return execute_query(f"SELECT COUNT(*) AS n FROM {tabla}")[0]['n']
+
+
+def test_bloque_anidado_no_confirma_la_transaccion_externa(db_sqlite):
+    with pytest.raises(RuntimeError):
+        with transaction() as tx:
+            tx.execute_update("INSERT INTO ventas (total) VALUES (%s)", (10.0,))
+            # execute_update abre su propio get_db_connection: debe unirse a la transacción
+            execute_update("INSERT INTO ventas (total) VALUES (%s)", (20.0,))
+            raise RuntimeError("falla después de la llamada anidada")
+
+    assert _conteo('ventas') == 0
+
+
+def test_bloque_anidado_reutiliza_la_conexion_externa(db_sqlite):
+    with get_db_connection() as externa:
+        with get_db_connection() as interna:
+            assert interna is externa
+
+
+def test_error_tras_llamada_anidada_revierte_toda_la_venta(db_sqlite, monkeypatch):
+    producto = _crear_producto(stock=10)
+    invalidar = models.invalidar_catalogo
+
+    def invalidar_y_fallar(tx=None):
+        invalidar(tx)
+        # Primer uso en el proceso: cache_versiones crea su tabla con execute_update anidado
+        cache_versiones.get_version(cache_versiones.CATALOGO)
+        raise RuntimeError("falla tras invalidar el catálogo")
+
+    monkeypatch.setattr(models, 'invalidar_catalogo', invalidar_y_fallar)
+
+    carrito = Carrito()
+    carrito.agregar_producto(producto, 2)
+    with pytest.raises(RuntimeError):
+        carrito.procesar_venta(metodo_pago='Efectivo')
+
+    assert _conteo('ventas') == 0
+    assert _conteo('detalle_ventas') == 0
+    assert execute_query("SELECT stock FROM productos WHERE id = %s", (producto.id,))[0]['stock'] == 10
+
+    # Las tablas creadas dentro de la venta revertida no deben quedar marcadas como creadas
+    monkeypatch.setattr(models, 'invalidar_catalogo', invalidar)
+    carrito = Carrito()
+    carrito.agregar_producto(producto, 2)
+    assert carrito.procesar_venta(metodo_pago='Efectivo') is not None
+    assert _conteo('ventas') == 1
+    assert _conteo('ventas_diarias') == 1
+    assert _conteo('cache_versiones') == 1
+
+
+def test_venta_completa_se_confirma(db_sqlite):
+    producto = _crear_producto(stock=10)
+
+    carrito = Carrito()
+    carrito.agregar_producto(producto, 3)
+    venta = carrito.procesar_venta(metodo_pago='Efectivo')
+
+    assert venta is not None and venta.id
+    assert _conteo('ventas') == 1
+    assert _conteo('detalle_ventas') == 1
+    assert execute_query("SELECT stock FROM productos WHERE id = %s", (producto.id,))[0]['stock'] == 7
+
+
+def test_venta_usa_returning_id(db_sqlite, monkeypatch):
+    """Como en PostgreSQL: sin RETURNING, lastrowid no sirve (psycopg2 da 0)"""
+    execute_insert_original = Transaction.execute_insert
+
+    def execute_insert_postgres(self, query, params=()):
+        if 'RETURNING' not in query.upper():
+            self.execute(query, params)
+            return 0
+        return execute_insert_original(self, query, params)
+
+    monkeypatch.setattr(Transaction, 'execute_insert', execute_insert_postgres)
+    producto = _crear_producto(stock=10)
+
+    carrito = Carrito()
+    carrito.agregar_producto(producto, 2)
+    venta = carrito.procesar_venta(metodo_pago='Efectivo')
+
+    assert venta.id > 0
+    detalles = execute_query("SELECT venta_id FROM detalle_ventas")
+    assert [d['venta_id'] for d in detalles] == [venta.id]
+
+
+def test_venta_sin_id_valido_no_escribe_detalle(db_sqlite, monkeypatch):
+    monkeypatch.setattr(models.Venta, 'save', lambda self, tx=None: 0)
+    producto = _crear_producto(stock=10)
+
+    carrito = Carrito()
+    carrito.agregar_producto(producto, 2)
+    with pytest.raises(RuntimeError):
+        carrito.procesar_venta(metodo_pago='Efectivo')
+
+    assert _conteo('detalle_ventas') == 0
+    assert execute_query("SELECT stock FROM productos WHERE id = %s", (producto.id,))[0]['stock'] == 10
+
+
+def test_api_error_dentro_de_la_transaccion_no_deja_venta(cliente, monkeypatch):
+    producto = _crear_producto(stock=10)
+
+    def procesar_y_fallar(self, metodo_pago="Efectivo", vendedor="", observaciones="",
+                          fecha_personalizada=None, tx=None):
+        # Escribe parte de la venta y luego reporta fallo (retorna None)
+        tx.execute_insert("INSERT INTO ventas (total) VALUES (%s) RETURNING id", (70.0,))
+        return None
+
+    monkeypatch.setattr(Carrito, 'procesar_venta', procesar_y_fallar)
+    respuesta = cliente.post('/api/ventas', json={'items': [{'producto_id': producto.id, 'cantidad': 2}]})
+
+    assert respuesta.status_code == 500
+    assert _conteo('ventas') == 0
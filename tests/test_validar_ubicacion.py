@@ -0,0 +1,64 @@
+"""
+/api/entregas/validar-ubicacion/batch: límites del lote, puntos inválidos y zonas vectorizadas
+"""
+import random
+
+from database.zonas_entrega import ZonaEntrega
+
+URL = '/api/entregas/validar-ubicacion/batch'
+
+
+def _rectangulo(lat_min, lat_max, lng_min, lng_max):
+    return [(lat_min, lng_min), (lat_min, lng_max), (lat_max, lng_max), (lat_max, lng_min)]
+
+
+def test_lote_demasiado_grande_413(cliente, zonas, monkeypatch):
+    import server
+    monkeypatch.setattr(server, 'VALIDAR_LOTE_MAX', 3)
+
+    respuesta = cliente.post(URL, json={'puntos': [[21.88, -102.29]] * 4})
+
+    assert respuesta.status_code == 413
+    assert '(recibidos 4)' in respuesta.get_json()['error']
+    assert cliente.post(URL, json={'puntos': [[21.88, -102.29]] * 3}).status_code == 200
+
+
+def test_puntos_invalidos_400_con_sus_indices(cliente, zonas):
+    puntos = [[21.88, -102.29], [91, -102.29], [21.88, -102.29], [21.88, 181], [21.88, -102.29]]
+
+    respuesta = cliente.post(URL, json={'puntos': puntos})
+
+    assert respuesta.status_code == 400
+    assert respuesta.get_json()['indices_invalidos'] == [1, 3]
+
+
+def test_formato_de_punto_invalido_400(cliente, zonas):
+    assert cliente.post(URL, json={'puntos': [[21.88]]}).status_code == 400
+    assert cliente.post(URL, json={'puntos': [{'lat': 21.88}]}).status_code == 400
+    assert cliente.post(URL, json={'puntos': []}).status_code == 400
+
+
+def test_lote_igual_a_zona_de_por_punto(cliente, zonas):
+    centro = ZonaEntrega(nombre='Centro', poligono=_rectangulo(21.85, 21.90, -102.32, -102.27), tarifa=30)
+    plaza = ZonaEntrega(nombre='Plaza', poligono=_rectangulo(21.87, 21.88, -102.30, -102.29),
+                        tarifa=20, prioridad=5)
+    cerrado = ZonaEntrega(nombre='Cerrado', poligono=[(21.86, -102.31), (21.865, -102.30), (21.86, -102.29)],
+                          prioridad=5, excluida=True)
+    for zona in (centro, plaza, cerrado):
+        zonas.guardar(zona)
+
+    rng = random.Random(3)
+    puntos = [{'lat': rng.uniform(21.84, 21.91), 'lng': rng.uniform(-102.33, -102.26)} for _ in range(300)]
+    datos = cliente.post(URL, json={'puntos': puntos}).get_json()
+
+    esperadas = [zonas.zona_de(p['lat'], p['lng']) for p in puntos]
+    assert datos['total'] == 300
+    assert datos['zona_id'] == [zona.id if zona else None for zona in esperadas]
+    assert datos['tarifa_entrega'] == [zona.tarifa if zona else None for zona in esperadas]
+    assert datos['dentro'] == sum(zona is not None for zona in esperadas)
+    assert {plaza.id, centro.id, None} <= set(datos['zona_id'])
+
+    # Y coincide con el endpoint de un solo punto
+    for punto, zona_id in list(zip(puntos, datos['zona_id']))[:20]:
+        uno = cliente.post('/api/entregas/validar-ubicacion', json=punto).get_json()
+        assert (uno['zona'] or {}).get('id') == zona_id
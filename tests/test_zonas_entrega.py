@@ -0,0 +1,126 @@
+"""
+Zonas de entrega: precedencia entre polígonos, zonas excluidas, bordes y R-tree STR
+"""
+import random
+
+import numpy as np
+import pytest
+
+from database import cache_versiones, zonas_entrega
+from database.zonas_entrega import ZonaEntrega
+from utils.indice_espacial import RTree
+
+
+def _rectangulo(lat_min, lat_max, lng_min, lng_max):
+    return [(lat_min, lng_min), (lat_min, lng_max), (lat_max, lng_max), (lat_max, lng_min)]
+
+
+def _zona(nombre, poligono, prioridad=0, excluida=False, tarifa=30.0) -> ZonaEntrega:
+    zona = ZonaEntrega(nombre=nombre, poligono=poligono, tarifa=tarifa, prioridad=prioridad, excluida=excluida)
+    zonas_entrega.guardar(zona)
+    return zona
+
+
+def _en_lote(puntos):
+    lats = np.array([p[0] for p in puntos])
+    lngs = np.array([p[1] for p in puntos])
+    return [zona.id if zona else None for zona in zonas_entrega.zonas_de_lote(lats, lngs)]
+
+
+def _una_a_una(puntos):
+    return [zona.id if zona else None for zona in (zonas_entrega.zona_de(*p) for p in puntos)]
+
+
+def test_zonas_superpuestas_gana_la_de_mayor_prioridad(zonas):
+    centro = _zona('Centro', _rectangulo(21.85, 21.90, -102.32, -102.27), prioridad=0, tarifa=30)
+    plaza = _zona('Plaza Patria', _rectangulo(21.87, 21.88, -102.30, -102.29), prioridad=5, tarifa=20)
+
+    puntos = [(21.875, -102.295), (21.86, -102.31), (21.95, -102.30)]
+    assert _una_a_una(puntos) == [plaza.id, centro.id, None]
+    assert _en_lote(puntos) == [plaza.id, centro.id, None]
+
+    # Bajar la prioridad de la zona interior: ahora la cubre la exterior
+    plaza.prioridad = -1
+    zonas.guardar(plaza)
+    assert _una_a_una(puntos[:1]) == _en_lote(puntos[:1]) == [centro.id]
+
+
+def test_zona_excluida_dentro_de_otra(zonas):
+    centro = _zona('Centro', _rectangulo(21.85, 21.90, -102.32, -102.27))
+    _zona('Fraccionamiento cerrado', _rectangulo(21.87, 21.88, -102.30, -102.29), prioridad=1, excluida=True)
+
+    puntos = [(21.875, -102.295), (21.86, -102.31)]
+    assert _una_a_una(puntos) == [None, centro.id]
+    assert _en_lote(puntos) == [None, centro.id]
+
+
+def test_punto_en_el_borde_compartido_pertenece_a_una_sola_zona(zonas):
+    oeste = _zona('Oeste', _rectangulo(21.85, 21.90, -102.32, -102.29))
+    este = _zona('Este', _rectangulo(21.85, 21.90, -102.29, -102.26))
+
+    borde = (21.875, -102.29)
+    dueno = zonas.zona_de(*borde)
+    assert dueno is not None
+    assert dueno.id in (oeste.id, este.id)
+    assert zonas.zonas_de_lote(np.array([borde[0]]), np.array([borde[1]]))[0].id == dueno.id
+
+    # El R-tree sí devuelve ambas cajas: la regla par-impar decide sin duplicar
+    indice = zonas._indice()
+    assert len(indice.rtree.buscar(*borde)) == 2
+    assert len(indice.zonas_en(*borde)) == 1
+
+
+def test_lote_coincide_con_zona_de(zonas):
+    _zona('Centro', _rectangulo(21.85, 21.90, -102.32, -102.27), prioridad=0)
+    _zona('Plaza', _rectangulo(21.87, 21.88, -102.30, -102.29), prioridad=5)
+    _zona('Cerrado', [(21.86, -102.31), (21.865, -102.30), (21.86, -102.29)], prioridad=5, excluida=True)
+    _zona('Triángulo', [(21.88, -102.28), (21.92, -102.26), (21.88, -102.24)], prioridad=2)
+
+    rng = random.Random(7)
+    puntos = [(rng.uniform(21.84, 21.93), rng.uniform(-102.33, -102.23)) for _ in range(500)]
+    assert _en_lote(puntos) == _una_a_una(puntos)
+
+
+def test_guardar_y_la_version_van_en_la_misma_transaccion(zonas, monkeypatch):
+    version = cache_versiones.get_version(cache_versiones.ZONAS_ENTREGA)
+    _zona('Centro', _rectangulo(21.85, 21.90, -102.32, -102.27))
+    assert cache_versiones.get_version(cache_versiones.ZONAS_ENTREGA) == version + 1
+
+    def falla(clave, tx=None):
+        raise RuntimeError('sin cache_versiones')
+
+    monkeypatch.setattr(cache_versiones, 'incrementar_version', falla)
+    with pytest.raises(RuntimeError):
+        _zona('Norte', _rectangulo(21.90, 21.95, -102.32, -102.27))
+    # Sin la versión, ningún worker se enteraría: la zona tampoco se guardó
+    assert [zona.nombre for zona in zonas.listar()] == ['Centro']
+
+
+def test_eliminar(zonas):
+    centro = _zona('Centro', _rectangulo(21.85, 21.90, -102.32, -102.27))
+    version = cache_versiones.get_version(cache_versiones.ZONAS_ENTREGA)
+
+    assert zonas.eliminar(centro.id) is True
+    assert zonas.zona_de(21.875, -102.295) is None
+    assert zonas.eliminar(centro.id) is False
+    assert cache_versiones.get_version(cache_versiones.ZONAS_ENTREGA) == version + 1
+
+
+def test_rtree_igual_a_revisar_todas_las_cajas():
+    rng = random.Random(11)
+    cajas = []
+    for _ in range(300):
+        lat, lng = rng.uniform(21.80, 21.95), rng.uniform(-102.35, -102.20)
+        cajas.append((lat, lat + rng.uniform(0.001, 0.03), lng, lng + rng.uniform(0.001, 0.03)))
+    indice = RTree(cajas, capacidad=4)
+    assert indice.altura > 2
+    assert len(indice) == 300
+
+    for _ in range(300):
+        lat, lng = rng.uniform(21.80, 21.98), rng.uniform(-102.35, -102.17)
+        esperado = [i for i, (a, b, c, d) in enumerate(cajas) if a <= lat <= b and c <= lng <= d]
+        assert sorted(indice.buscar(lat, lng)) == esperado
+
+    # Un punto en la esquina de una caja cuenta (cajas cerradas)
+    assert 0 in indice.buscar(cajas[0][1], cajas[0][3])
+    assert RTree([]).buscar(21.88, -102.29) == []
@@ -0,0 +1,164 @@
+"""
+Generador de tickets en ESC/POS para impresoras térmicas
+Produce los bytes que se envían tal cual a la impresora (USB/Bluetooth/red),
+a partir de los mismos venta_data/detalle_rows que TicketGenerator.
+
+- Página de códigos PC858 (PC850 + €) para acentos, ñ, ¡ y ¿
+- Texto ajustado al ancho de la impresora: 32 (58mm), 42 o 48 columnas (80mm)
+- Código de barras CODE128 opcional con el ID de la venta
+"""
+import textwrap
+import unicodedata
+from functools import lru_cache
+from typing import Tuple
+
+from database import configuracion
+from utils.pdf_generator import formatear_fecha_ticket, vendedor_de_notas
+
+ESC = b'\x1b'
+GS = b'\x1d'
+
+INIT = ESC + b'@'
+CORTE = GS + b'V\x42\x00'  # avanzar y cortar
+ALINEAR_IZQUIERDA = ESC + b'a\x00'
+ALINEAR_CENTRO = ESC + b'a\x01'
+NEGRITA_ON = ESC + b'E\x01'
+NEGRITA_OFF = ESC + b'E\x00'
+TAMANO_NORMAL = GS + b'!\x00'
+TAMANO_DOBLE = GS + b'!\x11'
+
+# Número de tabla para ESC t n y codec de Python equivalente
+PAGINAS_CODIGOS = {
+    'cp858': 19,
+    'cp850': 2,
+}
+
+COLUMNAS_SOPORTADAS = (32, 42, 48)
+
+# Anchos de columna (producto, cantidad, precio unitario, total) por ancho de papel
+_ANCHOS_TABLA = {
+    32: (13, 4, 7, 8),
+    42: (20, 5, 8, 9),
+    48: (24, 5, 9, 10),
+}
+
+
+def _a_ascii(texto: str) -> str:
+    """Quita acentos y símbolos que la página de códigos no tiene"""
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+
+
+@lru_cache(maxsize=2048)
+def _ajustar(texto: str, ancho: int) -> Tuple[str, ...]:
+    """
+    Renglones de `texto` a `ancho` columnas (como textwrap.wrap). Los nombres de
+    productos y los textos fijos se repiten entre tickets: se ajustan una sola vez.
+    """
+    if len(texto) <= ancho and texto.isprintable() and texto == texto.strip():
+        return (texto,) if texto else ('',)
+    return tuple(textwrap.wrap(texto, ancho)) or ('',)
+
+
+class EscPosTicketGenerator:
+    def __init__(self, columnas: int = 48, pagina_codigos: str = 'cp858'):
+        if columnas not in COLUMNAS_SOPORTADAS:
+            raise ValueError(f"Ancho no soportado: {columnas} (usar {COLUMNAS_SOPORTADAS})")
+        if pagina_codigos not in PAGINAS_CODIGOS:
+            raise ValueError(f"Página de códigos no soportada: {pagina_codigos}")
+        self.columnas = columnas
+        self.pagina_codigos = pagina_codigos
+
+    def get_configuracion(self, clave: str, default: str = "") -> str:
+        """Obtiene un valor de configuración (desde la cache del servicio de configuración)"""
+        return configuracion.get(clave, default) or default
+
+    def _codificar(self, texto: str) -> bytes:
+        try:
+            return texto.encode(self.pagina_codigos)
+        except UnicodeEncodeError:
+            return ''.join(
+                c if c.encode(self.pagina_codigos, 'ignore') else _a_ascii(c) or '?'
+                for c in texto
+            ).encode(self.pagina_codigos)
+
+    def _lineas(self, texto: str, ancho: int = None) -> Tuple[str, ...]:
+        return _ajustar(str(texto), ancho or self.columnas)
+
+    def _texto(self, texto: str, ancho: int = None) -> bytes:
+        """Texto ajustado al ancho, una línea por renglón"""
+        return b''.join(self._codificar(linea) + b'\n' for linea in self._lineas(texto, ancho))
+
+    def _separador(self, caracter: str = '-') -> bytes:
+        return self._codificar(caracter * self.columnas) + b'\n'
+
+    def _codigo_barras(self, venta_id: int) -> bytes:
+        datos = b'{B' + str(venta_id).encode('ascii')  # CODE128, juego B
+        return (
+            GS + b'h\x50' +          # alto: 80 puntos
+            GS + b'w\x02' +          # ancho de módulo
+            GS + b'H\x02' +          # número legible debajo
+            GS + b'k\x49' + bytes([len(datos)]) + datos + b'\n'
+        )
+
+    def generar_ticket(self, venta_data: dict, detalle_rows: list, codigo_barras: bool = False) -> bytes:
+        """Genera el ticket como flujo de bytes ESC/POS"""
+        partes = [INIT, ESC + b't' + bytes([PAGINAS_CODIGOS[self.pagina_codigos]])]
+
+        # Encabezado (en tamaño doble caben la mitad de columnas)
+        partes += [ALINEAR_CENTRO, NEGRITA_ON, TAMANO_DOBLE]
+        partes.append(self._texto(self.get_configuracion('nombre_negocio', 'Mi Chas-K'), self.columnas // 2))
+        partes += [TAMANO_NORMAL, NEGRITA_OFF]
+        partes.append(self._texto(self.get_configuracion('direccion', 'Aguascalientes, Ags.')))
+        telefono = self.get_configuracion('telefono', '')
+        if telefono:
+            partes.append(self._texto(f"Tel: {telefono}"))
+        partes += [ALINEAR_IZQUIERDA, self._separador('=')]
+
+        # Información de la venta
+        venta_id = venta_data.get('id', 0)
+        partes += [NEGRITA_ON, self._texto(f"TICKET #{venta_id}"), NEGRITA_OFF]
+        partes.append(self._texto(f"Fecha: {formatear_fecha_ticket(venta_data.get('fecha'))}"))
+        partes.append(self._texto(f"Pago: {venta_data.get('metodo_pago', 'Efectivo')}"))
+        vendedor = vendedor_de_notas(venta_data.get('notas', ''))
+        if vendedor:
+            partes.append(self._texto(f"Atiende: {vendedor}"))
+        partes.append(self._separador())
+
+        # Tabla de productos: el nombre se parte en renglones, las cifras van en el primero
+        ancho_nombre, ancho_cant, ancho_pu, ancho_total = _ANCHOS_TABLA[self.columnas]
+        encabezado = (f"{'Producto':<{ancho_nombre}}{'Cant':>{ancho_cant}}"
+                      f"{'P.U.':>{ancho_pu}}{'Total':>{ancho_total}}")
+        partes += [NEGRITA_ON, self._codificar(encabezado) + b'\n', NEGRITA_OFF]
+
+        total_general = 0
+        for detalle in detalle_rows:
+            cantidad = detalle.get('cantidad', 1)
+            precio_unit = float(detalle.get('precio_unitario', 0))
+            subtotal = float(detalle.get('subtotal', 0))
+            total_general += subtotal
+
+            nombre = self._lineas(detalle.get('producto_nombre', 'Producto'), ancho_nombre - 1)
+            partes.append(self._codificar(
+                f"{nombre[0]:<{ancho_nombre}}{cantidad:>{ancho_cant}}"
+                f"{f'${precio_unit:.2f}':>{ancho_pu}}{f'${subtotal:.2f}':>{ancho_total}}"
+            ) + b'\n')
+            for linea in nombre[1:]:
+                partes.append(self._codificar(linea) + b'\n')
+
+        partes.append(self._separador('='))
+
+        # Total
+        total_venta = float(venta_data.get('total', total_general))
+        partes += [ALINEAR_CENTRO, NEGRITA_ON, TAMANO_DOBLE,
+                   self._texto(f"TOTAL: ${total_venta:.2f}", self.columnas // 2),
+                   TAMANO_NORMAL, NEGRITA_OFF, self._separador()]
+
+        # Mensaje de agradecimiento
+        mensaje = self.get_configuracion('mensaje_ticket', '¡Gracias por tu compra!')
+        partes += [NEGRITA_ON, self._texto(mensaje), NEGRITA_OFF]
+
+        if codigo_barras:
+            partes.append(self._codigo_barras(venta_id))
+
+        partes += [ALINEAR_IZQUIERDA, b'\n\n\n', CORTE]
+        return b''.join(partes)
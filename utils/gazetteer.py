@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Nomenclátor local de direcciones para el autocompletado de /api/direcciones/buscar
+El área de entrega es un círculo de ~10 km: todas sus calles, colonias y códigos
+postales caben en memoria, así que se buscan aquí (< 1 ms) y solo se consulta
+Nominatim cuando no hay coincidencias.
+
+Índice (se construye al cargar, una vez por proceso):
+- Prefijos: lista ordenada de (clave normalizada, id) con una clave por cada
+  palabra del nombre ("lopez mateos" encuentra "Av. Adolfo López Mateos"); bisect
+- Trigramas: trigrama -> ids, sobre "nombre colonia cp"; tolera errores de dedo
+  y consultas que mezclan calle y colonia. Solo se usa si no hay coincidencias por
+  prefijo; el conteo por entrada es un np.bincount (ids en arreglos int32)
+
+El archivo (GAZETTEER_PATH, JSON comprimido por columnas) se genera con:
+
+    python -m utils.gazetteer --csv direcciones.csv
+    python -m utils.gazetteer --osm aguascalientes.osm.bz2
+
+CSV: columnas nombre, colonia, codigo_postal, lat, lon y opcionalmente tipo
+(calle, colonia o codigo_postal; default calle). Del extracto OSM (XML, .osm,
+.osm.gz o .osm.bz2) se toman las vías con nombre, los lugares (suburb,
+neighbourhood, quarter) y los addr:postcode. Los centroides de colonias y códigos
+postales que no vengan en el archivo se calculan a partir de sus calles.
+"""
+import argparse
+import bz2
+import csv
+import gzip
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.geo import haversine_km
+from utils.geocoding import normalizar
+
+logger = logging.getLogger(__name__)
+
+GAZETTEER_PATH = os.getenv('GAZETTEER_PATH') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'gazetteer.json.gz'
+)
+SIMILITUD_MINIMA = float(os.getenv('GAZETTEER_SIMILITUD_MINIMA', '0.5'))  # trigramas en común / de la consulta
+CIUDAD = 'Aguascalientes, Ags.'
+
+TIPOS = ('calle', 'colonia', 'codigo_postal')
+_PRIORIDAD = {'colonia': 0, 'calle': 1, 'codigo_postal': 2}  # a igual coincidencia, colonias primero
+_TIPO_OSM = {'calle': 'road', 'colonia': 'suburb', 'codigo_postal': 'postcode'}
+VERSION = 1
+
+Entrada = Dict[str, Any]
+
+
+def _trigramas(texto: str) -> set:
+    texto = f'  {texto} '
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+# ============================================================================
+# Índice en memoria
+# ============================================================================
+
+class Gazetteer:
+    """Entradas por columnas más los índices de prefijos y trigramas"""
+
+    def __init__(self, datos: Optional[Dict[str, Any]] = None):
+        datos = datos or {}
+        columnas = ('tipos', 'nombres', 'colonias', 'cps', 'lats', 'lons')
+        filas = sorted(
+            zip(*(datos.get(columna, []) for columna in columnas)),
+            key=lambda fila: (_PRIORIDAD[fila[0]], len(fila[1]), fila[1])
+        )
+        # Los ids quedan en orden de relevancia: el menor id es el mejor resultado
+        self.tipos, self.nombres, self.colonias, self.cps, self.lats, self.lons = (
+            [list(columna) for columna in zip(*filas)] if filas else [[] for _ in columnas]
+        )
+        self._indexar()
+
+    def __len__(self) -> int:
+        return len(self.nombres)
+
+    def _indexar(self):
+        claves: List[Tuple[str, int]] = []
+        trigramas: Dict[str, List[int]] = defaultdict(list)
+        for i, nombre in enumerate(self.nombres):
+            palabras = normalizar(nombre).split()
+            for n in range(len(palabras)):
+                claves.append((' '.join(palabras[n:]), i))
+            for trigrama in _trigramas(normalizar(f'{nombre} {self.colonias[i]} {self.cps[i]}')):
+                trigramas[trigrama].append(i)
+        claves.sort()
+        self._claves = [clave for clave, _ in claves]
+        self._ids = [i for _, i in claves]
+        self._trigramas = {t: np.array(ids, dtype=np.int32) for t, ids in trigramas.items()}
+
+    def _por_prefijo(self, consulta: str) -> List[int]:
+        inicio = bisect_left(self._claves, consulta)
+        fin = bisect_left(self._claves, consulta + '\uffff', inicio)
+        return self._ids[inicio:fin]
+
+    def _por_trigramas(self, consulta: str, limite: int) -> List[int]:
+        """
+        Ids de las entradas con al menos SIMILITUD_MINIMA de los trigramas de la
+        consulta, de más a menos trigramas en común. El conteo es un bincount sobre
+        las listas de la consulta: un trigrama común (" ca", "lle") tiene miles de ids.
+        """
+        trigramas = _trigramas(consulta)
+        listas = [self._trigramas[t] for t in trigramas if t in self._trigramas]
+        if not listas:
+            return []
+        coincidencias = np.bincount(np.concatenate(listas), minlength=len(self.nombres))
+        candidatos = np.flatnonzero(coincidencias >= SIMILITUD_MINIMA * len(trigramas))
+        # Orden estable: a igual número de trigramas gana el id menor (el más relevante)
+        orden = np.argsort(-coincidencias[candidatos], kind='stable')[:limite]
+        return candidatos[orden].tolist()
+
+    def buscar(self, consulta: str, limite: int = 5) -> List[Entrada]:
+        """Coincidencias por prefijo de palabra; si no hay, por similitud de trigramas"""
+        consulta = normalizar(consulta)
+        if not consulta or not self.nombres:
+            return []
+
+        ids = heapq.nsmallest(limite, set(self._por_prefijo(consulta)))
+        if not ids:
+            ids = self._por_trigramas(consulta, limite)
+        return [self._resultado(i) for i in ids]
+
+    def _resultado(self, i: int) -> Entrada:
+        """Mismo formato que los resultados de Nominatim (utils.geocoding)"""
+        tipo, nombre, colonia, cp = self.tipos[i], self.nombres[i], self.colonias[i], self.cps[i]
+        address = {'city': 'Aguascalientes', 'state': 'Aguascalientes', 'country': 'México'}
+        if tipo == 'calle':
+            address['road'] = nombre
+        if colonia:
+            address['suburb'] = colonia
+        if cp:
+            address['postcode'] = cp
+        partes = [nombre]
+        if colonia and colonia != nombre:
+            partes.append(colonia)
+        partes.append(f'{cp} {CIUDAD}' if cp and cp != nombre else CIUDAD)
+        return {
+            'display_name': ', '.join(partes),
+            'lat': self.lats[i],
+            'lon': self.lons[i],
+            'type': _TIPO_OSM[tipo],
+            'address': address
+        }
+
+
+# ============================================================================
+# Carga (una vez por proceso)
+# ============================================================================
+
+_state = {
+    'lock': threading.Lock(),
+    'indice': None,
+    'stats': {'aciertos': 0, 'fallos': 0}
+}
+
+
+def cargar(ruta: str = None) -> Gazetteer:
+    """Lee el archivo del nomenclátor y reemplaza el índice del proceso"""
+    ruta = ruta or GAZETTEER_PATH
+    inicio = time.perf_counter()
+    try:
+        with gzip.open(ruta, 'rt', encoding='utf-8') as f:
+            datos = json.load(f)
+    except FileNotFoundError:
+        logger.info(f"ℹ️ Sin nomenclátor local ({ruta}): las búsquedas van a Nominatim")
+        datos = None
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ Nomenclátor local ilegible ({ruta}): {e}")
+        datos = None
+    indice = Gazetteer(datos)
+    if datos:
+        logger.info(f"🗺️ Nomenclátor local: {len(indice)} entradas en "
+                    f"{(time.perf_counter() - inicio) * 1000:.0f}ms")
+    with _state['lock']:
+        _state['indice'] = indice
+    return indice
+
+
+def _indice() -> Gazetteer:
+    indice = _state['indice']
+    if indice is None:
+        with _state['lock']:
+            indice = _state['indice']
+        if indice is None:
+            indice = cargar()
+    return indice
+
+
+def buscar(consulta: str, limite: int = 5) -> List[Entrada]:
+    """Direcciones del nomenclátor local; lista vacía si no hay coincidencias"""
+    resultados = _indice().buscar(consulta, limite)
+    with _state['lock']:
+        _state['stats']['aciertos' if resultados else 'fallos'] += 1
+    return resultados
+
+
+def get_stats() -> Dict[str, int]:
+    """Búsquedas resueltas localmente, sin coincidencias y tamaño del índice"""
+    with _state['lock']:
+        indice = _state['indice']
+        return {**_state['stats'], 'entradas': len(indice) if indice is not None else 0}
+
+
+# ============================================================================
+# Importación (CSV o extracto OSM)
+# ============================================================================
+
+def _abrir(ruta: str, modo: str = 'rb'):
+    if ruta.endswith('.bz2'):
+        return bz2.open(ruta, modo)
+    if ruta.endswith('.gz'):
+        return gzip.open(ruta, modo)
+    return open(ruta, modo)
+
+
+def leer_csv(ruta: str) -> List[Entrada]:
+    entradas = []
+    with _abrir(ruta, 'rt') as f:
+        for fila in csv.DictReader(f):
+            tipo = (fila.get('tipo') or 'calle').strip()
+            if tipo not in TIPOS:
+                raise ValueError(f"Tipo desconocido en {ruta}: {tipo}")
+            entradas.append({
+                'tipo': tipo,
+                'nombre': fila['nombre'].strip(),
+                'colonia': (fila.get('colonia') or '').strip(),
+                'cp': (fila.get('codigo_postal') or '').strip(),
+                'lat': float(fila['lat']),
+                'lon': float(fila['lon'])
+            })
+    return entradas
+
+
+def leer_osm(ruta: str) -> List[Entrada]:
+    """
+    Vías con nombre (highway=*), lugares (place=suburb/neighbourhood/quarter) y
+    códigos postales de un extracto OSM en XML. Cada vía se reduce a su centroide;
+    la colonia de una calle es el lugar más cercano a ese centroide.
+    """
+    nodos: Dict[str, Tuple[float, float]] = {}
+    vias: List[Entrada] = []
+    lugares: List[Entrada] = []
+    with _abrir(ruta) as f:
+        for _, elemento in ET.iterparse(f):
+            if elemento.tag not in ('node', 'way'):
+                continue
+            tags = {t.get('k'): t.get('v') for t in elemento.iter('tag')}
+            if elemento.tag == 'node':
+                lat, lon = float(elemento.get('lat')), float(elemento.get('lon'))
+                nodos[elemento.get('id')] = (lat, lon)
+                coords = [(lat, lon)]
+            else:
+                coords = [nodos[nd.get('ref')] for nd in elemento.iter('nd') if nd.get('ref') in nodos]
+            nombre = tags.get('name')
+            if nombre and coords:
+                lat = sum(c[0] for c in coords) / len(coords)
+                lon = sum(c[1] for c in coords) / len(coords)
+                entrada = {'nombre': nombre, 'colonia': '', 'cp': tags.get('addr:postcode', ''),
+                           'lat': lat, 'lon': lon, 'peso': len(coords)}
+                if tags.get('place') in ('suburb', 'neighbourhood', 'quarter'):
+                    lugares.append({**entrada, 'tipo': 'colonia', 'colonia': nombre})
+                elif elemento.tag == 'way' and 'highway' in tags:
+                    vias.append({**entrada, 'tipo': 'calle'})
+            elemento.clear()
+
+    for via in vias:
+        if lugares:
+            cercano = min(lugares, key=lambda l: (l['lat'] - via['lat']) ** 2 + (l['lon'] - via['lon']) ** 2)
+            via['colonia'] = cercano['colonia']
+
+    # Una calle partida en muchas vías: una entrada por (calle, colonia), centroide ponderado
+    calles: Dict[Tuple[str, str], Entrada] = {}
+    for via in vias:
+        clave = (normalizar(via['nombre']), via['colonia'])
+        calle = calles.get(clave)
+        if calle is None:
+            calles[clave] = dict(via)
+            continue
+        peso = calle['peso'] + via['peso']
+        calle['lat'] = (calle['lat'] * calle['peso'] + via['lat'] * via['peso']) / peso
+        calle['lon'] = (calle['lon'] * calle['peso'] + via['lon'] * via['peso']) / peso
+        calle['peso'] = peso
+        calle['cp'] = calle['cp'] or via['cp']
+    return lugares + list(calles.values())
+
+
+def _agregar_derivados(entradas: List[Entrada]) -> List[Entrada]:
+    """Colonias y códigos postales sin entrada propia: centroide de sus calles"""
+    existentes = {(e['tipo'], normalizar(e['nombre'])) for e in entradas}
+    grupos: Dict[Tuple[str, str], List[Entrada]] = defaultdict(list)
+    for entrada in entradas:
+        if entrada['tipo'] != 'calle':
+            continue
+        if entrada['colonia']:
+            grupos[('colonia', entrada['colonia'])].append(entrada)
+        if entrada['cp']:
+            grupos[('codigo_postal', entrada['cp'])].append(entrada)
+
+    derivadas = []
+    for (tipo, nombre), calles in grupos.items():
+        if (tipo, normalizar(nombre)) in existentes:
+            continue
+        cps = Counter(c['cp'] for c in calles if c['cp'])
+        colonias = Counter(c['colonia'] for c in calles if c['colonia'])
+        derivadas.append({
+            'tipo': tipo,
+            'nombre': nombre,
+            'colonia': nombre if tipo == 'colonia' else (colonias.most_common(1)[0][0] if len(colonias) == 1 else ''),
+            'cp': nombre if tipo == 'codigo_postal' else (cps.most_common(1)[0][0] if cps else ''),
+            'lat': sum(c['lat'] for c in calles) / len(calles),
+            'lon': sum(c['lon'] for c in calles) / len(calles)
+        })
+    return entradas + derivadas
+
+
+def construir(entradas: Iterable[Entrada], centro: Tuple[float, float], radio_km: float) -> Dict[str, Any]:
+    """Datos del archivo: entradas dentro del radio, sin duplicados, por columnas"""
+    entradas = list(entradas)
+    distancias = haversine_km(centro[0], centro[1], [e['lat'] for e in entradas], [e['lon'] for e in entradas])
+    dentro = [e for e, distancia in zip(entradas, np.atleast_1d(distancias)) if distancia <= radio_km]
+    unicas: Dict[Tuple[str, str, str, str], Entrada] = {}
+    for entrada in _agregar_derivados(dentro):
+        unicas.setdefault((entrada['tipo'], normalizar(entrada['nombre']), entrada['colonia'], entrada['cp']), entrada)
+    ordenadas = sorted(unicas.values(), key=lambda e: (e['tipo'], normalizar(e['nombre'])))
+    return {
+        'version': VERSION,
+        'centro': list(centro),
+        'radio_km': radio_km,
+        'tipos': [e['tipo'] for e in ordenadas],
+        'nombres': [e['nombre'] for e in ordenadas],
+        'colonias': [e['colonia'] for e in ordenadas],
+        'cps': [e['cp'] for e in ordenadas],
+        'lats': [round(e['lat'], 6) for e in ordenadas],
+        'lons': [round(e['lon'], 6) for e in ordenadas],
+    }
+
+
+def guardar(datos: Dict[str, Any], ruta: str = None):
+    """Escritura atómica del archivo comprimido"""
+    ruta = ruta or GAZETTEER_PATH
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    tmp = ruta + '.tmp'
+    with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+        json.dump(datos, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp, ruta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el nomenclátor local de direcciones")
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument('--csv', help="CSV con nombre, colonia, codigo_postal, lat, lon[, tipo]")
+    origen.add_argument('--osm', help="Extracto OSM en XML (.osm, .osm.gz, .osm.bz2)")
+    parser.add_argument('--destino', default=GAZETTEER_PATH, help=f"Archivo de salida (default: {GAZETTEER_PATH})")
+    parser.add_argument('--lat', type=float, default=float(os.getenv('BUSINESS_LAT', '21.8853')),
+                        help="Centro del área (default: BUSINESS_LAT)")
+    parser.add_argument('--lng', type=float, default=float(os.getenv('BUSINESS_LNG', '-102.2916')),
+                        help="Centro del área (default: BUSINESS_LNG)")
+    parser.add_argument('--radio', type=float, default=float(os.getenv('MAX_DELIVERY_DISTANCE_KM', '10')) + 2,
+                        help="Radio en km a conservar (default: radio de entrega + 2)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    print(f"🗺️ Leyendo {args.csv or args.osm}...")
+    entradas = leer_csv(args.csv) if args.csv else leer_osm(args.osm)
+    datos = construir(entradas, (args.lat, args.lng), args.radio)
+    guardar(datos, args.destino)
+    conteo = Counter(datos['tipos'])
+    print(f"✅ {len(datos['nombres'])} entradas ({conteo['calle']} calles, {conteo['colonia']} colonias, "
+          f"{conteo['codigo_postal']} códigos postales) en {args.destino}")
+
+
+if __name__ == '__main__':
+    main()
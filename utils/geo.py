@@ -0,0 +1,131 @@
+"""
+Utilidades geográficas: distancia Haversine, geohash y polígonos
+Coordenadas en grados decimales (WGS84), distancias en kilómetros.
+Las funciones de distancia y de punto-en-polígono por lote usan NumPy y aceptan
+arreglos (miles de puntos en una sola operación).
+"""
+from typing import List, Tuple, Union
+
+import numpy as np
+
+RADIO_TIERRA_KM = 6371
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_BASE32_VALOR = {c: i for i, c in enumerate(_BASE32)}
+
+Coordenada = Union[float, np.ndarray]
+
+
+def haversine_km(lat1: Coordenada, lng1: Coordenada, lat2: Coordenada, lng2: Coordenada) -> Coordenada:
+    """
+    Distancia Haversine vectorizada: cada argumento puede ser un número o un arreglo
+    (se aplica broadcasting), p. ej. un origen contra un arreglo de destinos.
+    """
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return RADIO_TIERRA_KM * 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def distancia_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distancia Haversine entre dos puntos (mismo kernel que haversine_km)"""
+    return float(haversine_km(lat1, lng1, lat2, lng2))
+
+
+# ============================================================================
+# Geohash
+# ============================================================================
+
+def geohash(lat: float, lng: float, precision: int = 8) -> str:
+    """
+    Celda geohash que contiene el punto. Tamaño aproximado de la celda:
+    7 = 153 x 153 m, 8 = 38 x 19 m, 9 = 5 x 5 m
+    """
+    rango_lat, rango_lng = [-90.0, 90.0], [-180.0, 180.0]
+    celda = []
+    bits = valor = 0
+    es_lng = True
+    while len(celda) < precision:
+        rango, coordenada = (rango_lng, lng) if es_lng else (rango_lat, lat)
+        medio = (rango[0] + rango[1]) / 2
+        valor <<= 1
+        if coordenada >= medio:
+            valor |= 1
+            rango[0] = medio
+        else:
+            rango[1] = medio
+        es_lng = not es_lng
+        bits += 1
+        if bits == 5:
+            celda.append(_BASE32[valor])
+            bits = valor = 0
+    return ''.join(celda)
+
+
+def limites_geohash(celda: str) -> Tuple[float, float, float, float]:
+    """(lat_min, lat_max, lng_min, lng_max) de una celda"""
+    rango_lat, rango_lng = [-90.0, 90.0], [-180.0, 180.0]
+    es_lng = True
+    for caracter in celda:
+        valor = _BASE32_VALOR[caracter]
+        for bit in (16, 8, 4, 2, 1):
+            rango = rango_lng if es_lng else rango_lat
+            medio = (rango[0] + rango[1]) / 2
+            if valor & bit:
+                rango[0] = medio
+            else:
+                rango[1] = medio
+            es_lng = not es_lng
+    return rango_lat[0], rango_lat[1], rango_lng[0], rango_lng[1]
+
+
+def vecinos_geohash(celda: str) -> List[str]:
+    """Las 8 celdas adyacentes, de la misma precisión"""
+    lat_min, lat_max, lng_min, lng_max = limites_geohash(celda)
+    alto, ancho = lat_max - lat_min, lng_max - lng_min
+    centro_lat, centro_lng = (lat_min + lat_max) / 2, (lng_min + lng_max) / 2
+    return [
+        geohash(centro_lat + d_lat * alto, centro_lng + d_lng * ancho, len(celda))
+        for d_lat in (-1, 0, 1)
+        for d_lng in (-1, 0, 1)
+        if d_lat or d_lng
+    ]
+
+
+# ============================================================================
+# Polígonos
+# ============================================================================
+
+def caja_poligono(poligono: List[Tuple[float, float]]) -> Tuple[float, float, float, float]:
+    """(lat_min, lat_max, lng_min, lng_max) de un polígono [(lat, lng), ...]"""
+    lats = [p[0] for p in poligono]
+    lngs = [p[1] for p in poligono]
+    return min(lats), max(lats), min(lngs), max(lngs)
+
+
+def punto_en_poligono(lat: float, lng: float, poligono: List[Tuple[float, float]]) -> bool:
+    """
+    Ray casting (regla par-impar) sobre un polígono simple [(lat, lng), ...],
+    cerrado o no. A la escala de una ciudad lat/lng se tratan como plano.
+    """
+    dentro = False
+    lat_j, lng_j = poligono[-1]
+    for lat_i, lng_i in poligono:
+        if (lat_i > lat) != (lat_j > lat):
+            cruce = lng_i + (lat - lat_i) * (lng_j - lng_i) / (lat_j - lat_i)
+            if lng < cruce:
+                dentro = not dentro
+        lat_j, lng_j = lat_i, lng_i
+    return dentro
+
+
+def puntos_en_poligono(lats: np.ndarray, lngs: np.ndarray, poligono: List[Tuple[float, float]]) -> np.ndarray:
+    """punto_en_poligono para arreglos de puntos: una operación por lado del polígono"""
+    dentro = np.zeros(lats.shape, dtype=bool)
+    lat_j, lng_j = poligono[-1]
+    for lat_i, lng_i in poligono:
+        if lat_i != lat_j:  # un lado horizontal nunca cruza el rayo
+            cruza = (lat_i > lats) != (lat_j > lats)
+            cruce = lng_i + (lats - lat_i) * (lng_j - lng_i) / (lat_j - lat_i)
+            dentro ^= cruza & (lngs < cruce)
+        lat_j, lng_j = lat_i, lng_i
+    return dentro
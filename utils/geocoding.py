@@ -0,0 +1,524 @@
+"""
+Servicio de geocodificación (búsqueda de direcciones y geocodificación reversa)
+Todas las consultas a Nominatim pasan por aquí:
+
+- Cache en dos niveles: LRU en memoria por proceso (consulta normalizada) y
+  SQLite persistente compartido entre workers con TTL (GEOCODING_CACHE_TTL)
+- Singleflight: consultas idénticas simultáneas (hilos del mismo proceso o
+  workers distintos, vía flock) esperan el resultado de una sola petición
+- Token bucket compartido entre workers (GEOCODING_RATE por segundo): respeta la
+  política de 1 req/s de Nominatim; si no hay turno en GEOCODING_ESPERA_MAX
+  segundos se lanza LimiteExcedido
+- Geocodificación reversa por celda geohash (GEOCODING_GEOHASH_PRECISION, default 8
+  ~ 38 x 19 m): mover el pin unos metros reutiliza la dirección de la celda; si la
+  celda no está, se acepta la de una celda vecina cuyo punto consultado esté a menos
+  de GEOCODING_REVERSA_RADIO_M metros. La cache se precalienta con las coordenadas
+  de la tabla entregas: python -m utils.geocoding --calentar
+- Upstream intercambiable: NOMINATIM_URL (p. ej. un servidor local de prueba)
+  o configurar(upstream=...) con cualquier objeto con buscar() y reversa()
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from utils.geo import distancia_km, geohash, vecinos_geohash
+
+logger = logging.getLogger(__name__)
+
+NOMINATIM_URL = os.getenv('NOMINATIM_URL', 'https://nominatim.openstreetmap.org').rstrip('/')
+USER_AGENT = os.getenv('GEOCODING_USER_AGENT', 'MiChaska-POS/1.0')
+TIMEOUT = float(os.getenv('GEOCODING_TIMEOUT', '5'))
+CACHE_TTL = float(os.getenv('GEOCODING_CACHE_TTL', str(30 * 24 * 3600)))  # segundos
+LRU_MAX = int(os.getenv('GEOCODING_LRU_MAX', '1000'))
+RATE = float(os.getenv('GEOCODING_RATE', '1'))  # peticiones por segundo (entre todos los workers)
+BURST = float(os.getenv('GEOCODING_BURST', '1'))
+ESPERA_MAX = float(os.getenv('GEOCODING_ESPERA_MAX', '2'))  # segundos esperando turno
+GEOHASH_PRECISION = int(os.getenv('GEOCODING_GEOHASH_PRECISION', '8'))
+REVERSA_RADIO_M = float(os.getenv('GEOCODING_REVERSA_RADIO_M', '25'))  # distancia aceptada en celdas vecinas
+GEOCODING_DIR = os.getenv('GEOCODING_DIR') or os.path.join(tempfile.gettempdir(), 'michaska_geocoding')
+CACHE_DB = os.getenv('GEOCODING_CACHE_DB') or os.path.join(GEOCODING_DIR, 'cache.db')
+
+CONTEXTO_BUSQUEDA = 'Aguascalientes, México'
+
+
+class GeocodingError(Exception):
+    """El servicio de geocodificación no respondió correctamente"""
+
+
+class LimiteExcedido(GeocodingError):
+    """No hubo turno en el limitador de peticiones a tiempo"""
+
+
+# ============================================================================
+# Upstream
+# ============================================================================
+
+class NominatimUpstream:
+    """Cliente HTTP de Nominatim (o de un servidor compatible en base_url)"""
+
+    def __init__(self, base_url: str = NOMINATIM_URL, timeout: float = TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+
+    def _get(self, ruta: str, params: Dict[str, Any]) -> Any:
+        try:
+            response = self.session.get(f'{self.base_url}/{ruta}', params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise GeocodingError(str(e)) from e
+
+    def buscar(self, consulta: str, limite: int) -> List[Dict[str, Any]]:
+        return self._get('search', {
+            'q': consulta,
+            'format': 'json',
+            'limit': limite,
+            'addressdetails': 1,
+            'countrycodes': 'mx'
+        })
+
+    def reversa(self, lat: float, lng: float) -> Dict[str, Any]:
+        return self._get('reverse', {
+            'lat': lat,
+            'lon': lng,
+            'format': 'json',
+            'addressdetails': 1
+        })
+
+
+# ============================================================================
+# Estado del proceso
+# ============================================================================
+
+_state = {
+    'lock': threading.Lock(),
+    'upstream': None,
+    'lru': OrderedDict(),  # clave -> (expira, valor)
+    'vuelos': {},  # clave -> {'evento', 'valor', 'error'}
+    'db': threading.local(),
+    'stats': {'memoria': 0, 'disco': 0, 'fallos': 0, 'upstream': 0, 'coalescidas': 0,
+              'errores': 0, 'limitadas': 0,
+              'reversa_celda': 0, 'reversa_vecina': 0, 'reversa_fallos': 0}
+}
+
+
+def configurar(upstream=None):
+    """Cambia el upstream (None = Nominatim en NOMINATIM_URL) y limpia la cache en memoria"""
+    with _state['lock']:
+        _state['upstream'] = upstream
+        _state['lru'].clear()
+
+
+def _upstream():
+    with _state['lock']:
+        if _state['upstream'] is None:
+            _state['upstream'] = NominatimUpstream()
+        return _state['upstream']
+
+
+def _contar(estadistica: str):
+    with _state['lock']:
+        _state['stats'][estadistica] += 1
+
+
+def normalizar(texto: str) -> str:
+    """Consulta sin acentos, mayúsculas, puntuación ni espacios repetidos"""
+    texto = unicodedata.normalize('NFKD', texto)
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    texto = re.sub(r'[^\w#]+', ' ', texto)
+    return ' '.join(texto.split())
+
+
+# ============================================================================
+# Cache persistente (SQLite compartido entre workers)
+# ============================================================================
+
+def _db() -> sqlite3.Connection:
+    local = _state['db']
+    conn = getattr(local, 'conn', None)
+    if conn is None or getattr(local, 'pid', None) != os.getpid():
+        os.makedirs(os.path.dirname(CACHE_DB) or '.', exist_ok=True)
+        conn = sqlite3.connect(CACHE_DB, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS geocoding_cache (
+                clave TEXT PRIMARY KEY,
+                valor TEXT NOT NULL,
+                expira REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS reversa_geohash (
+                geohash TEXT PRIMARY KEY,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                valor TEXT NOT NULL,
+                expira REAL NOT NULL
+            )
+        """)
+        conn.commit()
+        local.conn = conn
+        local.pid = os.getpid()
+    return conn
+
+
+def _disco_obtener(clave: str) -> Optional[Any]:
+    try:
+        row = _db().execute(
+            "SELECT valor FROM geocoding_cache WHERE clave = ? AND expira > ?", (clave, time.time())
+        ).fetchone()
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ Cache de geocodificación no disponible: {e}")
+        return None
+    return json.loads(row[0]) if row else None
+
+
+def _disco_guardar(clave: str, valor: Any, expira: float):
+    try:
+        conn = _db()
+        conn.execute(
+            "INSERT OR REPLACE INTO geocoding_cache (clave, valor, expira) VALUES (?, ?, ?)",
+            (clave, json.dumps(valor, ensure_ascii=False), expira)
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ No se pudo guardar en la cache de geocodificación: {e}")
+
+
+def purgar_vencidos() -> int:
+    """Borra las entradas vencidas de la cache persistente"""
+    conn = _db()
+    ahora = time.time()
+    borradas = conn.execute("DELETE FROM geocoding_cache WHERE expira <= ?", (ahora,)).rowcount
+    borradas += conn.execute("DELETE FROM reversa_geohash WHERE expira <= ?", (ahora,)).rowcount
+    conn.commit()
+    return borradas
+
+
+def _lru_obtener(clave: str) -> Optional[Any]:
+    with _state['lock']:
+        entrada = _state['lru'].get(clave)
+        if entrada is None:
+            return None
+        if entrada[0] <= time.time():
+            del _state['lru'][clave]
+            return None
+        _state['lru'].move_to_end(clave)
+        return entrada[1]
+
+
+def _lru_guardar(clave: str, valor: Any, expira: float):
+    with _state['lock']:
+        _state['lru'][clave] = (expira, valor)
+        _state['lru'].move_to_end(clave)
+        while len(_state['lru']) > LRU_MAX:
+            _state['lru'].popitem(last=False)
+
+
+def _cache_obtener(clave: str) -> Optional[Any]:
+    valor = _lru_obtener(clave)
+    if valor is not None:
+        _contar('memoria')
+        return valor
+    valor = _disco_obtener(clave)
+    if valor is not None:
+        _contar('disco')
+        _lru_guardar(clave, valor, time.time() + CACHE_TTL)
+    return valor
+
+
+def _cache_guardar(clave: str, valor: Any):
+    expira = time.time() + CACHE_TTL
+    _lru_guardar(clave, valor, expira)
+    _disco_guardar(clave, valor, expira)
+
+
+# ============================================================================
+# Limitador de peticiones (token bucket compartido) y singleflight
+# ============================================================================
+
+@contextmanager
+def _archivo_bloqueado(nombre: str):
+    """Archivo de GEOCODING_DIR abierto en lectura/escritura con flock exclusivo"""
+    os.makedirs(GEOCODING_DIR, exist_ok=True)
+    fd = os.open(os.path.join(GEOCODING_DIR, nombre), os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, 'r+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield f
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _tomar_turno(espera_max: float = None):
+    """
+    Consume un token del bucket compartido (archivo con flock: tokens y último
+    relleno). Duerme lo necesario hasta `espera_max`; si no alcanza, LimiteExcedido.
+    """
+    espera_max = ESPERA_MAX if espera_max is None else espera_max
+    limite = time.monotonic() + espera_max
+    while True:
+        with _archivo_bloqueado('limitador') as f:
+            f.seek(0)
+            try:
+                tokens, ultimo = (float(x) for x in f.read().split())
+            except ValueError:
+                tokens, ultimo = BURST, time.time()
+            ahora = time.time()
+            tokens = min(BURST, tokens + (ahora - ultimo) * RATE)
+            if tokens >= 1:
+                tokens -= 1
+                espera = 0.0
+            else:
+                espera = (1 - tokens) / RATE
+            f.seek(0)
+            f.truncate()
+            f.write(f'{tokens} {ahora}')
+        if espera == 0.0:
+            return
+        if time.monotonic() + espera > limite:
+            _contar('limitadas')
+            raise LimiteExcedido(f"Límite de {RATE:g} consulta(s)/s al geocodificador")
+        time.sleep(espera)
+
+
+def _singleflight(clave: str, consultar: Callable[[], Any],
+                  leer: Callable[[], Optional[Any]] = None, guardar: Callable[[Any], None] = None,
+                  espera_max: float = None) -> Any:
+    """
+    Una sola petición por clave: los demás hilos del proceso esperan su resultado,
+    y los demás workers esperan el flock de la clave y luego leen la cache
+    (`leer`/`guardar`, por defecto la cache por clave).
+    """
+    leer = leer or (lambda: _disco_obtener(clave))
+    guardar = guardar or (lambda valor: _cache_guardar(clave, valor))
+    with _state['lock']:
+        vuelo = _state['vuelos'].get(clave)
+        lider = vuelo is None
+        if lider:
+            vuelo = _state['vuelos'][clave] = {'evento': threading.Event(), 'valor': None, 'error': None}
+
+    if not lider:
+        _contar('coalescidas')
+        vuelo['evento'].wait(TIMEOUT + ESPERA_MAX)
+        if vuelo['error'] is not None:
+            raise vuelo['error']
+        if vuelo['valor'] is None:
+            raise GeocodingError("Sin respuesta del geocodificador")
+        return vuelo['valor']
+
+    try:
+        nombre = 'vuelo_' + hashlib.sha1(clave.encode('utf-8')).hexdigest()[:12]
+        with _archivo_bloqueado(nombre):
+            valor = leer()  # otro worker pudo resolverla mientras esperábamos
+            if valor is not None:
+                _contar('coalescidas')
+                _lru_guardar(clave, valor, time.time() + CACHE_TTL)
+            else:
+                _tomar_turno(espera_max)
+                _contar('upstream')
+                try:
+                    valor = consultar()
+                except GeocodingError:
+                    _contar('errores')
+                    raise
+                guardar(valor)
+        vuelo['valor'] = valor
+        return valor
+    except Exception as e:
+        vuelo['error'] = e
+        raise
+    finally:
+        with _state['lock']:
+            _state['vuelos'].pop(clave, None)
+        vuelo['evento'].set()
+
+
+def _resolver(clave: str, consultar: Callable[[], Any]) -> Any:
+    valor = _cache_obtener(clave)
+    if valor is not None:
+        return valor
+    _contar('fallos')
+    return _singleflight(clave, consultar)
+
+
+# ============================================================================
+# API
+# ============================================================================
+
+def _formatear_resultado(r: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'display_name': r.get('display_name', ''),
+        'lat': float(r.get('lat', 0)),
+        'lon': float(r.get('lon', 0)),
+        'type': r.get('type', ''),
+        'address': r.get('address', {})
+    }
+
+
+def buscar(consulta: str, limite: int = 5) -> List[Dict[str, Any]]:
+    """Direcciones que coinciden con `consulta` (en el contexto de Aguascalientes)"""
+    clave = f'buscar:{limite}:{normalizar(consulta)}'
+
+    def consultar():
+        resultados = _upstream().buscar(f"{consulta}, {CONTEXTO_BUSQUEDA}", limite)
+        return [_formatear_resultado(r) for r in resultados]
+
+    return _resolver(clave, consultar)
+
+
+def _reversa_guardada(lat: float, lng: float, celda: str) -> Optional[Any]:
+    """
+    Dirección de la celda o, si no está, de la celda vecina cuyo punto consultado
+    quede más cerca (y a menos de REVERSA_RADIO_M metros)
+    """
+    celdas = [celda] + vecinos_geohash(celda)
+    try:
+        rows = _db().execute(
+            f"SELECT geohash, lat, lon, valor FROM reversa_geohash "
+            f"WHERE geohash IN ({','.join('?' * len(celdas))}) AND expira > ?",
+            (*celdas, time.time())
+        ).fetchall()
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ Cache de geocodificación no disponible: {e}")
+        return None
+
+    mejor, mejor_distancia = None, REVERSA_RADIO_M / 1000
+    for geohash_fila, lat_fila, lon_fila, valor in rows:
+        if geohash_fila == celda:
+            _contar('reversa_celda')
+            return json.loads(valor)
+        distancia = distancia_km(lat, lng, lat_fila, lon_fila)
+        if distancia <= mejor_distancia:
+            mejor, mejor_distancia = valor, distancia
+    if mejor is not None:
+        _contar('reversa_vecina')
+        return json.loads(mejor)
+    return None
+
+
+def _reversa_guardar(celda: str, lat: float, lng: float, valor: Any):
+    expira = time.time() + CACHE_TTL
+    _lru_guardar(f'reversa:{celda}', valor, expira)
+    try:
+        conn = _db()
+        conn.execute(
+            "INSERT OR REPLACE INTO reversa_geohash (geohash, lat, lon, valor, expira) VALUES (?, ?, ?, ?, ?)",
+            (celda, lat, lng, json.dumps(valor, ensure_ascii=False), expira)
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ No se pudo guardar en la cache de geocodificación: {e}")
+
+
+def reversa(lat: float, lng: float, espera_max: float = None) -> Dict[str, Any]:
+    """Dirección más cercana a unas coordenadas (cache por celda geohash)"""
+    lat, lng = float(lat), float(lng)
+    celda = geohash(lat, lng, GEOHASH_PRECISION)
+    clave = f'reversa:{celda}'
+
+    valor = _lru_obtener(clave)
+    if valor is not None:
+        _contar('reversa_celda')
+        return valor
+    valor = _reversa_guardada(lat, lng, celda)
+    if valor is not None:
+        _lru_guardar(clave, valor, time.time() + CACHE_TTL)
+        return valor
+    _contar('reversa_fallos')
+
+    def consultar():
+        resultado = _upstream().reversa(lat, lng)
+        if 'error' in resultado:
+            raise GeocodingError(resultado['error'])
+        return {
+            'direccion': resultado.get('display_name', ''),
+            'address': resultado.get('address', {}),
+            'lat': float(resultado.get('lat', lat)),
+            'lon': float(resultado.get('lon', lng))
+        }
+
+    return _singleflight(
+        clave, consultar,
+        leer=lambda: _reversa_guardada(lat, lng, celda),
+        guardar=lambda valor: _reversa_guardar(celda, lat, lng, valor),
+        espera_max=espera_max
+    )
+
+
+def calentar_desde_entregas(limite: int = None) -> Dict[str, int]:
+    """
+    Consulta las celdas de las entregas registradas que aún no están en la cache,
+    de la más reciente a la más antigua, respetando el límite de peticiones
+    (esperando turno en lugar de fallar).
+    """
+    from database.connection_dual import stream_query
+
+    celdas = {}
+    for fila in stream_query(
+        "SELECT latitud, longitud FROM entregas "
+        "WHERE latitud IS NOT NULL AND longitud IS NOT NULL ORDER BY id DESC"
+    ):
+        lat, lng = float(fila['latitud']), float(fila['longitud'])
+        celdas.setdefault(geohash(lat, lng, GEOHASH_PRECISION), (lat, lng))
+
+    resultado = {'celdas': len(celdas), 'en_cache': 0, 'consultadas': 0, 'errores': 0}
+    for celda, (lat, lng) in celdas.items():
+        if limite is not None and resultado['consultadas'] >= limite:
+            break
+        if _reversa_guardada(lat, lng, celda) is not None:
+            resultado['en_cache'] += 1
+            continue
+        try:
+            reversa(lat, lng, espera_max=max(ESPERA_MAX, 60.0))
+            resultado['consultadas'] += 1
+        except GeocodingError as e:
+            resultado['errores'] += 1
+            logger.warning(f"⚠️ No se pudo geocodificar {lat:.5f},{lng:.5f}: {e}")
+    return resultado
+
+
+def get_cache_stats() -> Dict[str, int]:
+    """Aciertos por nivel, fallos, peticiones al upstream y consultas coalescidas"""
+    with _state['lock']:
+        return {**_state['stats'], 'entradas_memoria': len(_state['lru'])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimiento de la cache de geocodificación")
+    parser.add_argument('--calentar', action='store_true',
+                        help="Geocodifica las ubicaciones de la tabla entregas que no estén en cache")
+    parser.add_argument('--limite', type=int, help="Máximo de consultas a Nominatim al calentar")
+    parser.add_argument('--purgar', action='store_true', help="Borra las entradas vencidas")
+    args = parser.parse_args()
+    if not (args.calentar or args.purgar):
+        parser.error("Indicar --calentar y/o --purgar")
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.purgar:
+        print(f"🧹 {purgar_vencidos()} entradas vencidas borradas")
+    if args.calentar:
+        print(f"🔥 Calentando cache reversa desde entregas (geohash de {GEOHASH_PRECISION} caracteres)...")
+        resultado = calentar_desde_entregas(args.limite)
+        print(f"✅ {resultado['celdas']} celdas: {resultado['en_cache']} ya en cache, "
+              f"{resultado['consultadas']} consultadas, {resultado['errores']} con error")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ import time
 import os
 from datetime import datetime
 from database.connection_dual import get_db_connection
+from database import query_stats
 from utils.logging_config import log_database_operation
 import logging
 
@@ -69,12 +70,17 @@ def monitor_performance():
         st.session_state.performance_metrics = {
             'page_loads': 0,
             'database_queries': 0,
+            'queries_base': query_stats.total_consultas(),
             'errors': 0,
             'start_time': time.time()
         }
     
     # Incrementar contador de carga de página
-    st.session_state.performance_metrics['page_loads'] += 1
+    metrics = st.session_state.performance_metrics
+    metrics['page_loads'] += 1
+    
+    # Consultas registradas por connection_dual desde que inició la sesión
+    metrics['database_queries'] = query_stats.total_consultas() - metrics['queries_base']
 
 def show_performance_metrics():
     """Muestra métricas de rendimiento"""
@@ -0,0 +1,80 @@
+"""
+R-tree de solo lectura empaquetado con Sort-Tile-Recursive (STR)
+Indexa cajas (lat_min, lat_max, lng_min, lng_max) y responde qué cajas contienen
+un punto visitando O(log n) nodos. Se construye completo de una vez (p. ej. al
+cargar las zonas de entrega); para cambiar el contenido se construye otro.
+
+    indice = RTree([caja_poligono(p) for p in poligonos])
+    candidatos = indice.buscar(lat, lng)   # posiciones en la lista original
+"""
+import math
+from typing import List, Sequence, Tuple
+
+Caja = Tuple[float, float, float, float]
+
+
+def _union(cajas: Sequence[Caja]) -> Caja:
+    return (
+        min(c[0] for c in cajas), max(c[1] for c in cajas),
+        min(c[2] for c in cajas), max(c[3] for c in cajas)
+    )
+
+
+def _str_orden(cajas: Sequence[Caja], capacidad: int) -> List[int]:
+    """Orden STR: franjas verticales por lng del centro, cada franja por lat del centro"""
+    n = len(cajas)
+    hojas = math.ceil(n / capacidad)
+    por_franja = math.ceil(math.sqrt(hojas)) * capacidad
+    por_lng = sorted(range(n), key=lambda i: cajas[i][2] + cajas[i][3])
+    orden = []
+    for inicio in range(0, n, por_franja):
+        franja = por_lng[inicio:inicio + por_franja]
+        orden.extend(sorted(franja, key=lambda i: cajas[i][0] + cajas[i][1]))
+    return orden
+
+
+class RTree:
+    def __init__(self, cajas: Sequence[Caja], capacidad: int = 16):
+        self.capacidad = max(2, capacidad)
+        # Un nivel por altura (0 = hojas): cajas y, por elemento, el id original
+        # (hojas) o el rango (inicio, fin) de sus hijos en el nivel inferior
+        self._niveles: List[Tuple[List[Caja], list]] = []
+        self._total = len(cajas)
+
+        nivel = [(caja, i) for i, caja in enumerate(cajas)]
+        while nivel:
+            orden = _str_orden([caja for caja, _ in nivel], self.capacidad)
+            nivel = [nivel[i] for i in orden]
+            self._niveles.append(([caja for caja, _ in nivel], [dato for _, dato in nivel]))
+            if len(nivel) <= self.capacidad:
+                break
+            padres = []
+            for inicio in range(0, len(nivel), self.capacidad):
+                grupo = nivel[inicio:inicio + self.capacidad]
+                padres.append((_union([caja for caja, _ in grupo]), (inicio, inicio + len(grupo))))
+            nivel = padres
+
+    def __len__(self) -> int:
+        return self._total
+
+    @property
+    def altura(self) -> int:
+        return len(self._niveles)
+
+    def buscar(self, lat: float, lng: float) -> List[int]:
+        """Posiciones (en la lista original) de las cajas que contienen el punto"""
+        if not self._niveles:
+            return []
+        encontrados = []
+        pendientes = [(len(self._niveles) - 1, 0, len(self._niveles[-1][0]))]
+        while pendientes:
+            nivel, inicio, fin = pendientes.pop()
+            cajas, datos = self._niveles[nivel]
+            for posicion in range(inicio, fin):
+                lat_min, lat_max, lng_min, lng_max = cajas[posicion]
+                if lat_min <= lat <= lat_max and lng_min <= lng <= lng_max:
+                    if nivel == 0:
+                        encontrados.append(datos[posicion])
+                    else:
+                        pendientes.append((nivel - 1, *datos[posicion]))
+        return encontrados
@@ -32,11 +32,11 @@ def log_database_operation(operation: str, success: bool, details: str = ""):
     else:
         logger.error(f"❌ {operation} - {details}")
 
-def log_performance(operation: str, duration: float, details: str = ""):
-    """Log de rendimiento"""
+def log_performance(operation: str, duration: float, details: str = "", umbral: float = 1.0):
+    """Log de rendimiento (advertencia si la operación tarda `umbral` segundos o más)"""
     logger = logging.getLogger('michaska.performance')
     
-    if duration > 1.0:  # Operaciones que toman más de 1 segundo
+    if duration >= umbral:  # Por defecto, operaciones que toman más de 1 segundo
         logger.warning(f"⚠️ {operation} tomó {duration:.2f}s - {details}")
     else:
         logger.debug(f"⏱️ {operation} completado en {duration:.3f}s - {details}")
@@ -0,0 +1,437 @@
+"""
+Métricas de ejecución en formato de exposición de Prometheus (/metrics)
+
+Cada worker de gunicorn acumula sus métricas en memoria y un hilo de fondo las
+escribe en METRICS_DIR/worker_<pid>.json (escritura atómica). /metrics agrega
+los archivos de todos los workers, así que cualquier worker responde con los
+totales del servidor. Los contadores de workers terminados se conservan en
+archivado.json; sus gauges (en curso, pool) se descartan.
+"""
+import fcntl
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.getenv('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'michaska_metrics')
+FLUSH_SEGUNDOS = float(os.getenv('METRICS_FLUSH_SECONDS', '1'))
+VENTANA_VENTAS_SEGUNDOS = 300  # ventas/minuto sobre los últimos 5 minutos
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_ITEMS = (1, 2, 3, 5, 8, 13, 21, 34)
+
+PREFIJO = 'michaska_'
+
+# nombre -> (tipo, ayuda)
+DEFINICIONES: Dict[str, Tuple[str, str]] = {
+    'http_requests_total': ('counter', 'Requests HTTP atendidos por ruta, método y status'),
+    'http_request_duration_seconds': ('histogram', 'Latencia de requests HTTP por ruta'),
+    'http_requests_in_flight': ('gauge', 'Requests HTTP en proceso'),
+    'http_errors_total': ('counter', 'Respuestas con error por ruta (4xx y 5xx)'),
+    'http_exceptions_total': ('counter', 'Excepciones no controladas por ruta'),
+    'ventas_total': ('counter', 'Ventas registradas'),
+    'ventas_importe_total': ('counter', 'Importe acumulado de ventas'),
+    'venta_items': ('histogram', 'Artículos por venta'),
+    'ventas_por_minuto': ('gauge', 'Ventas por minuto en los últimos 5 minutos'),
+    'items_por_venta': ('gauge', 'Promedio de artículos por venta'),
+    'cache_hits_total': ('counter', 'Aciertos de cache'),
+    'cache_misses_total': ('counter', 'Fallos de cache'),
+    'cache_hit_ratio': ('gauge', 'Proporción de aciertos de cache'),
+    'ticket_cache_bytes': ('gauge', 'Bytes de tickets PDF en la cache en memoria'),
+    'db_pool_connections': ('gauge', 'Conexiones del pool por estado'),
+    'db_pool_checkouts_total': ('counter', 'Conexiones entregadas por el pool'),
+    'db_pool_waits_total': ('counter', 'Esperas por una conexión libre del pool'),
+    'db_pool_timeouts_total': ('counter', 'Timeouts esperando conexión del pool'),
+    'db_queries_total': ('counter', 'Sentencias SQL ejecutadas'),
+    'gazetteer_busquedas_total': ('counter', 'Búsquedas de direcciones en el nomenclátor local por resultado'),
+    'gazetteer_entradas': ('gauge', 'Calles, colonias y códigos postales en el nomenclátor local'),
+    'geocoding_upstream_requests_total': ('counter', 'Peticiones enviadas al geocodificador (Nominatim)'),
+    'geocoding_reversa_vecina_total': ('counter', 'Geocodificaciones reversas resueltas con una celda geohash vecina'),
+    'geocoding_limited_total': ('counter', 'Consultas de geocodificación rechazadas por el limitador'),
+    'render_jobs_total': ('counter', 'Documentos enviados al servicio de renderizado por resultado'),
+    'render_jobs_en_curso': ('gauge', 'Documentos renderizándose en este momento'),
+    'workers': ('gauge', 'Workers con métricas activas'),
+}
+
+# Un colector regresa muestras (tipo, nombre, etiquetas, valor) al momento de escribir
+Muestra = Tuple[str, str, Dict[str, str], float]
+Colector = Callable[[], Iterable[Muestra]]
+
+
+def _clave(etiquetas: Dict[str, Any]) -> str:
+    return json.dumps(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+class _MetricasWorker:
+    """Métricas en memoria del proceso actual"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.counters: Dict[str, Dict[str, float]] = {}
+        self.gauges: Dict[str, Dict[str, float]] = {}
+        self.histogramas: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.ventas_recientes = deque()
+        self.colectores: List[Colector] = []
+        self.sucio = True
+        self.hilo: Optional[threading.Thread] = None
+
+    def inc(self, nombre: str, etiquetas: Dict[str, Any], valor: float = 1.0):
+        with self.lock:
+            serie = self.counters.setdefault(nombre, {})
+            clave = _clave(etiquetas)
+            serie[clave] = serie.get(clave, 0.0) + valor
+            self.sucio = True
+
+    def gauge_add(self, nombre: str, etiquetas: Dict[str, Any], valor: float):
+        with self.lock:
+            serie = self.gauges.setdefault(nombre, {})
+            clave = _clave(etiquetas)
+            serie[clave] = serie.get(clave, 0.0) + valor
+            self.sucio = True
+
+    def observar(self, nombre: str, etiquetas: Dict[str, Any], valor: float, buckets: Tuple[float, ...]):
+        with self.lock:
+            serie = self.histogramas.setdefault(nombre, {})
+            clave = _clave(etiquetas)
+            hist = serie.get(clave)
+            if hist is None:
+                hist = serie[clave] = {'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, limite in enumerate(hist['buckets']):
+                if valor <= limite:
+                    hist['counts'][i] += 1
+            hist['sum'] += valor
+            hist['count'] += 1
+            self.sucio = True
+
+    def snapshot(self) -> Dict[str, Any]:
+        counters, gauges = {}, {}
+        for colector in self.colectores:
+            try:
+                for tipo, nombre, etiquetas, valor in colector():
+                    destino = counters if tipo == 'counter' else gauges
+                    destino.setdefault(nombre, {})[_clave(etiquetas)] = float(valor)
+            except Exception as e:
+                logger.debug(f"Colector de métricas falló: {e}")
+
+        limite = time.time() - VENTANA_VENTAS_SEGUNDOS
+        with self.lock:
+            while self.ventas_recientes and self.ventas_recientes[0] < limite:
+                self.ventas_recientes.popleft()
+            for nombre, serie in self.counters.items():
+                counters.setdefault(nombre, {}).update(serie)
+            for nombre, serie in self.gauges.items():
+                gauges.setdefault(nombre, {}).update(serie)
+            self.sucio = False
+            return {
+                'pid': self.pid,
+                'actualizado': time.time(),
+                'counters': counters,
+                'gauges': gauges,
+                'histogramas': json.loads(json.dumps(self.histogramas)),
+                'ventas_recientes': list(self.ventas_recientes)
+            }
+
+
+_state: Dict[str, Optional[_MetricasWorker]] = {'worker': None}
+_state_lock = threading.Lock()
+
+
+def _worker() -> _MetricasWorker:
+    """Métricas del proceso actual (se reinician tras un fork)"""
+    worker = _state['worker']
+    if worker is None or worker.pid != os.getpid():
+        with _state_lock:
+            worker = _state['worker']
+            if worker is None or worker.pid != os.getpid():
+                colectores = list(worker.colectores) if worker else []
+                worker = _MetricasWorker()
+                worker.colectores = colectores
+                _state['worker'] = worker
+    if worker.hilo is None:
+        with _state_lock:
+            if worker.hilo is None:
+                worker.hilo = threading.Thread(target=_bucle_escritura, args=(worker,),
+                                               name='metrics-flush', daemon=True)
+                worker.hilo.start()
+    return worker
+
+
+def _archivo_worker(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f'worker_{pid}.json')
+
+
+def _escribir_json(ruta: str, datos: Dict[str, Any]):
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=METRICS_DIR, prefix='.tmp_')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(datos, f)
+    os.replace(tmp, ruta)
+
+
+def flush():
+    """Escribe las métricas del worker actual a su archivo"""
+    worker = _worker()
+    try:
+        _escribir_json(_archivo_worker(worker.pid), worker.snapshot())
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudieron escribir métricas en {METRICS_DIR}: {e}")
+
+
+def _bucle_escritura(worker: _MetricasWorker):
+    while True:
+        time.sleep(FLUSH_SEGUNDOS)
+        if worker.pid != os.getpid():
+            return
+        if worker.sucio or worker.colectores:
+            flush()
+
+
+# ---------------------------------------------------------------------------
+# API de registro
+# ---------------------------------------------------------------------------
+
+def registrar_colector(colector: Colector):
+    """Agrega una función que reporta muestras del proceso (pool, caches...) al escribir"""
+    _worker().colectores.append(colector)
+
+
+def observar_request(ruta: str, metodo: str, status: int, duracion: float):
+    worker = _worker()
+    worker.inc('http_requests_total', {'route': ruta, 'method': metodo, 'status': status})
+    worker.observar('http_request_duration_seconds', {'route': ruta}, duracion, BUCKETS_LATENCIA)
+    if status >= 400:
+        worker.inc('http_errors_total', {'route': ruta, 'status_class': f'{status // 100}xx'})
+
+
+def request_en_curso(delta: int):
+    _worker().gauge_add('http_requests_in_flight', {}, delta)
+
+
+def registrar_excepcion(ruta: str, error: BaseException):
+    _worker().inc('http_exceptions_total', {'route': ruta, 'exception': type(error).__name__})
+
+
+def registrar_venta(items: int, total: float):
+    """Una venta confirmada (para ventas/minuto y artículos por venta)"""
+    worker = _worker()
+    worker.inc('ventas_total', {})
+    worker.inc('ventas_importe_total', {}, float(total))
+    worker.observar('venta_items', {}, items, BUCKETS_ITEMS)
+    with worker.lock:
+        worker.ventas_recientes.append(time.time())
+
+
+# ---------------------------------------------------------------------------
+# Agregación entre workers
+# ---------------------------------------------------------------------------
+
+def _pid_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _leer_json(ruta: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(ruta) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _sumar(destino: Dict[str, Any], origen: Dict[str, Any]):
+    """Suma counters e histogramas de `origen` en `destino`"""
+    for nombre, serie in origen.get('counters', {}).items():
+        d = destino.setdefault('counters', {}).setdefault(nombre, {})
+        for clave, valor in serie.items():
+            d[clave] = d.get(clave, 0.0) + valor
+    for nombre, serie in origen.get('histogramas', {}).items():
+        d = destino.setdefault('histogramas', {}).setdefault(nombre, {})
+        for clave, hist in serie.items():
+            actual = d.get(clave)
+            if actual is None:
+                d[clave] = json.loads(json.dumps(hist))
+            else:
+                actual['counts'] = [a + b for a, b in zip(actual['counts'], hist['counts'])]
+                actual['sum'] += hist['sum']
+                actual['count'] += hist['count']
+    destino.setdefault('ventas_recientes', []).extend(origen.get('ventas_recientes', []))
+
+
+def _archivar_muertos(muertos: List[Tuple[str, Dict[str, Any]]]):
+    """Mueve los contadores de workers terminados a archivado.json (bajo lock de archivo)"""
+    ruta_lock = os.path.join(METRICS_DIR, '.lock')
+    ruta_archivo = os.path.join(METRICS_DIR, 'archivado.json')
+    with open(ruta_lock, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archivado = _leer_json(ruta_archivo) or {}
+        for ruta, datos in muertos:
+            if not os.path.exists(ruta):
+                continue  # otro worker ya lo archivó
+            _sumar(archivado, {'counters': datos.get('counters', {}),
+                               'histogramas': datos.get('histogramas', {}),
+                               'ventas_recientes': datos.get('ventas_recientes', [])})
+            os.remove(ruta)
+        # Solo cuentan las ventas de la ventana: lo anterior no se vuelve a leer
+        limite = time.time() - VENTANA_VENTAS_SEGUNDOS
+        archivado['ventas_recientes'] = [t for t in archivado.get('ventas_recientes', []) if t >= limite]
+        _escribir_json(ruta_archivo, archivado)
+
+
+def agregar() -> Dict[str, Any]:
+    """Totales de todos los workers (incluye el archivo de workers terminados)"""
+    flush()
+    total: Dict[str, Any] = {'counters': {}, 'histogramas': {}, 'gauges': {}, 'ventas_recientes': []}
+    muertos = []
+    vivos = 0
+
+    try:
+        nombres = os.listdir(METRICS_DIR)
+    except OSError:
+        nombres = []
+
+    for nombre in nombres:
+        if not (nombre.startswith('worker_') and nombre.endswith('.json')):
+            continue
+        ruta = os.path.join(METRICS_DIR, nombre)
+        datos = _leer_json(ruta)
+        if datos is None:
+            continue
+        if not _pid_vivo(int(datos.get('pid', 0))):
+            muertos.append((ruta, datos))
+            continue
+        vivos += 1
+        _sumar(total, datos)
+        for metrica, serie in datos.get('gauges', {}).items():
+            g = total['gauges'].setdefault(metrica, {})
+            for clave, valor in serie.items():
+                g[clave] = g.get(clave, 0.0) + valor
+
+    if muertos:
+        try:
+            _archivar_muertos(muertos)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudieron archivar métricas de workers terminados: {e}")
+    _sumar(total, _leer_json(os.path.join(METRICS_DIR, 'archivado.json')) or {})
+
+    # Derivadas
+    limite = time.time() - VENTANA_VENTAS_SEGUNDOS
+    recientes = sum(1 for t in total['ventas_recientes'] if t >= limite)
+    total['gauges']['ventas_por_minuto'] = {_clave({}): recientes / (VENTANA_VENTAS_SEGUNDOS / 60)}
+
+    hist_items = total['histogramas'].get('venta_items', {}).get(_clave({}))
+    if hist_items and hist_items['count']:
+        total['gauges']['items_por_venta'] = {_clave({}): hist_items['sum'] / hist_items['count']}
+
+    hits = total['counters'].get('cache_hits_total', {})
+    misses = total['counters'].get('cache_misses_total', {})
+    ratios = {}
+    for clave in set(hits) | set(misses):
+        consultas = hits.get(clave, 0.0) + misses.get(clave, 0.0)
+        if consultas:
+            ratios[clave] = hits.get(clave, 0.0) / consultas
+    if ratios:
+        total['gauges']['cache_hit_ratio'] = ratios
+
+    total['gauges']['workers'] = {_clave({}): vivos}
+    return total
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_etiquetas(clave: str, extra: Optional[Tuple[str, str]] = None) -> str:
+    pares = [tuple(p) for p in json.loads(clave)]
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{k}="{_escapar(str(v))}"' for k, v in pares) + '}'
+
+
+def _numero(valor: float) -> str:
+    if math.isnan(valor):
+        return 'NaN'
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    if valor == int(valor) and abs(valor) < 1e15:
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def exposicion() -> str:
+    """Texto en formato de exposición de Prometheus (version 0.0.4)"""
+    total = agregar()
+    lineas: List[str] = []
+
+    nombres = set(total['counters']) | set(total['gauges']) | set(total['histogramas'])
+    for nombre in sorted(nombres):
+        tipo, ayuda = DEFINICIONES.get(nombre, ('untyped', nombre))
+        metrica = PREFIJO + nombre
+        lineas.append(f'# HELP {metrica} {ayuda}')
+        lineas.append(f'# TYPE {metrica} {tipo}')
+
+        if nombre in total['histogramas']:
+            for clave, hist in sorted(total['histogramas'][nombre].items()):
+                for limite, cuenta in zip(hist['buckets'], hist['counts']):
+                    lineas.append(f'{metrica}_bucket{_formatear_etiquetas(clave, ("le", _numero(limite)))} {cuenta}')
+                lineas.append(f'{metrica}_bucket{_formatear_etiquetas(clave, ("le", "+Inf"))} {hist["count"]}')
+                lineas.append(f'{metrica}_sum{_formatear_etiquetas(clave)} {_numero(hist["sum"])}')
+                lineas.append(f'{metrica}_count{_formatear_etiquetas(clave)} {hist["count"]}')
+            continue
+
+        serie = total['counters'].get(nombre) or total['gauges'].get(nombre) or {}
+        for clave, valor in sorted(serie.items()):
+            lineas.append(f'{metrica}{_formatear_etiquetas(clave)} {_numero(valor)}')
+
+    return '\n'.join(lineas) + '\n'
+
+
+def limpiar_directorio():
+    """Borra las métricas de ejecuciones anteriores (al arrancar el servidor)"""
+    try:
+        for nombre in os.listdir(METRICS_DIR):
+            if nombre.endswith('.json') or nombre.startswith('.tmp_'):
+                os.remove(os.path.join(METRICS_DIR, nombre))
+    except FileNotFoundError:
+        pass
+
+
+def init_app(app):
+    """Latencia, requests en curso y errores por ruta para la app Flask"""
+    from flask import g, request
+
+    def _ruta() -> str:
+        return request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+
+    @app.before_request
+    def _metrics_inicio():
+        g.metrics_inicio = time.perf_counter()
+        request_en_curso(1)
+
+    @app.after_request
+    def _metrics_fin(response):
+        inicio = g.get('metrics_inicio')
+        if inicio is not None:
+            observar_request(_ruta(), request.method, response.status_code, time.perf_counter() - inicio)
+        return response
+
+    @app.teardown_request
+    def _metrics_teardown(error):
+        if g.get('metrics_inicio') is not None:
+            request_en_curso(-1)
+        if error is not None:
+            registrar_excepcion(_ruta(), error)
@@ -8,41 +8,51 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
 from reportlab.lib import colors
 from datetime import datetime
+from functools import lru_cache
 from utils.timezone_utils import format_mexico_datetime, get_mexico_datetime
+import copy
 import io
-from database.connection_dual import execute_query
+from database import configuracion
+from utils import request_timing, ticket_cache
 
-class TicketGenerator:
-    def __init__(self):
-        self.width = 80 * mm  # Ancho de ticket térmico estándar (80mm)
-        self.height = 280 * mm  # Alto flexible
-        
-    def get_configuracion(self, clave: str, default: str = "") -> str:
-        """Obtiene un valor de configuración"""
+
+def formatear_fecha_ticket(fecha_venta) -> str:
+    """Fecha de la venta como se imprime en el ticket (dd/mm/aaaa hh:mm)"""
+    if isinstance(fecha_venta, str):
         try:
-            rows = execute_query("SELECT valor FROM configuracion WHERE clave = %s", (clave,))
-            return rows[0]['valor'] if rows else default
+            fecha_obj = datetime.fromisoformat(fecha_venta.replace('Z', '+00:00'))
+            return fecha_obj.strftime('%d/%m/%Y %H:%M')
         except:
-            return default
-    
-    def generar_ticket_memoria(self, venta_data: dict, detalle_rows: list) -> bytes:
-        """Genera un ticket PDF en memoria optimizado para impresoras térmicas genéricas"""
-        buffer = io.BytesIO()
-        
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=(self.width, self.height),
-            leftMargin=3*mm,
-            rightMargin=3*mm,
-            topMargin=3*mm,
-            bottomMargin=3*mm
-        )
-        
-        story = []
-        styles = getSampleStyleSheet()
-        
-        # Estilos optimizados para ticket térmico
-        style_titulo = ParagraphStyle(
+            return fecha_venta[:16] if len(fecha_venta) >= 16 else fecha_venta
+    elif isinstance(fecha_venta, datetime):
+        return fecha_venta.strftime('%d/%m/%Y %H:%M')
+    return format_mexico_datetime(get_mexico_datetime())
+
+
+def vendedor_de_notas(notas: str) -> str:
+    """Nombre del vendedor guardado en las notas ('Vendedor: X | ...'), o cadena vacía"""
+    if notas and 'Vendedor:' in notas:
+        return notas.split('|')[0].replace('Vendedor:', '').strip()
+    return ''
+
+
+TABLA_TICKET_STYLE = TableStyle([
+    ('FONTSIZE', (0, 0), (-1, -1), 7),
+    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+    ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+    ('TOPPADDING', (0, 0), (-1, -1), 1),
+    ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.black),
+])
+
+
+@lru_cache(maxsize=None)
+def _estilos_ticket() -> dict:
+    """Estilos del ticket térmico, creados una vez por proceso"""
+    styles = getSampleStyleSheet()
+    return {
+        'titulo': ParagraphStyle(
             'TituloTicket',
             parent=styles['Heading1'],
             fontSize=12,
@@ -50,25 +60,22 @@ class TicketGenerator:
             spaceAfter=2*mm,
             textColor=colors.black,
             fontName='Helvetica-Bold'
-        )
-        
-        style_subtitulo = ParagraphStyle(
+        ),
+        'subtitulo': ParagraphStyle(
             'SubtituloTicket',
             parent=styles['Normal'],
             fontSize=8,
             alignment=TA_CENTER,
             spaceAfter=1*mm
-        )
-        
-        style_normal = ParagraphStyle(
+        ),
+        'normal': ParagraphStyle(
             'NormalTicket',
             parent=styles['Normal'],
             fontSize=8,
             alignment=TA_LEFT,
             spaceAfter=0.5*mm
-        )
-        
-        style_total = ParagraphStyle(
+        ),
+        'total': ParagraphStyle(
             'TotalTicket',
             parent=styles['Normal'],
             fontSize=11,
@@ -77,51 +84,129 @@ class TicketGenerator:
             textColor=colors.black,
             fontName='Helvetica-Bold'
         )
+    }
+
+
+@lru_cache(maxsize=8)
+def _flowables_fijos(nombre_negocio: str, direccion: str, telefono: str, mensaje: str) -> dict:
+    """
+    Partes del ticket que solo dependen de la configuración (encabezado, separadores, pie),
+    ya parseadas. Se cachean por valores de configuración: si cambian, se crea otra entrada.
+    """
+    estilos = _estilos_ticket()
+    encabezado = [
+        Paragraph(f"<b>{nombre_negocio}</b>", estilos['titulo']),
+        Paragraph(direccion, estilos['subtitulo'])
+    ]
+    if telefono:
+        encabezado.append(Paragraph(f"Tel: {telefono}", estilos['subtitulo']))
+    encabezado += [
+        Spacer(1, 2*mm),
+        Paragraph("=" * 40, estilos['normal']),
+        Spacer(1, 2*mm)
+    ]
+    return {
+        'encabezado': encabezado,
+        'antes_tabla': [
+            Spacer(1, 2*mm),
+            Paragraph("-" * 40, estilos['normal']),
+            Spacer(1, 1*mm)
+        ],
+        'despues_tabla': [
+            Spacer(1, 2*mm),
+            Paragraph("=" * 40, estilos['normal']),
+            Spacer(1, 2*mm)
+        ],
+        'pie': [
+            Spacer(1, 3*mm),
+            Paragraph("-" * 40, estilos['normal']),
+            Paragraph(f"<b>{mensaje}</b>", estilos['subtitulo'])
+        ]
+    }
+
+
+def _copias(flowables: list) -> list:
+    """
+    Copias superficiales para un build: comparten el texto ya parseado
+    pero cada documento guarda su propio estado de wrap/split
+    """
+    return [copy.copy(f) for f in flowables]
+
+
+class TicketGenerator:
+    # Incrementar al cambiar el diseño del ticket: invalida los tickets en cache
+    VERSION_PLANTILLA = 1
+    CLAVES_CONFIGURACION = ('nombre_negocio', 'direccion', 'telefono', 'mensaje_ticket')
+    
+    def __init__(self, configuracion_fija: dict = None):
+        self.width = 80 * mm  # Ancho de ticket térmico estándar (80mm)
+        self.height = 280 * mm  # Alto flexible
+        # Valores ya leídos (p. ej. en el proceso de renderizado, que no consulta la BD)
+        self.configuracion_fija = configuracion_fija
         
-        # Encabezado
-        nombre_negocio = self.get_configuracion('nombre_negocio', 'Mi Chas-K')
-        story.append(Paragraph(f"<b>{nombre_negocio}</b>", style_titulo))
+    def get_configuracion(self, clave: str, default: str = "") -> str:
+        """Obtiene un valor de configuración (desde la cache del servicio de configuración)"""
+        if self.configuracion_fija is not None:
+            return self.configuracion_fija.get(clave, default)
+        return configuracion.get(clave, default)
+    
+    def configuracion_ticket(self) -> dict:
+        """Valores de configuración que usa el ticket, para generarlo en otro proceso"""
+        config = configuracion.get_todas()
+        return {clave: config[clave] for clave in self.CLAVES_CONFIGURACION if clave in config}
+    
+    def clave_cache(self, venta_data: dict, detalle_rows: list) -> str:
+        """Clave de cache del ticket: venta, detalle, plantilla y configuración usada"""
+        config = configuracion.get_todas()
+        return ticket_cache.calcular_clave(
+            self.VERSION_PLANTILLA,
+            {clave: config.get(clave) for clave in self.CLAVES_CONFIGURACION},
+            venta_data,
+            detalle_rows
+        )
+    
+    @request_timing.medido('pdf')
+    def generar_ticket_memoria(self, venta_data: dict, detalle_rows: list) -> bytes:
+        """Genera un ticket PDF en memoria optimizado para impresoras térmicas genéricas"""
+        buffer = io.BytesIO()
         
-        direccion = self.get_configuracion('direccion', 'Aguascalientes, Ags.')
-        story.append(Paragraph(direccion, style_subtitulo))
+        doc = SimpleDocTemplate(
+            buffer,
+            pagesize=(self.width, self.height),
+            leftMargin=3*mm,
+            rightMargin=3*mm,
+            topMargin=3*mm,
+            bottomMargin=3*mm,
+            invariant=1  # sin fecha de creación ni ID aleatorio: mismos datos, mismos bytes
+        )
         
-        telefono = self.get_configuracion('telefono', '')
-        if telefono:
-            story.append(Paragraph(f"Tel: {telefono}", style_subtitulo))
+        estilos = _estilos_ticket()
+        fijos = _flowables_fijos(
+            self.get_configuracion('nombre_negocio', 'Mi Chas-K'),
+            self.get_configuracion('direccion', 'Aguascalientes, Ags.'),
+            self.get_configuracion('telefono', ''),
+            self.get_configuracion('mensaje_ticket', '¡Gracias por tu compra!')
+        )
         
-        story.append(Spacer(1, 2*mm))
-        story.append(Paragraph("=" * 40, style_normal))
-        story.append(Spacer(1, 2*mm))
+        # Encabezado
+        story = _copias(fijos['encabezado'])
         
         # Información de la venta
         venta_id = venta_data.get('id', 0)
-        story.append(Paragraph(f"<b>TICKET #{venta_id}</b>", style_normal))
+        story.append(Paragraph(f"<b>TICKET #{venta_id}</b>", estilos['normal']))
         
-        # Formatear fecha
-        fecha_venta = venta_data.get('fecha')
-        if isinstance(fecha_venta, str):
-            try:
-                fecha_obj = datetime.fromisoformat(fecha_venta.replace('Z', '+00:00'))
-                fecha_str = fecha_obj.strftime('%d/%m/%Y %H:%M')
-            except:
-                fecha_str = fecha_venta[:16] if len(fecha_venta) >= 16 else fecha_venta
-        else:
-            fecha_str = format_mexico_datetime(get_mexico_datetime())
-        
-        story.append(Paragraph(f"Fecha: {fecha_str}", style_normal))
+        fecha_str = formatear_fecha_ticket(venta_data.get('fecha'))
+        story.append(Paragraph(f"Fecha: {fecha_str}", estilos['normal']))
         
         metodo_pago = venta_data.get('metodo_pago', 'Efectivo')
-        story.append(Paragraph(f"Pago: {metodo_pago}", style_normal))
+        story.append(Paragraph(f"Pago: {metodo_pago}", estilos['normal']))
         
         # Extraer info del vendedor de notas si existe
-        notas = venta_data.get('notas', '')
-        if notas and 'Vendedor:' in notas:
-            vendedor_parte = notas.split('|')[0].replace('Vendedor:', '').strip()
-            story.append(Paragraph(f"Atiende: {vendedor_parte}", style_normal))
+        vendedor_parte = vendedor_de_notas(venta_data.get('notas', ''))
+        if vendedor_parte:
+            story.append(Paragraph(f"Atiende: {vendedor_parte}", estilos['normal']))
         
-        story.append(Spacer(1, 2*mm))
-        story.append(Paragraph("-" * 40, style_normal))
-        story.append(Spacer(1, 1*mm))
+        story.extend(_copias(fijos['antes_tabla']))
         
         # Tabla de productos
         data = [['Producto', 'Cant', 'P.U.', 'Total']]
@@ -147,31 +232,17 @@ class TicketGenerator:
         
         # Crear tabla compacta
         table = Table(data, colWidths=[36*mm, 10*mm, 12*mm, 14*mm])
-        table.setStyle(TableStyle([
-            ('FONTSIZE', (0, 0), (-1, -1), 7),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
-            ('TOPPADDING', (0, 0), (-1, -1), 1),
-            ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.black),
-        ]))
+        table.setStyle(TABLA_TICKET_STYLE)
         
         story.append(table)
-        story.append(Spacer(1, 2*mm))
-        story.append(Paragraph("=" * 40, style_normal))
-        story.append(Spacer(1, 2*mm))
+        story.extend(_copias(fijos['despues_tabla']))
         
         # Total
         total_venta = float(venta_data.get('total', total_general))
-        story.append(Paragraph(f"<b>TOTAL: ${total_venta:.2f}</b>", style_total))
-        
-        story.append(Spacer(1, 3*mm))
-        story.append(Paragraph("-" * 40, style_normal))
+        story.append(Paragraph(f"<b>TOTAL: ${total_venta:.2f}</b>", estilos['total']))
         
-        # Mensaje de agradecimiento
-        mensaje = self.get_configuracion('mensaje_ticket', '¡Gracias por tu compra!')
-        story.append(Paragraph(f"<b>{mensaje}</b>", style_subtitulo))
+        # Separador y mensaje de agradecimiento
+        story.extend(_copias(fijos['pie']))
         
         # Construir PDF
         doc.build(story)
@@ -181,3 +252,8 @@ class TicketGenerator:
         buffer.close()
         
         return pdf_bytes
+
+
+def renderizar_ticket(venta_data: dict, detalle_rows: list, configuracion_fija: dict) -> bytes:
+    """Punto de entrada para el servicio de renderizado (utils.render_service)"""
+    return TicketGenerator(configuracion_fija).generar_ticket_memoria(venta_data, detalle_rows)
@@ -12,6 +12,7 @@ from utils.timezone_utils import get_mexico_datetime, format_mexico_datetime
 import os
 import io
 from database.connection_dual import execute_query
+from database.models import Venta
 
 class TicketGenerator:
     def __init__(self):
@@ -803,3 +804,8 @@ Diferencia = Sistema - Caja
         buffer.close()
         
         return pdf_bytes
+
+
+def renderizar_reporte_diario(fecha: str) -> bytes:
+    """Punto de entrada para el servicio de renderizado (utils.render_service)"""
+    return ReporteGenerator().generar_reporte_diario(fecha)
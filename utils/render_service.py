@@ -0,0 +1,293 @@
+"""
+Servicio de renderizado de documentos (PDF) fuera del worker web
+ReportLab es CPU puro: un reporte o una ráfaga de reimpresiones en un worker sync
+de gunicorn lo deja ocupado y POST /api/ventas espera. Este servicio:
+
+- Ejecuta cada trabajo en un ProcessPoolExecutor (contexto spawn: los hijos no
+  heredan las conexiones del pool de PostgreSQL del worker)
+- Limita los trabajos simultáneos entre TODOS los workers con cupos en disco
+  (flock no bloqueante sobre RENDER_DIR/cupo_<n>.lock). Con RENDER_CUPOS menor que
+  el número de workers de gunicorn siempre queda un worker libre para vender.
+- Acota la cola local (RENDER_MAX_PENDIENTES) y el tiempo esperando cupo (RENDER_ESPERA_MAX)
+- Aplica un timeout por trabajo (RENDER_TIMEOUT) dentro del proceso hijo
+
+Si no hay cupo se lanza ServicioSaturado (503 + Retry-After en la API).
+Las exportaciones largas (ZIP de tickets) toman además un cupo exclusivo con
+`tomar_cupo_exclusivo`: una sola a la vez entre todos los workers, sin esperar.
+Con RENDER_PROCESOS=0 el trabajo corre en el mismo proceso, pero con los mismos cupos.
+"""
+import fcntl
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RENDER_PROCESOS = int(os.getenv('RENDER_PROCESOS', '1'))
+RENDER_CUPOS = max(1, int(os.getenv('RENDER_CUPOS', '1')))
+RENDER_MAX_PENDIENTES = max(1, int(os.getenv('RENDER_MAX_PENDIENTES', '4')))
+RENDER_ESPERA_MAX = float(os.getenv('RENDER_ESPERA_MAX', '2'))  # segundos esperando cupo
+RENDER_TIMEOUT = float(os.getenv('RENDER_TIMEOUT', '30'))  # segundos por trabajo
+RENDER_DIR = os.getenv('RENDER_DIR') or os.path.join(tempfile.gettempdir(), 'michaska_render')
+
+MARGEN_TIMEOUT = 5  # segundos extra antes de dar por colgado al proceso hijo
+
+_state = {
+    'lock': threading.Lock(),
+    'pool': None,
+    'pid': None,
+    'pendientes': threading.BoundedSemaphore(RENDER_MAX_PENDIENTES),
+    'en_espera': 0,
+    'en_curso': 0,
+    'stats': {'ok': 0, 'rechazados': 0, 'timeouts': 0, 'errores': 0}
+}
+
+
+class ServicioSaturado(Exception):
+    """No hay cupo para renderizar: reintentar más tarde"""
+
+    def __init__(self, mensaje: str, reintentar_en: int = 2):
+        super().__init__(mensaje)
+        self.reintentar_en = reintentar_en
+
+
+class RenderTimeout(Exception):
+    """El trabajo excedió RENDER_TIMEOUT"""
+
+
+# ============================================================================
+# Proceso hijo
+# ============================================================================
+
+def _alarma(signum, frame):
+    raise TimeoutError("Renderizado excedió el tiempo límite")
+
+
+def _ejecutar_con_limite(func: Callable[..., Any], args: tuple, kwargs: dict, timeout: float):
+    """Corre en el proceso hijo: interrumpe el trabajo con SIGALRM al vencer el timeout"""
+    anterior = signal.signal(signal.SIGALRM, _alarma)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, anterior)
+
+
+# ============================================================================
+# Pool y cupos (proceso web)
+# ============================================================================
+
+def _pool() -> ProcessPoolExecutor:
+    """Pool del proceso actual; se crea al primer uso (después del fork de gunicorn)"""
+    with _state['lock']:
+        if _state['pool'] is None or _state['pid'] != os.getpid():
+            _state['pool'] = ProcessPoolExecutor(
+                max_workers=RENDER_PROCESOS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _state['pid'] = os.getpid()
+            logger.info(f"🖨️ Pool de renderizado iniciado: {RENDER_PROCESOS} proceso(s)")
+        return _state['pool']
+
+
+def _reiniciar_pool():
+    """Descarta un pool con un hijo colgado o muerto; el siguiente trabajo crea otro"""
+    with _state['lock']:
+        pool, _state['pool'] = _state['pool'], None
+    if pool is None:
+        return
+    for proceso in list(getattr(pool, '_processes', {}).values()):
+        proceso.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+    logger.warning("⚠️ Pool de renderizado reiniciado")
+
+
+def _tomar_cupo() -> Optional[Any]:
+    """Archivo con flock de un cupo libre, o None si todos están ocupados"""
+    os.makedirs(RENDER_DIR, exist_ok=True)
+    for n in range(RENDER_CUPOS):
+        archivo = open(os.path.join(RENDER_DIR, f'cupo_{n}.lock'), 'w')
+        try:
+            fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return archivo
+        except BlockingIOError:
+            archivo.close()
+    return None
+
+
+def tomar_cupo_exclusivo(nombre: str):
+    """
+    Archivo con flock de RENDER_DIR/<nombre>.lock para una tarea que debe correr una
+    sola vez a la vez entre todos los workers. No espera: lanza ServicioSaturado si
+    otro worker ya lo tiene. Se libera al cerrar el archivo.
+    """
+    os.makedirs(RENDER_DIR, exist_ok=True)
+    archivo = open(os.path.join(RENDER_DIR, f'{nombre}.lock'), 'w')
+    try:
+        fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        archivo.close()
+        _rechazar(f"{nombre} ya en curso")
+    return archivo
+
+
+def _esperar_cupo(espera_max: float):
+    limite = time.monotonic() + espera_max
+    while True:
+        archivo = _tomar_cupo()
+        if archivo is not None or time.monotonic() >= limite:
+            return archivo
+        time.sleep(0.05)
+
+
+def _contar(resultado: str):
+    with _state['lock']:
+        _state['stats'][resultado] += 1
+
+
+def _rechazar(motivo: str):
+    _contar('rechazados')
+    logger.warning(f"⏳ Renderizado rechazado: {motivo}")
+    raise ServicioSaturado(motivo, reintentar_en=max(1, int(RENDER_ESPERA_MAX)))
+
+
+@contextmanager
+def _admision(espera_max: float):
+    """Reserva un lugar en la cola local y un cupo global, o lanza ServicioSaturado"""
+    if not _state['pendientes'].acquire(blocking=False):
+        _rechazar(f"cola local llena ({RENDER_MAX_PENDIENTES} pendientes)")
+    try:
+        with _state['lock']:
+            _state['en_espera'] += 1
+        try:
+            cupo = _esperar_cupo(espera_max)
+        finally:
+            with _state['lock']:
+                _state['en_espera'] -= 1
+        if cupo is None:
+            _rechazar(f"{RENDER_CUPOS} cupo(s) ocupados por más de {espera_max:.0f}s")
+
+        with _state['lock']:
+            _state['en_curso'] += 1
+        try:
+            yield
+        finally:
+            with _state['lock']:
+                _state['en_curso'] -= 1
+            cupo.close()  # libera el flock
+    finally:
+        _state['pendientes'].release()
+
+
+def ejecutar(func: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """
+    Ejecuta `func(*args, **kwargs)` en el pool de renderizado y retorna su resultado.
+    `func` y sus argumentos deben poder serializarse con pickle (funciones de módulo).
+
+    Lanza ServicioSaturado si no hay cupo y RenderTimeout si el trabajo tarda demasiado.
+    """
+    timeout = RENDER_TIMEOUT if timeout is None else timeout
+    with _admision(RENDER_ESPERA_MAX):
+        if RENDER_PROCESOS <= 0:
+            return _resolver_local(func, args, kwargs)
+        return _resolver(_enviar(func, args, kwargs, timeout), timeout)
+
+
+def ejecutar_lote(func: Callable[..., Any], trabajos: List[tuple], timeout: Optional[float] = None,
+                  espera_max: Optional[float] = None) -> List[Any]:
+    """
+    Ejecuta `func(*args)` para cada tupla de `trabajos`, repartidos entre los procesos
+    del pool pero ocupando un solo cupo. Retorna, en el mismo orden, el resultado de
+    cada trabajo o la excepción con la que falló (un trabajo fallido no aborta el lote).
+    """
+    timeout = RENDER_TIMEOUT if timeout is None else timeout
+    espera_max = RENDER_ESPERA_MAX if espera_max is None else espera_max
+    resultados: List[Any] = []
+    with _admision(espera_max):
+        if RENDER_PROCESOS <= 0:
+            for args in trabajos:
+                try:
+                    resultados.append(_resolver_local(func, args, {}))
+                except Exception as e:
+                    resultados.append(e)
+            return resultados
+
+        futuros = [_enviar(func, args, {}, timeout) for args in trabajos]
+        for futuro in futuros:
+            try:
+                resultados.append(_resolver(futuro, timeout))
+            except Exception as e:
+                resultados.append(e)
+                if not futuro.done() or isinstance(e, BrokenProcessPool):
+                    # El pool se reinició: el resto de los futuros del lote ya no terminarán
+                    resultados.extend([e] * (len(futuros) - len(resultados)))
+                    break
+    return resultados
+
+
+def _enviar(func, args, kwargs, timeout: float):
+    try:
+        return _pool().submit(_ejecutar_con_limite, func, args, kwargs, timeout)
+    except BrokenProcessPool:
+        _contar('errores')
+        _reiniciar_pool()
+        raise
+
+
+def _resolver_local(func, args, kwargs):
+    try:
+        resultado = func(*args, **kwargs)
+    except Exception:
+        _contar('errores')
+        raise
+    _contar('ok')
+    return resultado
+
+
+def _resolver(futuro, timeout: float):
+    """Resultado de un trabajo del pool, con los mismos contadores y errores que `ejecutar`"""
+    try:
+        resultado = futuro.result(timeout=timeout + MARGEN_TIMEOUT)
+    except TimeoutError as e:
+        # SIGALRM en el hijo, o el hijo no respondió a tiempo (futuro sin terminar)
+        _contar('timeouts')
+        if not futuro.done():
+            _reiniciar_pool()
+        raise RenderTimeout(f"El documento tardó más de {timeout:.0f}s en generarse") from e
+    except BrokenProcessPool:
+        _contar('errores')
+        _reiniciar_pool()
+        raise
+    except Exception:
+        _contar('errores')
+        raise
+    _contar('ok')
+    return resultado
+
+
+def get_stats() -> Dict[str, int]:
+    """Trabajos por resultado, en curso y en espera en este worker"""
+    with _state['lock']:
+        return {
+            **_state['stats'],
+            'en_curso': _state['en_curso'],
+            'en_espera': _state['en_espera'],
+            'cupos': RENDER_CUPOS
+        }
+
+
+def cerrar():
+    """Detiene el pool de este proceso (al terminar el worker)"""
+    with _state['lock']:
+        pool, _state['pool'] = _state['pool'], None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,104 @@
+"""
+Temporizador por request para los headers Server-Timing y X-Query-Count
+
+Con SERVER_TIMING_SAMPLE_RATE (0 a 1) se elige qué fracción de requests se mide;
+con 0 (default) solo se consulta un atributo de flask.g por medición.
+
+Categorías:
+- total: duración completa del request
+- db: tiempo en sentencias SQL (reportado por connection_dual vía query_stats)
+- serialization: generación de JSON (proveedor JSON de la app)
+- pdf: generación de tickets (TicketGenerator)
+"""
+import os
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict
+
+from flask import g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+from database import query_stats
+
+SAMPLE_RATE = float(os.getenv('SERVER_TIMING_SAMPLE_RATE', '0'))
+
+
+def _temporizador():
+    """Tiempos del request actual, o None si no se está midiendo"""
+    if not has_request_context():
+        return None
+    return g.get('temporizador')
+
+
+def agregar(categoria: str, segundos: float):
+    """Suma `segundos` a una categoría del request actual (si se está midiendo)"""
+    tiempos = _temporizador()
+    if tiempos is not None:
+        tiempos[categoria] = tiempos.get(categoria, 0.0) + segundos
+
+
+@contextmanager
+def medir(categoria: str):
+    """Mide un bloque dentro de una categoría: `with medir('pdf'): ...`"""
+    tiempos = _temporizador()
+    if tiempos is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tiempos[categoria] = tiempos.get(categoria, 0.0) + time.perf_counter() - inicio
+
+
+def medido(categoria: str):
+    """Decorador equivalente a `medir` para una función completa"""
+    def decorador(func):
+        @wraps(func)
+        def envoltura(*args, **kwargs):
+            with medir(categoria):
+                return func(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+class JSONProviderMedido(DefaultJSONProvider):
+    """Proveedor JSON que reporta el tiempo de serialización"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        with medir('serialization'):
+            return super().dumps(obj, **kwargs)
+
+
+def _server_timing(tiempos: Dict[str, float], total: float) -> str:
+    partes = [f'total;dur={total * 1000:.1f}']
+    for categoria in ('db', 'serialization', 'pdf'):
+        if categoria in tiempos:
+            partes.append(f'{categoria};dur={tiempos[categoria] * 1000:.1f}')
+    return ', '.join(partes)
+
+
+def init_app(app, prefijo: str = '/api/'):
+    """Agrega Server-Timing y X-Query-Count a las respuestas de la API muestreadas"""
+    app.json = JSONProviderMedido(app)
+
+    @app.before_request
+    def _timing_inicio():
+        if SAMPLE_RATE > 0 and request.path.startswith(prefijo) and \
+                (SAMPLE_RATE >= 1 or random.random() < SAMPLE_RATE):
+            g.temporizador = {}
+            g.temporizador_inicio = time.perf_counter()
+
+    @app.after_request
+    def _timing_headers(response):
+        tiempos = g.get('temporizador')
+        if tiempos is None:
+            return response
+        total = time.perf_counter() - g.temporizador_inicio
+        totales = query_stats.totales_request()
+        tiempos['db'] = totales['db_ms'] / 1000
+        response.headers['Server-Timing'] = _server_timing(tiempos, total)
+        response.headers['X-Query-Count'] = str(totales['consultas'])
+        return response
@@ -0,0 +1,182 @@
+"""
+Cache de tickets PDF en dos niveles
+- Memoria: LRU por worker con presupuesto en bytes (TICKET_CACHE_MEMORIA_MB)
+- Disco: almacén direccionado por contenido compartido entre workers (TICKET_CACHE_DIR)
+    blobs/<aa>/<sha256>.pdf   bytes del PDF, nombrados por su hash
+    claves/<aa>/<clave>       hash del PDF generado para una clave
+
+La clave resume todo lo que afecta al ticket (datos de la venta y su detalle,
+versión de la plantilla y configuración usada), así que una venta editada o
+cancelada, o un cambio de plantilla/configuración, produce otra clave y el
+ticket anterior simplemente deja de usarse. El hash del PDF es el ETag.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TICKET_CACHE_DIR = os.getenv('TICKET_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'michaska_tickets')
+MEMORIA_MAX_BYTES = int(float(os.getenv('TICKET_CACHE_MEMORIA_MB', '16')) * 1024 * 1024)
+DISCO_MAX_BYTES = int(float(os.getenv('TICKET_CACHE_DISCO_MB', '256')) * 1024 * 1024)
+PODAR_CADA = 100  # escrituras entre revisiones del tamaño en disco
+
+_memoria = {
+    'entradas': OrderedDict(),  # clave -> (etag, bytes)
+    'bytes': 0,
+    'escrituras': 0,
+    'stats': {'memoria': 0, 'disco': 0, 'fallos': 0},
+    'lock': threading.Lock()
+}
+
+
+def calcular_clave(*partes: Any) -> str:
+    """Hash estable de los datos que determinan el contenido del ticket"""
+    canonico = json.dumps(partes, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+
+
+def _ruta_clave(clave: str) -> str:
+    return os.path.join(TICKET_CACHE_DIR, 'claves', clave[:2], clave)
+
+
+def _ruta_blob(etag: str) -> str:
+    return os.path.join(TICKET_CACHE_DIR, 'blobs', etag[:2], f'{etag}.pdf')
+
+
+def _escribir_atomico(ruta: str, datos: bytes):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), prefix='.tmp_')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(datos)
+    os.replace(tmp, ruta)
+
+
+def _memoria_guardar(clave: str, etag: str, datos: bytes):
+    if len(datos) > MEMORIA_MAX_BYTES:
+        return
+    with _memoria['lock']:
+        entradas = _memoria['entradas']
+        anterior = entradas.pop(clave, None)
+        if anterior is not None:
+            _memoria['bytes'] -= len(anterior[1])
+        entradas[clave] = (etag, datos)
+        _memoria['bytes'] += len(datos)
+        while _memoria['bytes'] > MEMORIA_MAX_BYTES and entradas:
+            _, (_, expulsado) = entradas.popitem(last=False)
+            _memoria['bytes'] -= len(expulsado)
+
+
+def etag(clave: str) -> Optional[str]:
+    """ETag del ticket de una clave sin leer el PDF (None si no está en cache)"""
+    with _memoria['lock']:
+        entrada = _memoria['entradas'].get(clave)
+    if entrada is not None:
+        return entrada[0]
+    try:
+        with open(_ruta_clave(clave)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def obtener(clave: str) -> Optional[Tuple[str, bytes]]:
+    """(etag, bytes) del ticket desde memoria o disco"""
+    with _memoria['lock']:
+        entrada = _memoria['entradas'].get(clave)
+        if entrada is not None:
+            _memoria['entradas'].move_to_end(clave)
+            _memoria['stats']['memoria'] += 1
+            return entrada
+
+    etag_disco = etag(clave)
+    if etag_disco:
+        try:
+            with open(_ruta_blob(etag_disco), 'rb') as f:
+                datos = f.read()
+        except OSError:
+            datos = None
+        if datos is not None and hashlib.sha256(datos).hexdigest() == etag_disco:
+            _memoria_guardar(clave, etag_disco, datos)
+            with _memoria['lock']:
+                _memoria['stats']['disco'] += 1
+            return etag_disco, datos
+
+    with _memoria['lock']:
+        _memoria['stats']['fallos'] += 1
+    return None
+
+
+def guardar(clave: str, datos: bytes) -> str:
+    """Guarda un ticket en ambos niveles y retorna su ETag (sha256 del contenido)"""
+    etag_nuevo = hashlib.sha256(datos).hexdigest()
+    _memoria_guardar(clave, etag_nuevo, datos)
+    try:
+        ruta_blob = _ruta_blob(etag_nuevo)
+        if not os.path.exists(ruta_blob):
+            _escribir_atomico(ruta_blob, datos)
+        _escribir_atomico(_ruta_clave(clave), etag_nuevo.encode())
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudo guardar el ticket en disco ({TICKET_CACHE_DIR}): {e}")
+        return etag_nuevo
+
+    with _memoria['lock']:
+        _memoria['escrituras'] += 1
+        podar = _memoria['escrituras'] % PODAR_CADA == 0
+    if podar:
+        podar_disco()
+    return etag_nuevo
+
+
+def obtener_o_generar(clave: str, generar: Callable[[], bytes]) -> Tuple[str, bytes]:
+    """(etag, bytes) desde la cache, generando y guardando el ticket si no existe"""
+    entrada = obtener(clave)
+    if entrada is not None:
+        return entrada
+    datos = generar()
+    return guardar(clave, datos), datos
+
+
+def podar_disco(max_bytes: Optional[int] = None):
+    """Borra los blobs y claves más antiguos hasta quedar dentro del presupuesto en disco"""
+    max_bytes = DISCO_MAX_BYTES if max_bytes is None else max_bytes
+    archivos = []
+    total = 0
+    for sub in ('blobs', 'claves'):
+        raiz = os.path.join(TICKET_CACHE_DIR, sub)
+        for carpeta, _, nombres in os.walk(raiz):
+            for nombre in nombres:
+                ruta = os.path.join(carpeta, nombre)
+                try:
+                    info = os.stat(ruta)
+                except OSError:
+                    continue
+                archivos.append((info.st_mtime, info.st_size, ruta))
+                total += info.st_size
+    if total <= max_bytes:
+        return
+    # Una clave cuyo blob se borró se trata como fallo y el ticket se regenera
+    for _, tamano, ruta in sorted(archivos):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(ruta)
+            total -= tamano
+        except OSError:
+            pass
+    logger.info(f"🧹 Cache de tickets en disco podada a {total / 1024 / 1024:.1f} MB")
+
+
+def get_cache_stats() -> Dict[str, int]:
+    """Aciertos por nivel, fallos y uso de memoria de este worker"""
+    with _memoria['lock']:
+        return {
+            **_memoria['stats'],
+            'entradas': len(_memoria['entradas']),
+            'bytes': _memoria['bytes']
+        }
@@ -2,9 +2,9 @@
 Utilidades para manejo de zona horaria México (UTC-6)
 VERSIÓN DEFINITIVA - Offset fijo calculado UNA VEZ, sin servicios externos
 """
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, time as dt_time, timezone, timedelta
 import pytz
-from typing import Optional
+from typing import Optional, Tuple, Union
 import logging
 
 # Configurar logging
@@ -103,6 +103,33 @@ def get_mexico_date_str(dt: Optional[datetime] = None) -> str:
         mexico_time = dt_utc + timedelta(hours=offset_hours)
         return mexico_time.strftime("%Y-%m-%d")
 
+def to_date(value: Union[str, date, datetime]) -> date:
+    """Convierte 'YYYY-MM-DD', date o datetime a date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+def get_mexico_date_range(fecha_inicio: Union[str, date, datetime],
+                          fecha_fin: Union[str, date, datetime, None] = None) -> Tuple[datetime, datetime]:
+    """
+    Convierte fechas de calendario de México en un rango semiabierto [inicio, fin)
+    para filtrar con `fecha >= %s AND fecha < %s` (aprovecha el índice sobre fecha,
+    a diferencia de DATE(fecha) BETWEEN ...).
+    Las fechas de venta se guardan como hora local de México sin timezone.
+    """
+    inicio = to_date(fecha_inicio)
+    fin = to_date(fecha_fin) if fecha_fin is not None else inicio
+    return (
+        datetime.combine(inicio, dt_time.min),
+        datetime.combine(fin + timedelta(days=1), dt_time.min)
+    )
+
+def get_mexico_today_range() -> Tuple[datetime, datetime]:
+    """Rango semiabierto [hoy 00:00, mañana 00:00) en hora de México"""
+    return get_mexico_date_range(get_mexico_datetime().date())
+
 def get_mexico_time_str(dt: Optional[datetime] = None) -> str:
     """
     Obtiene la hora en formato HH:MM:SS en zona horaria de México
@@ -0,0 +1,50 @@
+"""
+ZIP generado al vuelo para respuestas en streaming
+zipfile escribe sobre un destino sin seek (usa data descriptors), así que cada archivo
+agregado se puede enviar al cliente de inmediato y la memoria no crece con el ZIP.
+
+    zip_stream = ZipEnStream()
+    for nombre, datos in archivos:
+        yield zip_stream.agregar(nombre, datos)
+    yield zip_stream.cerrar()
+"""
+import time
+import zipfile
+
+
+class _Salida:
+    """Destino de solo escritura (sin tell/seek) que acumula lo escrito hasta vaciarlo"""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos: bytes) -> int:
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self) -> bytes:
+        datos = b''.join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+class ZipEnStream:
+    def __init__(self, compresion: int = zipfile.ZIP_STORED):
+        # Los PDF ya van comprimidos: ZIP_STORED evita gastar CPU en comprimirlos otra vez
+        self._salida = _Salida()
+        self._zip = zipfile.ZipFile(self._salida, mode='w', compression=compresion)
+
+    def agregar(self, nombre: str, datos: bytes, fecha: tuple = None) -> bytes:
+        """Agrega un archivo y retorna los bytes del ZIP listos para enviar"""
+        info = zipfile.ZipInfo(nombre, date_time=fecha or time.localtime()[:6])
+        info.compress_type = self._zip.compression
+        self._zip.writestr(info, datos)
+        return self._salida.vaciar()
+
+    def cerrar(self) -> bytes:
+        """Escribe el directorio central y retorna los últimos bytes del ZIP"""
+        self._zip.close()
+        return self._salida.vaciar()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Verifica con EXPLAIN que los filtros por fecha de ventas usan el índice idx_ventas_fecha
+Funciona con PostgreSQL (producción) y SQLite (desarrollo)
+"""
+import sys
+from database.connection_dual import explain_query, get_db_type
+from utils.timezone_utils import get_mexico_date_range, get_mexico_today_range
+
+INDICE_FECHA = 'idx_ventas_fecha'
+
+def consultas_a_verificar():
+    """
+    Consultas vigentes que filtran ventas por rango de fechas.
+    Las estadísticas leen de ventas_diarias/ventas_producto_diarias y ya no pasan por aquí.
+    """
+    rango = get_mexico_date_range('2024-01-01', '2024-01-31')
+    return [
+        ("Venta.get_by_fecha",
+         "SELECT * FROM ventas WHERE fecha >= %s AND fecha < %s ORDER BY fecha DESC", rango),
+        ("Venta.get_ventas_hoy",
+         "SELECT * FROM ventas WHERE fecha >= %s AND fecha < %s ORDER BY fecha DESC", get_mexico_today_range()),
+        ("/api/ventas/export",
+         "SELECT * FROM ventas WHERE fecha >= %s AND fecha < %s ORDER BY id", rango),
+        ("/api/tickets/export",
+         "SELECT * FROM ventas WHERE fecha >= %s AND fecha < %s AND id > %s ORDER BY id LIMIT %s",
+         (*rango, 0, 50)),
+        ("/api/entregas?fecha=",
+         """SELECT e.*, v.total, v.fecha, v.notas
+            FROM entregas e
+            JOIN ventas v ON e.venta_id = v.id
+            WHERE v.fecha >= %s AND v.fecha < %s
+            ORDER BY v.fecha DESC""", get_mexico_date_range('2024-01-15')),
+    ]
+
+def verificar_indices() -> bool:
+    """Imprime el plan de cada consulta y retorna True si todas usan el índice"""
+    print(f"🔍 Verificando uso de {INDICE_FECHA} ({get_db_type().upper()})\n")
+    todas_ok = True
+    
+    for nombre, query, params in consultas_a_verificar():
+        plan = explain_query(query, params, forzar_indices=True)
+        usa_indice = any(INDICE_FECHA in linea for linea in plan)
+        todas_ok = todas_ok and usa_indice
+        
+        print(f"{'✅' if usa_indice else '❌'} {nombre}")
+        for linea in plan:
+            print(f"      {linea}")
+        print()
+    
+    if todas_ok:
+        print("✨ Todos los filtros por fecha usan el índice")
+    else:
+        print("⚠️ Hay consultas que no usan el índice; revisar el filtro o crear el índice")
+    return todas_ok
+
+if __name__ == '__main__':
+    sys.exit(0 if verificar_indices() else 1)